@@ -8,19 +8,53 @@
 4. 右键功能菜单
 """
 
+from time import monotonic, perf_counter, sleep
 from zlib import decompress
-from threading import Thread
+from queue import Queue, Empty, Full
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event
 from tkinter import Tk, Menu, Label
-from socket import socket, AF_INET, SOCK_DGRAM
+from socket import socket, timeout, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+import numpy as np
 import pyaudio
-from PIL.Image import frombytes
+from PIL.Image import fromarray
 from PIL.ImageTk import PhotoImage
+from video_codec import apply_tiles, apply_zdict_tiles, zdict_reference, get_codec
+from av_codec import AV_AVAILABLE, STREAM_CODECS, StreamDecoder
+from protocol import (HEADER, FLAG_DELTA, FLAG_KEYFRAME, FLAG_STRIPED, FLAG_PARITY, FLAG_ZDICT, FLAG_HEARTBEAT,
+                      FLAG_SLICED, FLAG_PROGRESSIVE, FLAG_REFINEMENT, FLAG_CLOSE, SEQ_MOD, parse_header,
+                      PARTIAL_TIMEOUT, FrameReassembler)
+from simulcast import LAYER_TIMEOUT, LayerDirectory, make_stream_id, region_of  # 多分辨率同播层选择
+from parallel import decode_stripes  # 条带帧并行解码
+from slicing import decode_slices  # 切片帧解码与错误隐藏
+from progressive import ProgressiveCanvas  # 渐进帧逐层细化
+from pipeline import LatestMailbox  # 最新帧邮箱
+from retransmit import (FEEDBACK_PORT, NACK_DELAY, KEYFRAME_REQUEST_INTERVAL, due_nacks,
+                        pack_nack, pack_keyframe_request, pack_report)
+from report import REPORT_INTERVAL  # 接收质量报告周期
+from audio_codec import unpack_audio, Resampler  # 音频解码与重采样
+from jitter import JitterBuffer  # 音频抖动缓冲
+from avsync import AVSync  # 音画同步
+from ringbuffer import RingBuffer  # 音频播放环形缓冲区
 
 # 音频参数（必须与发送端一致）
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
 RATE = 44100
 AUDIO_CHUNK = 1024
+AUDIO_FRAMES_PER_BUFFER = 256  # 声卡回调每次取走的样本帧数（越小输出延迟越低，回调越频繁）
+AUDIO_RING_SECONDS = 0.5  # 播放环形缓冲区容量（秒）
+PLAYOUT_QUEUE = AUDIO_CHUNK  # 播放线程在环形缓冲区中保持的待播样本帧数（低于此值时从抖动缓冲补充下一块）
+
+REGION = 0  # 订阅的采集区域序号（发送端CAPTURE_REGIONS中的位置）
+STREAM_ID = 0  # 订阅的层序号（自动选层时为初始订阅层）
+AUTO_LAYER = True  # 发送端同播多层时，自动订阅能覆盖窗口尺寸的最小一层（窗口缩放时切换）
+RETRANSMIT_ENABLED = True  # 可靠模式：丢失分块时向发送端单播NACK请求重传
+STREAM_QUEUE_SIZE = 8  # 帧间解码队列长度（解码跟不上时清空队列并请求关键帧）
+DECODE_WORKERS = 4  # 条带帧并行解码线程数
+RECV_BUFFER_SIZE = 4 * 1024 * 1024  # 视频socket内核接收缓冲区（MTU小包数量多，默认缓冲区容易溢出）
+AV_SYNC_ENABLED = True  # 音画同步：按采集时间把视频帧对齐到音频播放时钟（没有音频时不生效）
+AV_SYNC_TOLERANCE = 0.04  # 音画偏差容差（秒）：视频早于音频超过容差时等待，晚于音频超过容差时跳帧
 
 
 class ReceiverApp:
@@ -31,6 +65,36 @@ class ReceiverApp:
         self.root.title('屏幕广播接收端-v1.6')
         self.root.geometry('800x600+0+0')
         self.receiving = True  # 接收状态控制
+        self.framebuffer = None  # 持久帧缓冲区（H x W x 3），差分帧在此基础上修补（仅解码线程读写）
+        self.reference = None  # 最近一个完整帧(帧号, 画面)，预置字典差分帧的参考（与帧缓冲区写时复制）
+        self.canvas = None  # 正在细化的渐进帧画面（仅解码线程读写）
+        self.last_applied = None  # 最近写入帧缓冲区的帧号（差分帧只能修补紧接其后的一帧，仅解码线程读写）
+        self.frames_dropped_seen = 0  # 已处理过的重组器作废帧数（有新的作废帧时请求关键帧）
+        self.mailbox = LatestMailbox(self.discard_frame)  # 最新帧邮箱（网络线程/帧间解码线程放入，解码线程取出）
+        self.frames_decoded = 0  # 已解码帧数
+        self.frames_rendered = 0  # 已显示次数（多帧合并显示一次）
+        self.frames_concealed = 0  # 有切片丢失、用上一帧隐藏后显示的帧数
+        # 接收质量统计（定期单播报告给发送端）
+        self.decode_time = 0.0  # 单帧解码耗时（秒，滑动平均）
+        self.arrival_interval = None  # 帧到达间隔（秒，滑动平均）
+        self.jitter = 0.0  # 帧到达间隔抖动（秒，RFC 3550同款1/16平滑）
+        self.last_arrival = None  # 上一帧收齐的时间
+        self.report_base = (monotonic(), 0, 0, 0)  # 上次报告时的(时间, 应收分块, 丢失分块, 显示次数)
+        self.reassembler = FrameReassembler()  # 视频分块重组器
+        self.sender_ip = None  # 发送端地址（从视频数据包来源获取，NACK发往此地址）
+        self.stream_id = make_stream_id(REGION, STREAM_ID)  # 当前订阅的视频流ID（采集区域的同播层）
+        self.layers = LayerDirectory()  # 发送端同播的各层分辨率（仅网络线程访问）
+        self.window_size = (800, 600)  # 窗口尺寸（主线程更新，网络线程据此选层）
+        self.layer_check = True  # 需要重新选层（窗口缩放或出现新层）
+        self.stream_generation = 0  # 切换订阅层时递增，帧间解码线程据此重建解码器
+        self.last_keyframe_request = 0.0  # 上次请求关键帧的时间（限速）
+        # 帧间解码状态（H.264/VP8必须按序解码，丢帧后需等待关键帧重新同步）
+        self.stream_queue = Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.stream_synced = False  # 解码器是否与码流同步
+        self.last_stream_frame = None  # 上一个送入解码队列的帧号
+        self.decode_pool = ThreadPoolExecutor(DECODE_WORKERS, thread_name_prefix='stripe')  # 条带并行解码线程池
+        self.jitter_buffer = JitterBuffer(RATE, CHANNELS)  # 音频抖动缓冲（收包线程放入，播放线程取出）
+        self.av_sync = AVSync(AV_SYNC_TOLERANCE)  # 音画同步（播放线程更新音频时钟，解码线程对齐视频）
 
         # 初始化组件
         self.setup_ui()
@@ -43,20 +107,53 @@ class ReceiverApp:
         """初始化视频显示区域"""
         self.lbImage = Label(self.root, bg='black')
         self.lbImage.pack(fill='both', expand=True)  # 自适应窗口
+        self.root.bind('<Configure>', self.on_resize)
+
+    def on_resize(self, event):
+        """记录窗口尺寸变化，由网络线程重新选择订阅层"""
+        if event.widget is self.root and (event.width, event.height) != self.window_size:
+            self.window_size = (event.width, event.height)
+            self.layer_check = True
 
     def setup_audio(self):
-        """初始化音频播放设备"""
+        """初始化音频播放设备（PyAudio回调模式）
+        声卡每AUDIO_FRAMES_PER_BUFFER帧回调一次，从预分配的环形缓冲区取样本（见ringbuffer.py），
+        播放线程负责从抖动缓冲补充；声卡节奏与网络接收、解码完全解耦，慢速声卡不会阻塞任何线程
+        """
+        self.audio_ring = RingBuffer(int(AUDIO_RING_SECONDS * RATE) * CHANNELS)
+        self.audio_out = np.zeros(AUDIO_FRAMES_PER_BUFFER * CHANNELS, dtype=np.int16)  # 回调输出缓冲区
+        self.audio_drained = Event()  # 回调取走样本后置位，唤醒播放线程补充
         self.p_audio = pyaudio.PyAudio()
         self.audio_stream = self.p_audio.open(
             format=FORMAT,
             channels=CHANNELS,
             rate=RATE,
             output=True,  # 输出模式
-            frames_per_buffer=AUDIO_CHUNK
+            frames_per_buffer=AUDIO_FRAMES_PER_BUFFER,
+            stream_callback=self.audio_callback
         )
+        self.output_latency = self.audio_stream.get_output_latency()  # 声卡输出延迟（音画同步用）
+
+    def audio_callback(self, in_data, frame_count, time_info, status):
+        """声卡回调（PortAudio线程）：从环形缓冲区取出frame_count帧，不足部分补静音
+        环形缓冲区已空（未开始播放或抖动缓冲正在缓冲）时直接输出静音，欠载只在样本中途耗尽时计数
+        """
+        out = self.audio_out
+        if len(out) != frame_count * CHANNELS:
+            out = self.audio_out = np.zeros(frame_count * CHANNELS, dtype=np.int16)
+        count = 0
+        if self.audio_ring.available:
+            if status & pyaudio.paOutputUnderflow:
+                self.audio_ring.underruns += 1  # 声卡输出缓冲欠载（回调被耽误）
+            count = self.audio_ring.read_into(out)  # 样本不足时环形缓冲区计一次欠载
+            self.audio_drained.set()
+        out[count:] = 0
+        return out.tobytes(), pyaudio.paContinue
 
     def setup_network(self):
         """启动网络接收线程"""
+        self.feedback_sock = socket(AF_INET, SOCK_DGRAM)  # 反馈单播通道（NACK/关键帧请求）
+
         # 视频接收线程
         self.video_thread = Thread(target=self.recv_image, daemon=True)
         self.video_thread.start()
@@ -65,6 +162,20 @@ class ReceiverApp:
         self.audio_thread = Thread(target=self.recv_audio, daemon=True)
         self.audio_thread.start()
 
+        # 音频播放线程（按声卡节奏从抖动缓冲逐块取出播放）
+        self.playout_thread = Thread(target=self.play_audio, daemon=True)
+        self.playout_thread.start()
+
+        # 解码显示线程
+        self.decode_thread = Thread(target=self.decode_worker, daemon=True)
+        self.decode_thread.start()
+        self.show_stats()
+
+        # 帧间解码线程（需安装PyAV）
+        if AV_AVAILABLE:
+            self.stream_thread = Thread(target=self.decode_stream, daemon=True)
+            self.stream_thread.start()
+
     def setup_menu(self):
         """创建右键上下文菜单"""
         self.menu = Menu(self.root, tearoff=0)
@@ -107,129 +218,459 @@ class ReceiverApp:
 
     def recv_image(self):
         """视频接收线程函数
-        协议处理流程：
-        [循环架构] 双循环设计（外层控制帧切换，内层处理单帧数据）
-        1. 等待start标记 -> 2. 收集数据直到_over标记 -> 3. 解析尺寸 -> 4. 启动处理线程
-        特殊处理：数据收集中途收到新start标记时，立即重置流程接收新帧
+        协议处理流程（包头格式见protocol.py）：
+        1. 接收数据报并解析定长二进制包头，过滤非本协议数据包
+        2. 关闭指令：安全退出；其他流的数据包：忽略
+        3. 分块交给重组器按帧号/分块序号落位，收齐一帧后提交处理
 
         设计要点：
-        - 实时性优先：允许丢弃不完整帧数据，确保最新画面及时显示
-        - 网络适应性：动态处理乱序包和网络延迟
+        - 实时性优先：同时缓存少量未完成帧，某帧完成后更旧的未完成帧直接作废
+        - 网络适应性：分块乱序到达不影响重组，过期帧的迟到分块按帧号丢弃
+        - 抗丢包：发送端启用前向纠错时，重组器用校验包就地恢复丢失分块
+        - 可靠模式：纠错后仍缺失的分块通过NACK请求发送端重传
+        - 零拷贝：recvfrom_into写入预分配的接收缓冲区，负载以memoryview交给重组器，
+          重组器把它拷贝进可复用的帧缓冲区（每个分块只拷贝一次，不再拼接整帧）
+        - 同播选层：记录各流ID（层）的分辨率，只重组订阅的一层，窗口缩放或层变化时切换
+        - 心跳：发送端画面静止时只发心跳，心跳帧号与最近收齐的帧不一致（中途加入或漏收最后一帧）时请求关键帧
+        - 切片容错：切片帧未收齐即被更新的帧作废或静默超时，仍按已收到的切片交付解码
         """
         # 初始化视频专用UDP通道
         sock = socket(AF_INET, SOCK_DGRAM)
+        sock.setsockopt(SOL_SOCKET, SO_RCVBUF, RECV_BUFFER_SIZE)
         sock.bind(('', 22222))  # 绑定固定端口实现协议分离
+        # 周期性醒来检查静默的未完成帧（不依赖后续来包）：发送NACK、作废过期帧、交付超时的切片帧
+        sock.settimeout(NACK_DELAY if RETRANSMIT_ENABLED else PARTIAL_TIMEOUT / 2)
 
-        # === 外层循环：帧控制循环 ===
-        # 作用：持续接收新帧的起始标记，实现画面连续播放
+        # 接收缓冲区（65535为UDP数据报上限，兼容发送端任意分块大小），整个生命周期复用
+        buf = bytearray(65535)
+        view = memoryview(buf)
+        last_layer_check = monotonic()
         while self.receiving:
-            # --- 阶段1：等待有效起始标记 ---
-            # 功能：过滤网络残留数据，确保从新帧的起点开始接收
-            # 设计：小循环持续读取直到获取start或close指令
-            while self.receiving:
-                # 接收协议控制包（60KB缓冲区可兼容start/close指令还有摄像头的包）
-                chunk, _ = sock.recvfrom(60 * 1024)
-
-                # 情景处理分支
-                if chunk == b'start':
-                    break  # 进入帧数据处理阶段
-                elif chunk == b'close':
-                    # 安全关闭流程（防止资源未释放）
-                    self.safe_shutdown(sock)
-                    return  # 直接终止线程
-            else:
-                # 当外层循环条件self.receiving变为False时的退出路径
+            if RETRANSMIT_ENABLED and self.sender_ip:
+                self.send_nacks()
+            self.reassembler.expire(monotonic())
+            self.deliver_partial()
+            try:
+                n, addr = sock.recvfrom_into(buf)
+            except timeout:
+                continue  # 回到循环开头处理过期与超时交付
+            packet = view[:n]
+            header = parse_header(packet)
+            if header is None:
+                continue  # 残缺包或协议版本不符
+            self.sender_ip = addr[0]
+
+            if header.flags & FLAG_CLOSE:
+                # 安全关闭流程（防止资源未释放）
+                self.safe_shutdown(sock)
+                return  # 直接终止线程
+
+            if AUTO_LAYER:
+                now = monotonic()
+                if (header.chunk_index == 0 and not header.flags & FLAG_PARITY
+                        and region_of(header.stream_id) == REGION):  # 只在订阅区域的各层中选择
+                    if self.layers.update(header.stream_id, header.width, header.height, now):
+                        self.layer_check = True  # 出现新的层
+                if self.layer_check or now - last_layer_check > LAYER_TIMEOUT:
+                    self.layer_check = False
+                    last_layer_check = now
+                    self.select_layer(now)
+
+            if header.stream_id != self.stream_id:
                 continue
 
-            # === 阶段2：帧数据收集循环 ===
-            # 功能：收集属于同一帧的所有数据包
-            # 特性：允许被新start标记中断，保证实时性
-            data = []  # 初始化当前帧数据容器
-            while self.receiving:
-                # 接收数据块（缓冲区大小与发送端BUFFER_SIZE一致）
-                chunk, _ = sock.recvfrom(60 * 1024)
-
-                # 协议标记处理分支
-                if chunk.startswith(b'_over'):
-                    # 正常结束标记处理
-                    # 示例：b'_over(1920,1080)' -> chunk[5:]为尺寸字符串
-                    self.process_image(data, chunk[5:])  # 提交完整数据
-                    break  # 结束当前帧，回到外层循环
-
-                elif chunk == b'close':
-                    # 安全终止指令（跨线程协调关闭）
-                    self.safe_shutdown(sock)
-                    return
-
-                elif chunk == b'start':
-                    # !!! 关键异常处理 !!!
-                    # 触发条件：发送端已开始新帧传输，但接收端仍在接收旧帧数据
-                    # 问题：继续收集会导致新旧帧数据混杂
-                    # 解决方案：
-                    data.clear()  # 清空当前不完整数据
-                    break  # 跳出内层循环，立即处理新帧
+            if header.flags & FLAG_HEARTBEAT:
+                r = self.reassembler
+                if header.frame_no != r.last_completed and header.frame_no not in r.pending:
+                    self.request_keyframe()  # 静止画面的最后一帧没有收到（未完成的帧交给NACK重传）
+                continue
 
-                else:
-                    # 常规数据包处理
-                    data.append(chunk)  # 累积帧数据
+            frame = self.reassembler.add(header, packet[HEADER.size:])
+            if self.reassembler.frames_dropped != self.frames_dropped_seen:
+                self.frames_dropped_seen = self.reassembler.frames_dropped
+                self.request_keyframe()  # 有帧未收齐即被作废：后续差分帧缺少基础
+            self.deliver_partial()  # 被本帧作废的未收齐切片帧先于本帧交付
+            if frame is not None:
+                self.track_arrival(monotonic())
+                self.process_image(frame)
 
         # === 资源清理 ===
         # 触发条件：self.receiving被设置为False
         sock.close()  # 关闭网络连接
 
+    def deliver_partial(self):
+        """交付重组器中未收齐的切片帧（按已收切片解码，丢失的切片由上一帧隐藏）"""
+        for frame in self.reassembler.take_partial():
+            self.process_image(frame)
+
+    def select_layer(self, now):
+        """订阅能覆盖窗口尺寸的最小一层（网络线程调用，重组器只在本线程访问）"""
+        stream_id = self.layers.choose(*self.window_size, now)
+        if stream_id is None or stream_id == self.stream_id:
+            return
+        self.stream_id = stream_id
+        self.reassembler.reset()  # 各层帧号独立，丢弃旧层的未完成帧
+        self.last_stream_frame = None
+        self.stream_synced = False
+        self.stream_generation += 1
+        self.last_keyframe_request = 0.0  # 新层需要立即从关键帧开始
+        self.request_keyframe()
+
+    def send_nacks(self):
+        """向发送端单播未完成帧的缺失分块列表（NACK）"""
+        for frame_no, missing in due_nacks(self.reassembler, monotonic()):
+            try:
+                self.feedback_sock.sendto(pack_nack(self.stream_id, frame_no, missing),
+                                          (self.sender_ip, FEEDBACK_PORT))
+            except OSError as e:
+                print("NACK发送错误:", e)
+
+    def request_keyframe(self):
+        """请求发送端尽快发送关键帧（中途加入或解码失步时调用，按间隔限速）"""
+        now = monotonic()
+        if self.sender_ip is None or now - self.last_keyframe_request < KEYFRAME_REQUEST_INTERVAL:
+            return
+        self.last_keyframe_request = now
+        try:
+            self.feedback_sock.sendto(pack_keyframe_request(self.stream_id), (self.sender_ip, FEEDBACK_PORT))
+        except OSError as e:
+            print("关键帧请求发送错误:", e)
+
     def recv_audio(self):
         """音频接收线程函数
         实现特点：
-        - 持续接收并播放音频
-        - 自动解压缩数据
+        - 持续接收音频，按序号放入抖动缓冲（见jitter.py），由播放线程播放
+        - 按音频包头中的编码器ID解码（见audio_codec.py）
+        - 发送端降采样时升采样回播放采样率RATE
         """
         audio_sock = socket(AF_INET, SOCK_DGRAM)
         audio_sock.bind(('', 22223))  # 绑定音频端口
+        resampler = None  # 发送采样率与RATE不同时使用（采样率变化时重建）
 
         while self.receiving:
             try:
                 data, _ = audio_sock.recvfrom(65535)
-                decompressed = decompress(data)
-                self.audio_stream.write(decompressed)  # 实时播放
+                audio = unpack_audio(data)
+                if audio is None:
+                    continue  # 非本协议数据包或编码器未知
+                samples = audio.samples
+                if audio.rate != RATE:
+                    if resampler is None or (resampler.src_rate, resampler.channels) != (audio.rate, audio.channels):
+                        resampler = Resampler(audio.rate, RATE, audio.channels)
+                    samples = resampler.process(samples)
+                self.jitter_buffer.push(audio.seq, audio.timestamp, audio.rate, samples, monotonic(), audio.capture)
             except Exception as e:
                 if self.receiving:
                     print("音频接收错误:", e)
         audio_sock.close()
 
-    def process_image(self, data, size_info):
-        """图像预处理
+    def play_audio(self):
+        """音频播放线程函数
+        环形缓冲区中的待播样本低于PLAYOUT_QUEUE时，从抖动缓冲取出下一块（丢失的块由缓冲补偿）写入，
+        否则等待声卡回调取走样本，取块节奏因此跟随播放速度；抖动缓冲正在缓冲时稍后再取
+        每写入一块，按其采集时间更新音画同步的音频播放时钟
+        """
+        ring = self.audio_ring
+        while self.receiving:
+            self.audio_drained.clear()
+            if ring.available >= PLAYOUT_QUEUE * CHANNELS:
+                self.audio_drained.wait(0.1)
+                continue
+            now = monotonic()
+            samples = self.jitter_buffer.pop(now)
+            if samples is None:
+                sleep(0.005)
+                continue
+            queued = ring.available  # 本块之前尚未播放的样本
+            ring.write(samples)
+            if self.jitter_buffer.clock is not None:
+                # 块首在已排队的样本播完、再经过声卡输出延迟后发声
+                self.av_sync.audio_played(self.jitter_buffer.clock,
+                                          now + queued / CHANNELS / RATE + self.output_latency, now)
+
+    def process_image(self, frame):
+        """图像预处理（网络线程调用）
         参数：
-            data: 原始字节数据列表
-            size_info: 图像尺寸信息
+            frame: 重组完成的帧（PendingFrame，含分辨率、标志位与分块数据）
+        实现特点：
+        - 帧内编码的帧放入最新帧邮箱，由解码线程解码：新的完整帧取代尚未解码的旧帧，
+          差分帧与渐进帧的细化层依赖前一帧，追加在后按序修补
+        - 帧间编码（H.264/VP8）的帧转交帧间解码线程按序解码
         """
-        try:
-            image_size = eval(size_info)  # 解析尺寸元组
-            image_data = decompress(b''.join(data))  # 解压完整数据
-        except:
-            data.clear()
+        if frame.codec in STREAM_CODECS:
+            if AV_AVAILABLE:
+                self.queue_stream_frame(frame)
+            else:
+                frame.release()  # 未安装PyAV时无法解码，直接丢弃
             return
+        self.mailbox.put(frame, supersede=not frame.flags & (FLAG_DELTA | FLAG_REFINEMENT))
+
+    def discard_frame(self, item):
+        """未解码即被丢弃的邮箱项：重组帧归还帧缓冲区（帧间解码线程输出的画面无需处理）"""
+        if not isinstance(item, tuple):
+            item.release()
+
+    def apply_frame(self, frame):
+        """解码一帧并写入帧缓冲区（解码线程调用）
+        实现特点：
+        - 完整帧按包头中的编码器ID解码后替换帧缓冲区（条带帧的各条带在线程池中并行解码）
+        - 切片帧只解码收齐的切片，丢失切片的位置沿用上一帧画面，并请求关键帧修复后续差分帧的基础
+        - 差分帧（zlib压缩的图块）修补进帧缓冲区；差分帧以发送端的上一帧为基础，
+          帧号与最近写入的帧不连续（中间的帧丢失或被作废）时拒绝修补并请求关键帧
+        - 预置字典差分帧以参考关键帧中的旧图块为字典逐块解压，参考帧不符时请求关键帧
+        - 渐进帧见apply_progressive；渐进画面尚未细化完成时收到差分帧，修补后请求关键帧
+        返回：帧缓冲区是否已更新
+        """
+        if frame.flags & FLAG_PROGRESSIVE:
+            return self.apply_progressive(frame)
+        w, h = frame.width, frame.height
+        delta = frame.flags & FLAG_DELTA
+        zdict = frame.flags & FLAG_ZDICT
+        concealed = 0  # 被隐藏的行数
+        try:
+            if zdict:
+                image_data = bytes(frame.data)  # 各图块单独压缩，修补时逐块解压
+            elif delta:
+                image_data = decompress(frame.data)  # 解压差分图块
+            elif frame.flags & FLAG_SLICED:
+                pixels, concealed = decode_slices(self.decode_pool, get_codec(frame.codec),
+                                                  frame.received_chunks(), w, h, self.framebuffer)  # 各切片并行解码
+            elif frame.flags & FLAG_STRIPED:
+                pixels = decode_stripes(self.decode_pool, get_codec(frame.codec), frame.data, w, h)  # 各条带并行解码
+            else:
+                pixels = get_codec(frame.codec).decode(frame.data, w, h)  # 可写数组，供后续差分帧修补
+        except Exception:
+            return False  # 未知编码器或数据损坏，丢弃
+        finally:
+            frame.release()  # 数据已解压/解码，归还帧缓冲区
+
+        if concealed:
+            self.frames_concealed += 1
+            self.request_keyframe()  # 隐藏的画面与发送端不一致，后续差分帧需要新的基础
+            if concealed == h:
+                return False  # 没有任何完整的切片
+        if not delta:
+            self.canvas = None
+            self.framebuffer = pixels
+            self.reference = None if concealed else (frame.frame_no, pixels)  # 隐藏过的画面不能作为参考帧
+        elif self.framebuffer is None or self.framebuffer.shape[:2] != (h, w):
+            self.request_keyframe()
+            return False  # 尚未收到关键帧（中途加入或分辨率变化），请求并等待下一个完整帧
+        elif self.last_applied is None or frame.frame_no != (self.last_applied + 1) % SEQ_MOD:
+            self.request_keyframe()
+            return False  # 基础帧缺失：修补上去的画面会与发送端不一致，等待下一个完整帧
+        elif zdict and (self.reference is None or self.reference[0] != zdict_reference(image_data)):
+            self.request_keyframe()
+            return False  # 没有该差分帧引用的参考关键帧（中途加入或关键帧丢失）
+        else:
+            try:
+                if zdict:
+                    if self.framebuffer is self.reference[1]:
+                        self.framebuffer = self.framebuffer.copy()  # 写时复制，保留参考帧原样
+                    apply_zdict_tiles(self.framebuffer, self.reference[1], image_data)
+                else:
+                    apply_tiles(self.framebuffer, image_data)
+            except Exception as e:
+                print("差分帧修补错误:", e)
+                self.request_keyframe()  # 帧缓冲区可能已部分修补，从下一个关键帧重新同步
+                return False
+            if self.canvas is not None and not self.canvas.complete:
+                self.request_keyframe()  # 差分帧以完整画面为基础，而这里只有粗略画面
+        self.last_applied = frame.frame_no
+        return True
+
+    def apply_progressive(self, frame):
+        """应用渐进帧的一层（解码线程调用）
+        实现特点：
+        - 基础层新建画面，放大后立即显示粗略版本
+        - 细化层按序补全像素、逐步变清晰；与当前画面不连续（中间的层丢失或被发送端跳过）时丢弃
+        - 各层按切片解码，未收齐的层只隐藏丢失的切片，并请求关键帧（画面与发送端不一致）
+        返回：帧缓冲区是否已更新
+        """
+        try:
+            if not frame.flags & FLAG_REFINEMENT:
+                self.canvas = ProgressiveCanvas(frame.frame_no, frame.width, frame.height)
+            elif self.canvas is None:
+                return False
+            concealed = self.canvas.apply(self.decode_pool, get_codec(frame.codec), frame.frame_no,
+                                          frame.received_chunks(), self.framebuffer)
+        except Exception:
+            return False  # 细化层不连续、未知编码器或数据损坏，停在当前清晰度
+        finally:
+            frame.release()
+        if concealed:
+            self.frames_concealed += 1
+            self.request_keyframe()  # 隐藏的画面与发送端不一致，后续差分帧需要新的基础
+        self.framebuffer = self.canvas.render()
+        self.reference = None  # 渐进帧不作为预置字典参考（细化层可能被跳过）
+        self.last_applied = frame.frame_no
+        return True
+
+    def queue_stream_frame(self, frame):
+        """帧间编码帧入队
+        实现特点：
+        - 帧号不连续（整帧丢失）或解码队列溢出即判定失步
+        - 失步后丢弃非关键帧并请求关键帧，收到关键帧后恢复解码
+        """
+        if self.last_stream_frame is not None and frame.frame_no != (self.last_stream_frame + 1) % SEQ_MOD:
+            self.stream_synced = False  # 中间有帧丢失，参考帧链已断
+        self.last_stream_frame = frame.frame_no
 
-        # 使用子线程解码，避免阻塞网络线程
-        Thread(target=self.decode_image,
-               args=(image_data, image_size)).start()
+        if not self.stream_synced:
+            if not frame.flags & FLAG_KEYFRAME:
+                frame.release()
+                self.request_keyframe()
+                return
+            self.stream_synced = True
 
-    def decode_image(self, image_data, image_size):
-        """图像解码与显示
+        try:
+            self.stream_queue.put_nowait(frame)
+        except Full:
+            # 解码跟不上：清空积压，从下一个关键帧重新开始
+            self.stream_synced = False
+            frame.release()
+            while True:
+                try:
+                    self.stream_queue.get_nowait().release()
+                except Empty:
+                    break
+            self.request_keyframe()
+
+    def decode_stream(self):
+        """帧间解码线程函数
+        按序解码H.264/VP8数据，解码结果写入帧缓冲区后交给显示线程
+        编码器类型变化（发送端切换编码）或切换订阅层时重建解码器
+        """
+        decoder = None
+        generation = self.stream_generation
+        while self.receiving:
+            try:
+                frame = self.stream_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                if decoder is None or decoder.codec != frame.codec or generation != self.stream_generation:
+                    decoder = StreamDecoder(frame.codec)
+                    generation = self.stream_generation
+                start = perf_counter()
+                images = decoder.decode(frame.data)
+                self.track_decode(perf_counter() - start)
+            except Exception as e:
+                print("帧间解码错误:", e)
+                decoder = None
+                self.stream_synced = False
+                continue
+            finally:
+                frame.release()
+            if images:
+                self.mailbox.put((frame.capture, images[-1]))  # 已解码画面及其采集时间，交给解码线程显示
+
+    def decode_worker(self):
+        """解码显示线程函数（常驻单线程）
         实现特点：
-        - 在子线程中处理耗时操作
+        - 每次取走邮箱中全部待处理帧按序写入帧缓冲区，然后只显示一次最新画面
+        - 解码/显示跟不上时旧的完整帧在邮箱中被直接取代，表现为帧率下降而不是延迟累积
+        - 显示前按最新画面的采集时间与音频播放时钟对齐（见sync_video）
+        """
+        while self.receiving:
+            captured = None  # 最新画面的采集时间
+            for item in self.mailbox.take(timeout=0.5):
+                if isinstance(item, tuple):
+                    captured, self.framebuffer = item  # 帧间解码线程输出的画面
+                else:
+                    start = perf_counter()
+                    if not self.apply_frame(item):
+                        continue
+                    self.track_decode(perf_counter() - start)
+                    captured = item.capture
+                self.frames_decoded += 1
+            if captured is not None and self.sync_video(captured):
+                self.render_frame()
+                self.av_sync.shown(captured, monotonic())
+
+    def sync_video(self, captured):
+        """音画同步（解码线程调用）：画面早于音频时等待，晚于音频且已有更新的帧待处理时跳过显示
+        返回：是否显示本画面
+        """
+        if not AV_SYNC_ENABLED:
+            return True
+        wait = self.av_sync.schedule(captured, monotonic(), newer_pending=len(self.mailbox) > 0)
+        if wait is None:
+            return False
+        if wait > 0:
+            sleep(wait)
+        return True
+
+    def render_frame(self):
+        """缩放帧缓冲区并交给主线程显示
+        实现特点：
+        - 在解码线程中处理耗时操作
         - 使用root.after保证线程安全更新GUI
         """
         try:
-            # 从字节数据创建图像
-            img = frombytes('RGB', image_size, image_data)
+            img = fromarray(self.framebuffer)  # RGB模式下fromarray会复制数据
             # 自适应窗口尺寸
             img = img.resize((self.root.winfo_width(), self.root.winfo_height()))
             photo = PhotoImage(img)
             # 通过主线程更新显示
             self.root.after(0, self.update_display, photo)
+            self.frames_rendered += 1
         except Exception as e:
             print("图像处理错误:", e)
 
+    def track_arrival(self, now):
+        """记录一帧收齐的时间，更新到达间隔与抖动"""
+        if self.last_arrival is not None:
+            interval = now - self.last_arrival
+            if self.arrival_interval is None:
+                self.arrival_interval = interval
+            self.jitter += (abs(interval - self.arrival_interval) - self.jitter) / 16
+            self.arrival_interval += (interval - self.arrival_interval) / 16
+        self.last_arrival = now
+
+    def track_decode(self, elapsed):
+        """记录一帧的解码耗时"""
+        self.decode_time += (elapsed - self.decode_time) * 0.1
+
+    def show_stats(self):
+        """每REPORT_INTERVAL秒刷新标题栏统计，并向发送端单播接收质量报告"""
+        now = monotonic()
+        r = self.reassembler
+        since, expected, lost, rendered = self.report_base
+        self.report_base = (now, r.chunks_expected, r.chunks_lost, self.frames_rendered)
+        # 含整帧丢失的帧（帧号空缺）；乱序迟到撤销的计数可能落在下一个周期，结果截断到不小于0
+        loss = 0.0
+        if r.chunks_expected > expected:
+            loss = max(0.0, (r.chunks_lost - lost) / (r.chunks_expected - expected))
+        render_fps = (self.frames_rendered - rendered) / max(now - since, 1e-3)  # Windows单调时钟精度约16ms
+        dropped = r.frames_dropped + self.mailbox.dropped
+
+        title = (f'屏幕广播接收端-v1.6  解码{self.frames_decoded} 丢弃{dropped} 隐藏{self.frames_concealed} '
+                 f'显示{self.frames_rendered}  丢包{loss:.1%} 纠错恢复{r.chunks_recovered} {render_fps:.0f}FPS')
+        layers = self.layers.active(now)
+        if len(layers) > 1 and self.stream_id in layers:
+            w, h = layers[self.stream_id]
+            title += f'  第{self.stream_id}层{w}x{h}（共{len(layers)}层）'
+        audio = self.jitter_buffer.snapshot()
+        if audio['depth_ms'] or audio['late'] or audio['concealed']:
+            title += f"  音频缓冲{audio['depth_ms']:.0f}ms 迟到{audio['late']} 补偿{audio['concealed']}"
+        ring = self.audio_ring
+        if ring.underruns or ring.overruns:
+            title += f'  欠载{ring.underruns} 溢出{ring.overruns}'
+        if AV_SYNC_ENABLED and self.av_sync.skew is not None and self.av_sync.active(now):
+            title += f'  音画偏差{self.av_sync.skew * 1000:+.0f}ms'
+        self.root.title(title)
+        if self.sender_ip is not None:
+            try:
+                self.feedback_sock.sendto(pack_report(self.stream_id, r.frames_completed, self.frames_decoded, dropped,
+                                                      r.chunks_recovered, loss, self.jitter * 1000,
+                                                      self.decode_time * 1000, render_fps),
+                                          (self.sender_ip, FEEDBACK_PORT))
+            except OSError as e:
+                print("质量报告发送错误:", e)
+        if self.receiving:
+            self.root.after(int(REPORT_INTERVAL * 1000), self.show_stats)
+
     def update_display(self, photo):
         """安全更新图像显示"""
         self.lbImage.config(image=photo)
@@ -245,6 +686,7 @@ class ReceiverApp:
         """
         self.receiving = False
         sock.close()
+        self.decode_pool.shutdown(wait=False)
         # 释放音频资源
         self.audio_stream.stop_stream()
         self.audio_stream.close()
@@ -254,6 +696,7 @@ class ReceiverApp:
     def close_window(self):
         """窗口关闭处理"""
         self.receiving = False
+        self.decode_pool.shutdown(wait=False)
         self.root.after(100, self.root.destroy)  # 延迟销毁确保资源释放
 
     def run(self):
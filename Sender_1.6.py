@@ -8,30 +8,97 @@
 """
 
 # ============================== 系统配置 ==============================
-from time import sleep
+from time import sleep, monotonic, perf_counter
 from os import startfile
 from zlib import compress  # 使用zlib进行数据压缩（DEFLATE算法）
-from threading import Thread, Lock  # 线程模块，Lock用于资源同步
+from threading import Thread, Lock, Event  # 线程模块，Lock用于资源同步
 import cv2  # OpenCV库，用于摄像头操作
+import numpy as np  # 数组运算库，用于帧差分比较
 import pyaudio  # 音频处理库
-from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_BROADCAST  # UDP广播相关
-from tkinter import Tk, BooleanVar, Button, Label, StringVar, Radiobutton, Checkbutton  # GUI组件
-from PIL.ImageGrab import grab  # 屏幕截图库（比mss更快）
+from socket import socket, timeout, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_BROADCAST  # UDP广播相关
+from tkinter import Tk, Toplevel, BooleanVar, Button, Label, StringVar, Radiobutton, Checkbutton  # GUI组件
+from tkinter.ttk import Treeview  # 接收端统计表格
+from PIL.Image import Resampling
+from video_codec import CODEC_ZLIB, LOSSLESS_CODECS, get_codec, compress_tiles_zdict  # 帧内编码器、预置字典差分
+from av_codec import AV_AVAILABLE, StreamEncoder  # 帧间编码器（可选依赖PyAV）
+from protocol import (HEADER, FLAG_DELTA, FLAG_KEYFRAME, FLAG_STRIPED, FLAG_ZDICT, FLAG_HEARTBEAT, FLAG_SLICED,
+                      FLAG_PROGRESSIVE, FLAG_REFINEMENT, packetize, send_packets, heartbeat_packet,
+                      close_packet)  # 二进制包头协议
+from fec import FEC_HEADER  # 前向纠错校验前缀
+from pipeline import DropOldestQueue, Stage, format_stats  # 采集/编码/发送流水线
+from pacing import FrameScheduler, PacketPacer, StaticDetector  # 截止时间帧调度、数据报限速、静止检测
+from adaptive import LEVEL_CODECS, QualityController, LevelTuner  # 自适应画质控制、压缩级别自动调优
+from parallel import make_pool, encode_stripes  # 条带并行编码
+from slicing import encode_slices  # 切片容错编码
+from progressive import encode_progressive  # 渐进细化编码
+from simulcast import layer_size, make_layers, region_of, layer_of  # 多分辨率同播
+from region import CaptureRegion  # 屏幕区域采集（矩形/显示器/窗口）
+from retransmit import (FEEDBACK_PORT, NACK_AGGREGATE_INTERVAL, KIND_NACK, KIND_KEYFRAME, KIND_REPORT,
+                        KEYFRAME_REQUEST_INTERVAL, RETRANSMIT_CACHE_FRAMES, RetransmitCache,
+                        NackAggregator, parse_feedback)  # NACK选择性重传与关键帧请求
+from report import REPORT_INTERVAL, WORST_PERCENTILE, ReceiverTable  # 接收质量报告
+from audio_codec import get_audio_codec, pack_audio, Resampler  # 音频编码器与重采样
+from avsync import media_clock  # 音视频公共采集时钟
+from ringbuffer import RingBuffer  # 音频采集环形缓冲区
 
 # 音频配置
 FORMAT = pyaudio.paInt16  # 16位整型音频格式（兼容性最好）
 CHANNELS = 1  # 单声道（降低带宽消耗）
 RATE = 44100  # 采样率（Hz）
-AUDIO_CHUNK = 1024  # 每次读取的音频数据块大小（经验值，平衡延迟和性能）
+AUDIO_CHUNK = 1024  # 每个音频数据报的样本帧数（经验值，平衡延迟和性能）
+AUDIO_FRAMES_PER_BUFFER = 256  # 声卡回调每次交付的样本帧数（越小采集延迟越低，回调越频繁）
+AUDIO_RING_SECONDS = 0.5  # 采集环形缓冲区容量（秒），发送线程落后超过此时长时丢弃新样本并计溢出
+AUDIO_CODEC = 'ulaw'  # 音频编码器：'pcm'不压缩，'zlib'旧版方式，'ulaw' G.711 μ律（2:1，查表几乎不耗CPU），
+# 'adpcm' IMA-ADPCM（约3.2:1，但编解码每秒音频约25~45ms CPU，为zlib的5~10倍；带宽紧张时才改用）
+AUDIO_SEND_RATE = 0  # 发送采样率（Hz）：语音可设16000或22050，降采样后再编码；0表示保持RATE
 
 # ============================== GUI初始化 ==============================
 root = Tk()
 root.title('屏幕广播发送端-v1.6')
-root.geometry('330x150+500+200')  # 窗口宽度x高度+水平偏移+垂直偏移
+root.geometry('330x235+500+200')  # 窗口宽度x高度+水平偏移+垂直偏移
 root.resizable(False, False)  # 禁止调整窗口大小（保持界面布局）
 
 # ============================== 全局变量 ==============================
-BUFFER_SIZE = 60 * 1024  # UDP数据分块大小（60KB，经验值）
+# UDP数据报大小上限（含包头）：低于以太网MTU（1500）避免IP分片，经VPN/隧道时可再调小
+# 旧版60KB数据报会被拆成约40个IP分片，丢失任一分片整个数据报作废
+BUFFER_SIZE = 1400
+CHUNK_PAYLOAD = BUFFER_SIZE - HEADER.size - FEC_HEADER.size  # 每个数据报的负载大小（扣除包头，校验包另有前缀）
+FEC_GROUP_SIZE = 8  # 前向纠错分组大小k（每k个数据分块一组）
+FEC_PARITY = 1  # 每组校验包数m（每组最多恢复m个丢失分块，冗余开销m/k，0表示关闭）
+RETRANSMIT_ENABLED = True  # 可靠模式：接收端NACK请求时重传丢失分块（截止时间内）
+TILE_DELTA_ENABLED = True  # 屏幕模式启用脏块差分编码（只发送变化的图块）
+ZDICT_ENABLED = True  # 差分图块以上一个关键帧中同位置的旧内容为zlib预置字典压缩（屏幕编码器须为无损的zlib/png）
+LEVEL_AUTOTUNE = True  # 定期用实时画面试压缩1-9级，自动选择耗时与数据量折算代价最小的zlib压缩级别
+SCREEN_CODEC = 'zlib'  # 屏幕完整帧编码器（'zlib'/'png'无损保证文字清晰，'jpeg'/'webp'有损，'yuv420'原始YUV数据量减半）
+CAMERA_CODEC = 'jpeg'  # 摄像头帧编码器（自然画面用有损编码，码率降低一个数量级；'yuv420'直接转换BGR，省去BGR转RGB）
+CODEC_QUALITY = 75  # 有损编码初始画质（1-100，越高越清晰、数据量越大；自适应模式下自动调整）
+STREAM_CODEC = None  # 帧间编码模式：None关闭，'h264'/'vp8'启用（需安装PyAV，适合摄像头与视频播放内容）
+STREAM_BITRATE = 4_000_000  # 帧间编码码率（bps）
+STREAM_GOP = 50  # 帧间编码关键帧间隔（帧）
+STREAM_PRESET = 'ultrafast'  # x264编码预设（越快CPU占用越低，压缩率越差）
+SCREEN_FPS = 25  # 屏幕模式目标帧率（截止时间调度，处理耗时不再拉低帧率）
+CAMERA_FPS = 10  # 摄像头模式目标帧率（摄像头通常帧率低于屏幕，考虑到损耗与丢帧，接收端一般少个3到5帧）
+MAX_BITRATE = 50_000_000  # 视频发送码率上限（bps，令牌桶限速，0表示不限）
+PACING_BURST = 16  # 限速令牌桶容量（数据报个数），每次醒来最多连发的数据报数
+ADAPTIVE_ENABLED = True  # 自适应画质：按各阶段耗时与码率自动调整压缩级别/画质/分辨率/帧率（码率上限即MAX_BITRATE）
+MIN_FPS = 5  # 自适应控制允许降到的最低帧率
+STATIC_DETECTION = True  # 屏幕静止检测：画面不变时不编码不发送，只定期发心跳；持续静止时降低采集帧率
+IDLE_FPS = 2  # 画面持续静止时的采集帧率（检测到变化后立即恢复SCREEN_FPS）
+HEARTBEAT_INTERVAL = 0.5  # 静止时心跳包的发送间隔（秒）
+MIN_REFRESH_INTERVAL = 10.0  # 静止时至少每隔该时间（秒）发送一次关键帧（中途加入的接收端也能出图）
+REPORT_RATE_CONTROL = True  # 按接收端报告的最差分位丢包率自动下调/恢复码率上限（需MAX_BITRATE非0）
+ENCODE_WORKERS = 4  # 完整帧切片/条带/渐进层并行编码的线程数（按CPU核数配置，小于2关闭；高分辨率屏幕单核压缩跟不上时开启）
+SLICE_ENABLED = True  # 完整帧按切片独立编码并按分块对齐（丢包时接收端只隐藏丢失的切片，不丢弃整帧；开启时条带编码仅作后备）
+PROGRESSIVE_ENABLED = True  # 大分辨率完整帧按渐进模式发送（先发1/16像素的基础层，再发细化层，接收端先出粗略画面）
+PROGRESSIVE_MIN_PIXELS = 2560 * 1440  # 达到该像素数的完整帧才使用渐进模式（代替切片/条带编码）
+SEND_MAX_WIDTH = 0  # 发送分辨率宽度上限（采集后先缩小再编码，如1280；0表示保持采集分辨率）
+# 屏幕采集区域，每个区域编码为独立的一组流（区域i的流ID为 i<<8 | 层序号，接收端按区域序号订阅）：
+# None整个屏幕；('rect', (左, 上, 宽, 高))固定矩形；('monitor', 0)单个显示器（0为主显示器）；
+# ('window', '标题关键字')跟踪窗口（随窗口移动缩放）。如[('monitor', 0), ('window', 'PowerPoint')]
+CAPTURE_REGIONS = [None]
+SIMULCAST_SCALES = (1.0,)  # 同播各层相对发送分辨率的缩放比例，第i层使用流ID i；如(1.0, 0.5, 0.25)同时发送完整/一半/缩略图三层
+# 摄像头帧保持OpenCV的BGR格式直接编码（编码器支持BGR输入且未启用帧间编码时），省去整帧BGR转RGB
+CAMERA_BGR = STREAM_CODEC is None and get_codec(CAMERA_CODEC, bgr=True) is not None
 sending = BooleanVar(root, value=False)  # 广播状态原子变量（线程安全）
 source_type = StringVar(value='screen')  # 当前视频源类型（'screen'/'camera'）
 audio_enabled = BooleanVar(value=False)  # 音频传输开关状态
@@ -42,6 +109,17 @@ audio_stream = None  # 音频输入流（PyAudio Stream对象）
 audio_socket = None  # 音频传输专用socket（与视频分开端口）
 p_audio = None  # PyAudio实例（音频设备接口）
 audio_thread = None  # 音频传输线程对象
+audio_ring = None  # 音频采集环形缓冲区（声卡回调写入，发送线程读出；用于界面显示溢出次数）
+# 重传缓存（各流最近若干帧的数据分块）
+retransmit_cache = RetransmitCache(RETRANSMIT_CACHE_FRAMES * len(SIMULCAST_SCALES) * len(CAPTURE_REGIONS))
+nack_aggregator = NackAggregator()  # NACK聚合与重传限速（反馈线程使用，计数用于界面显示）
+keyframe_request = Event()  # 接收端请求关键帧（反馈线程置位，发送线程消费）
+video_stages = []  # 视频流水线各阶段（用于界面显示耗时与队列深度）
+frame_scheduler = None  # 帧调度器（用于界面显示跳帧数）
+quality_controller = None  # 自适应画质控制器（用于界面显示当前档位与调整原因）
+static_detectors = []  # 各屏幕区域的静止检测器（用于界面显示静止状态）
+refinements_skipped = 0  # 因下一帧已就绪而跳过的渐进细化层数
+receiver_table = ReceiverTable()  # 接收端统计表（snapshot()可供外部读取）
 
 # 资源锁（防止多线程资源竞争）
 camera_lock = Lock()  # 摄像头操作锁（保证open/release原子性）
@@ -80,128 +158,456 @@ def release_camera():
 
 
 # ============================== 视频处理模块 ==============================
-def get_frame():
+def get_frame(region=None):
     """获取当前帧数据
     根据当前选择的视频源动态获取图像数据，自动处理颜色空间转换
     功能说明：
     - 根据当前模式获取视频源数据
-    - 屏幕模式使用PIL的grab()获取屏幕截图
+    - 屏幕模式截取region指定的区域（CaptureRegion，整个屏幕时使用PIL的grab()），区域不可见时返回None
     - 摄像头模式使用OpenCV读取视频帧
-    - 自动进行颜色空间转换（BGR转RGB）
+    - 自动进行颜色空间转换（BGR转RGB；CAMERA_BGR时保持BGR，由编码器直接转换为YUV）
     """
     current_source = source_type.get()
 
     if current_source == 'screen':
-        # 使用PIL获取屏幕截图（全屏），转换为RGB格式（兼容网络传输）
-        return grab().convert('RGB')  # convert确保统一格式
+        # 只截取选中区域的像素，转换为RGB格式（兼容网络传输）
+        return (region or CaptureRegion()).grab()
     else:
         with camera_lock:  # 保证摄像头读取的原子性
             if cap and cap.isOpened():
                 ret, frame = cap.read()  # 读取摄像头帧（BGR格式）
+                if not ret:
+                    return None
                 # OpenCV默认使用BGR格式，转换为RGB用于后续处理
-                return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if ret else None
+                return frame if CAMERA_BGR else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             return None
 
 
+def resize_frame(img, size):
+    """缩放一帧到size=(宽, 高)（屏幕帧为PIL图像，摄像头帧为数组）"""
+    if isinstance(img, np.ndarray):
+        return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return img.resize(size, Resampling.BILINEAR)
+
+
+def frame_size(img):
+    """一帧的(宽, 高)"""
+    if isinstance(img, np.ndarray):
+        return img.shape[1], img.shape[0]
+    return img.size
+
+
 def send_image():
     """视频流发送线程函数
     实现UDP广播传输的核心逻辑，包含分块传输、错误恢复和动态切换机制
-    实现逻辑：
-    1. 创建UDP广播socket（SO_BROADCAST选项启用广播）
-    2. 循环获取帧数据并根据当前模式处理：
-       - 屏幕模式：使用PIL截图，压缩字节数据
-       - 摄像头模式：使用OpenCV获取帧，压缩字节数据
-    3. 数据传输协议：
-       - 发送b'start'标记表示传输开始
-       - 将压缩数据分块发送（每块60KB）
-       - 发送b'_over+分辨率信息'标记表示传输结束
-    4. 异常处理：
-       - 摄像头不可用时自动切换回屏幕模式
-       - 发送错误时自动释放资源
+    实现逻辑（流水线结构，见pipeline.py）：
+    1. 采集阶段：读取当前视频源的一帧（摄像头不可用时自动切换回屏幕模式）
+    2. 编码阶段：根据当前模式处理并分配帧号：
+       - 屏幕模式：使用PIL截图，脏块差分或SCREEN_CODEC编码
+       - 完整帧可按切片编码并按分块对齐（FLAG_SLICED），丢包时接收端用上一帧隐藏丢失的切片
+       - 关闭切片或切片过大时，完整帧可按水平条带在线程池中多核并行编码（FLAG_STRIPED）
+       - 大分辨率完整帧可按渐进模式拆成基础层与细化层（FLAG_PROGRESSIVE），各层按切片编码，作为连续的帧先后发送
+       - 摄像头模式：使用OpenCV获取帧，CAMERA_CODEC编码
+       - 帧间编码模式（STREAM_CODEC）：两种视频源均送入H.264/VP8编码器
+    3. 发送阶段（数据传输协议见protocol.py）：
+       - 将压缩数据按MTU分块发送（每个数据报不超过BUFFER_SIZE，避免IP分片）
+       - 每个数据报带定长二进制包头：编码器ID、帧号、分块序号/总数、负载长度、分辨率、采集时间
+       - 差分帧置FLAG_DELTA标志，数据为变化图块及其坐标；
+         参考关键帧为无损编码时各图块以其旧内容为预置字典压缩（FLAG_ZDICT）
+       - 帧间编码的关键帧置FLAG_KEYFRAME标志，接收端请求时强制插入关键帧
+       - 每组数据分块后附带异或校验包，接收端可就地恢复丢失分块
+       - 可靠模式下已发送分块写入重传缓存，供反馈线程按NACK重传
+    4. 阶段间为有界队列（丢弃最旧），三个阶段并行：采集N+1帧时编码N帧、发送N-1帧；
+       已编码帧被丢弃时请求关键帧，避免接收端差分/帧间参考链断裂
+    5. 节奏控制（见pacing.py）：采集按单调时钟截止时间触发，落后时跳帧；
+       每帧数据报在帧间隔内匀速发出，并受MAX_BITRATE限制
+    6. 自适应画质（见adaptive.py）：发送阶段每帧上报各阶段耗时与字节数，
+       控制器据此调整压缩级别、画质、采集分辨率与帧率，各阶段每帧读取当前档位；
+       压缩级别另由调优器定期用实时画面试压缩各级别后选定
+    7. 降分辨率与同播（见simulcast.py）：采集后按SEND_MAX_WIDTH缩小；SIMULCAST_SCALES配置多层时，
+       编码阶段把同一帧缩放成各层分别编码（各层独立的差分参考帧、帧间编码器与帧号），
+       以流ID区分一起发送，接收端按窗口尺寸订阅其中一层
+    8. 静止检测（屏幕源，见pacing.py）：采集阶段抽样比较画面，未变化时跳过编码与发送，
+       每HEARTBEAT_INTERVAL发一个只有包头的心跳；持续静止时降到IDLE_FPS采集，检测到变化后立即恢复；
+       静止期间每MIN_REFRESH_INTERVAL仍发送一次关键帧
+    9. 区域采集（见region.py）：屏幕源只截取CAPTURE_REGIONS中的各区域，每个区域独立编码为一组流
+    10. 音画同步（见avsync.py）：采集时记录公共采集时钟，随各层各帧的包头发出，接收端据此与音频对齐
     """
+    global video_stages, frame_scheduler, quality_controller, static_detectors
     # 创建UDP socket并设置广播选项
     sock = socket(AF_INET, SOCK_DGRAM)  # IPv4 UDP socket
     sock.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)  # 启用广播（关键选项）
     IP = '255.255.255.255'  # 受限广播地址（局域网所有主机）
-
-    while sending.get():  # 主循环（根据广播状态控制）
-        try:
-            current_source = source_type.get()  # 动态获取当前视频源
-
-            # 模式切换保护：摄像头模式需要确保初始化成功
-            if current_source == 'camera' and not init_camera():
-                source_type.set('screen')  # 自动回退到屏幕模式
-                continue  # 跳过本次循环
-
-            img = get_frame()  # 获取当前帧数据
-            if img is None:  # 获取失败时短暂休眠
-                sleep(0.1)
+    regions = [CaptureRegion(spec) for spec in CAPTURE_REGIONS]  # 屏幕采集区域
+    region_layers = [make_layers(SIMULCAST_SCALES, i) for i in range(len(regions))]  # 各区域各分辨率层的编码状态
+    stream_mode = STREAM_CODEC is not None and AV_AVAILABLE
+    if STREAM_CODEC is not None and not AV_AVAILABLE:
+        print("未安装PyAV，帧间编码模式不可用，回退到帧内编码")
+    stripe_pool = make_pool(ENCODE_WORKERS)  # 并行编码线程池（None表示单线程编码）
+    controller = quality_controller = QualityController(SCREEN_FPS, MAX_BITRATE, MIN_FPS, CODEC_QUALITY)
+    tuner = LevelTuner(controller) if LEVEL_AUTOTUNE else None
+    detectors = static_detectors = [StaticDetector() for _ in regions] if STATIC_DETECTION else []
+    last_refresh = [monotonic()] * len(regions)  # 各区域上次发出画面的时间
+    last_heartbeat = list(last_refresh)  # 各区域上次发出心跳的时间
+
+    def capture():
+        """采集阶段：读取当前视频源的一帧，返回(视频源, {区域序号: 图像}, 采集时间)
+        区域画面静止且心跳到期时图像为None，静止且心跳未到期的区域不出现（摄像头只有区域0）
+        """
+        current_source = source_type.get()  # 动态获取当前视频源
+        # 模式切换保护：摄像头模式需要确保初始化成功
+        if current_source == 'camera' and not init_camera():
+            source_type.set('screen')  # 自动回退到屏幕模式
+            return None
+        images = {}
+        grabbed = False
+        captured = media_clock()  # 公共采集时钟（与音频块的采集时间可比）
+        for index, region in enumerate(regions if current_source == 'screen' else [None]):
+            try:
+                img = get_frame(region)  # 获取当前帧数据
+            except Exception as e:
+                print("视频采集异常:", e)
+                if current_source == 'camera':
+                    source_type.set('screen')  # 异常时自动切换安全模式
+                return None
+            if img is None:  # 摄像头读取失败，或跟踪的窗口最小化/已关闭
                 continue
-
-            # 统一数据处理流程（根据源类型调整参数）
+            grabbed = True
+            # 发送分辨率上限与自适应降分辨率（在采集阶段缩小，编码与传输量随之下降）
+            w, h = frame_size(img)
+            scale = controller.scale
+            if SEND_MAX_WIDTH and w * scale > SEND_MAX_WIDTH:
+                scale = SEND_MAX_WIDTH / w
+            if scale < 1:
+                img = resize_frame(img, layer_size(w, h, scale))
+            if detectors and current_source == 'screen':
+                detector = detectors[index]
+                img = np.asarray(img)  # 只转换一次数组，编码阶段直接使用
+                now = monotonic()
+                if keyframe_request.is_set():
+                    last_refresh[index] = now  # 接收端请求关键帧（如收到心跳的中途加入者）：静止也要发出
+                    detector.refresh(img)
+                elif detector.changed(img):
+                    last_refresh[index] = now
+                elif now - last_refresh[index] >= MIN_REFRESH_INTERVAL:
+                    last_refresh[index] = now  # 定期刷新：静止时也发出关键帧
+                    detector.refresh(img)
+                    keyframe_request.set()
+                elif now - last_heartbeat[index] >= HEARTBEAT_INTERVAL:
+                    last_heartbeat[index] = now
+                    img = None  # 画面静止：只发心跳
+                else:
+                    continue
+                if img is not None:
+                    last_heartbeat[index] = now  # 发出画面后心跳重新计时，静止满HEARTBEAT_INTERVAL才发心跳
+            images[index] = img
+        if not grabbed:  # 获取失败时短暂休眠
+            sleep(0.1)
+        return (current_source, images, captured) if images else None
+
+    scheduler = frame_scheduler = FrameScheduler(SCREEN_FPS)
+    pacer = PacketPacer(MAX_BITRATE, PACING_BURST * BUFFER_SIZE)
+
+    def pace():
+        """帧率控制：等待下一帧的截止时间"""
+        fps = CAMERA_FPS if source_type.get() == 'camera' else SCREEN_FPS
+        if detectors and source_type.get() == 'screen' and all(d.idle for d in detectors):
+            fps = IDLE_FPS  # 画面持续静止：降低采集帧率，检测到变化的下一帧即恢复
+        scheduler.set_fps(min(fps, controller.fps))
+        scheduler.wait()
+
+    def encode(item):
+        """编码阶段：逐层编码，返回各层的(流ID, 帧号, 编码数据, 编码器ID, 标志位, 宽, 高, 采集时间)列表"""
+        current_source, images, captured = item
+        # 接收端请求关键帧（中途加入、丢包失步或切换订阅层）：各层差分编码器丢弃参考帧，帧间编码器强制I帧
+        force_key = keyframe_request.is_set() and any(img is not None for img in images.values())
+        if force_key:
+            keyframe_request.clear()
+        encoded = []
+        for index, img in images.items():
+            layers = region_layers[index]
+            if img is None:  # 画面静止：各层发送心跳（携带最近一帧的帧号与分辨率）
+                encoded += [(layer.stream_id, layer.frame_no - 1, None, 0, FLAG_HEARTBEAT, *layer.size, captured)
+                            for layer in layers if layer.frame_no]
+                continue
+            size = frame_size(img)
+            for layer in layers:
+                layer_img = img if layer.scale >= 1 else resize_frame(img, layer_size(*size, layer.scale))
+                encoded += encode_layer(layer, current_source, layer_img, force_key, captured)
+        return encoded or None
+
+    def encode_layer(layer, current_source, img, force_key, captured):
+        """编码一层：返回[(流ID, 帧号, 编码数据, 编码器ID, 标志位, 宽, 高, 采集时间), ...]（渐进帧为基础层与各细化层）"""
+        tile_encoder = layer.tile_encoder
+        stream_encoder = layer.stream_encoder
+        quality, level = controller.quality, controller.level
+        if force_key or layer.key_pending:
+            layer.key_pending = False  # 发送阶段跳过了本层的细化层：后续差分帧在接收端无法应用
+            tile_encoder.reset()
+
+        # 统一数据处理流程（根据源类型调整参数）
+        is_key = True  # 是否为完整帧（False表示脏块差分帧）
+        flags = 0
+        if stream_mode:
+            frame = img if current_source == 'camera' else np.asarray(img)
+            h, w = frame.shape[:2]
+            h, w = h - h % 2, w - w % 2  # yuv420p要求宽高为偶数
+            frame = frame[:h, :w]
+            if stream_encoder is None or (stream_encoder.width, stream_encoder.height) != (w, h):
+                stream_encoder = layer.stream_encoder = StreamEncoder(
+                    STREAM_CODEC, w, h, bitrate=int(STREAM_BITRATE * layer.scale ** 2),
+                    gop=STREAM_GOP, preset=STREAM_PRESET)
+            im_bytes, stream_key = stream_encoder.encode(frame, force_key)
+            if not im_bytes:
+                return []  # 编码器暂未输出数据
+            codec_id = stream_encoder.codec
+            flags = FLAG_KEYFRAME if stream_key else 0
+        else:
             if current_source == 'screen':
-                w, h = img.size  # PIL图像尺寸（宽, 高）
-                # 将PIL图像转换为字节数据并压缩（使用zlib）
-                im_bytes = compress(img.tobytes())  # tobytes()获取原始像素数据
+                w, h = frame_size(img)  # 图像尺寸（宽, 高）
+                frame = np.asarray(img)  # PIL图像转为数组（H x W x 3），已是数组时不复制
+                codec = get_codec(SCREEN_CODEC)
+                if TILE_DELTA_ENABLED:
+                    # 与上一帧比较，只保留变化的图块（静态画面时数据量极小）
+                    is_key, tiles = tile_encoder.encode(frame)
             else:
+                tile_encoder.reset()  # 摄像头画面噪声大不做差分，切回屏幕时先发关键帧
                 h, w = img.shape[:2]  # OpenCV图像尺寸（高, 宽）
-                im_bytes = compress(img.tobytes())  # numpy数组直接获取字节
-
-            # 分段传输协议（解决UDP包大小限制问题）
-            # 发送开始标记（接收端用于重置缓冲区）
-            sock.sendto(b'start', (IP, 22222))
-            # 计算分块数量（ceil除法确保发送完整数据）
-            for i in range(len(im_bytes) // BUFFER_SIZE + 1):
-                # 分块发送压缩后的数据（每块最大60KB）
-                chunk = im_bytes[i * BUFFER_SIZE:(i + 1) * BUFFER_SIZE]
-                sock.sendto(chunk, (IP, 22222))
-            # 发送结束标记和分辨率信息（用于接收端重建图像）
-            # 使用_over前缀避免与数据内容冲突
-            end_marker = b'_over' + str((w, h)).encode()  # 示例：b'_over(1920,1080)'
-            sock.sendto(end_marker, (IP, 22222))
-
-            # 动态帧率控制（摄像头通常帧率低于屏幕）
-            sleep(0.1 if current_source == 'camera' else 0.04)  # 10与25FPS，考虑到损耗与丢帧，接收端一般少个3到5帧。
-        except Exception as e:
-            print("视频发送异常:", e)
-            if current_source == 'camera':
-                source_type.set('screen')  # 异常时自动切换安全模式
+                frame = img
+                codec = get_codec(CAMERA_CODEC, bgr=CAMERA_BGR)
+
+            if is_key:
+                if tuner is not None and layer.stream_id == 0 and codec.codec_id in LEVEL_CODECS:
+                    tuner.offer(frame)
+                codec_id = codec.codec_id
+                payloads = None
+                if PROGRESSIVE_ENABLED and w * h >= PROGRESSIVE_MIN_PIXELS:
+                    # 渐进细化：各层按切片编码（所有切片在工作池中并行），切片过大时按普通完整帧编码
+                    payloads = encode_progressive(stripe_pool, codec, frame, quality, level, CHUNK_PAYLOAD)
+                if payloads is not None:
+                    # 基础层与各细化层占用连续帧号，细化层可能因拥塞被跳过，不作为预置字典参考
+                    layer.reference = None
+                    layer.size = (w, h)
+                    return [(layer.stream_id, layer.next_frame_no(), payload, codec_id,
+                             FLAG_PROGRESSIVE | FLAG_SLICED | (FLAG_REFINEMENT if i else 0), w, h, captured)
+                            for i, payload in enumerate(payloads)]
+                im_bytes = None
+                if SLICE_ENABLED:
+                    # 切片容错：每个切片独立编码并从新的分块开始（可在工作池中并行编码）
+                    im_bytes = encode_slices(stripe_pool, codec, frame, quality, level, CHUNK_PAYLOAD)
+                    if im_bytes is not None:
+                        flags = FLAG_SLICED
+                if im_bytes is None and stripe_pool is not None:
+                    # 多核并行（关闭切片或切片过大时的后备）：按水平条带分段编码，每段可独立解码
+                    im_bytes = encode_stripes(stripe_pool, codec, frame, quality, ENCODE_WORKERS, level)
+                    if im_bytes is not None:
+                        flags = FLAG_STRIPED
+                if im_bytes is None:
+                    im_bytes = codec.encode(frame, quality, level)  # 帧内编码完整帧
+                # 无损关键帧在接收端逐字节还原，可作为后续差分帧的预置字典参考
+                lossless = current_source == 'screen' and TILE_DELTA_ENABLED and codec_id in LOSSLESS_CODECS
+                layer.reference = (layer.frame_no, frame) if ZDICT_ENABLED and lossless else None
+            else:
+                if tuner is not None and layer.stream_id == 0:
+                    tuner.offer(tiles)
+                flags = FLAG_DELTA
+                if layer.reference is not None:
+                    # 每个图块以参考关键帧中同位置的旧内容为字典单独压缩，只需编码变化部分
+                    im_bytes = compress_tiles_zdict(tiles, layer.reference[1], layer.reference[0], level)
+                    flags |= FLAG_ZDICT
+                else:
+                    im_bytes = compress(tiles, level)  # 差分图块使用zlib无损压缩
+                codec_id = CODEC_ZLIB
+
+        layer.size = (w, h)
+        return [(layer.stream_id, layer.next_frame_no(), im_bytes, codec_id, flags, w, h, captured)]
+
+    def send(encoded):
+        """发送阶段：各层分包后一起匀速广播并写入重传缓存，向自适应控制器上报本帧开销
+        渐进帧的细化层排在所有基础层之后发送，下一帧已编码完成时尚未开始发送的细化层整层跳过
+        """
+        start, slept = perf_counter(), pacer.slept
+        pacer.max_rate = controller.max_bitrate / 8  # 码率上限可能已按接收端报告下调
+        packets = []
+        refinement_starts = []  # 各细化层第一个数据报在packets中的位置
+        refinement_layers = []  # 各细化层所属的层
+        encoded = sorted(encoded, key=lambda item: bool(item[4] & FLAG_REFINEMENT))  # 稳定排序，细化层保持原顺序
+        for stream_id, frame_no, im_bytes, codec_id, flags, w, h, captured in encoded:
+            if im_bytes is None:
+                sock.sendto(heartbeat_packet(stream_id, frame_no, w, h), (IP, 22222))
+                continue
+            # 分段传输协议（按MTU分包，避免IP分片）
+            # 每个分块自带流ID、帧号和分辨率，接收端无需起止标记即可重组；负载为im_bytes上的视图，不复制
+            layer_packets = list(packetize(im_bytes, frame_no, w, h, CHUNK_PAYLOAD, flags, stream_id,
+                                           fec_group=FEC_GROUP_SIZE, fec_parity=FEC_PARITY,
+                                           codec=codec_id, capture=captured))
+            if RETRANSMIT_ENABLED:
+                retransmit_cache.store(stream_id, frame_no, layer_packets, monotonic())
+            if flags & FLAG_REFINEMENT:
+                refinement_starts.append(len(packets))
+                refinement_layers.append(region_layers[region_of(stream_id)][layer_of(stream_id)])
+            packets += layer_packets
+        if not packets:
+            return  # 只有心跳，不计入自适应统计
+        frames = [item for item in encoded if item[2] is not None]  # 心跳不计入编码输出
+        paced = pacer.pace(packets, scheduler.interval)  # 在帧间隔内匀速发出
+        if refinement_starts:
+            paced = skip_late(paced, refinement_starts, refinement_layers)
+        send_packets(sock, paced, (IP, 22222))
+        if ADAPTIVE_ENABLED:
+            send_time = perf_counter() - start - (pacer.slept - slept)  # 扣除限速等待，只计实际发送开销
+            controller.record(video_stages[0].avg_time, video_stages[1].avg_time, send_time,
+                              sum(len(item[2]) for item in frames), frames[0][3], 1 / scheduler.interval)
+
+    def skip_late(paced, refinement_starts, refinement_layers):
+        """下一帧已在发送队列中时停止发送剩余的细化层（整层跳过，接收端收不到其分块，不会请求重传）
+        只有心跳的队列元素不算下一帧；被跳过细化层的层下一帧改发完整帧（接收端不会应用帧号不连续的差分帧）
+        """
+        global refinements_skipped
+        for i, packet in enumerate(paced):
+            if i in refinement_starts and any(item[2] is not None
+                                              for entry in encoded_queue.peek() for item in entry):
+                skipped = refinement_layers[refinement_starts.index(i):]
+                refinements_skipped += len(skipped)
+                for layer in skipped:
+                    layer.key_pending = True
+                return
+            yield packet
+
+    def raw_dropped(dropped):
+        """采集帧未编码即被挤掉：其中判定为变化的区域已成为静止检测的比较基准，
+        清除基准使下一次采集重新判定为变化，否则该变化要等到定期刷新才会发出"""
+        for index, img in dropped[1].items():
+            if img is not None and detectors:
+                detectors[index].invalidate()
+
+    def encoded_dropped(dropped):
+        """已编码帧被挤掉：接收端差分/帧间参考链断裂，请求关键帧（被挤掉的是心跳时无影响）"""
+        if any(item[2] is not None for item in dropped):
+            keyframe_request.set()
+
+    # 组装流水线：采集 -> [有界队列] -> 编码 -> [有界队列] -> 发送
+    raw_queue = DropOldestQueue()
+    encoded_queue = DropOldestQueue()
+    video_stages = [
+        Stage('采集', capture, sending.get, outbox=raw_queue, after=pace, on_drop=raw_dropped),
+        Stage('编码', encode, sending.get, inbox=raw_queue, outbox=encoded_queue,
+              on_drop=encoded_dropped),
+        Stage('发送', send, sending.get, inbox=encoded_queue),
+    ]
+    for stage in video_stages:
+        stage.start()
+    for stage in video_stages:
+        stage.join()  # 广播停止后各阶段自然退出
 
     # 资源清理阶段（循环结束后执行）
     release_camera()  # 确保释放摄像头资源
-    sock.sendto(b'close', (IP, 22222))  # 通知接收端结束传输，关闭接收端程序
+    if stripe_pool is not None:
+        stripe_pool.shutdown()
+    sock.sendto(close_packet(), (IP, 22222))  # 通知接收端结束传输，关闭接收端程序
     sock.close()  # 关闭socket（释放系统资源）
 
 
+def recv_feedback():
+    """反馈接收线程函数
+    监听接收端单播的反馈包：NACK聚合后从重传缓存中补发丢失分块，关键帧请求通知发送线程
+    实现逻辑：
+    1. 绑定反馈端口，以聚合窗口为超时周期循环接收
+    2. NACK交给聚合器：按接收端限速，同一帧的请求合并去重
+    3. 每个聚合窗口结束时重传一次（仍走广播，所有丢包接收端同时受益）
+    4. 关键帧请求全局限速（多个接收端同时加入只触发一次关键帧）
+    5. 接收质量报告登记到接收端统计表，按最差分位丢包率周期性调整码率上限
+    """
+    sock = socket(AF_INET, SOCK_DGRAM)
+    sock.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
+    IP = '255.255.255.255'  # 受限广播地址（局域网所有主机）
+    try:
+        sock.bind(('', FEEDBACK_PORT))
+    except OSError as e:
+        print("反馈端口绑定失败:", e)
+        sock.close()
+        return
+    sock.settimeout(NACK_AGGREGATE_INTERVAL)
+    aggregator = nack_aggregator
+    last_keyframe = 0.0  # 上次受理关键帧请求的时间
+    last_rate_check = monotonic()  # 上次按报告调整码率的时间
+
+    while sending.get():
+        try:
+            packet, addr = sock.recvfrom(2048)
+            feedback = parse_feedback(packet)
+            now = monotonic()
+            if feedback is None:
+                pass  # 非本协议数据包
+            elif feedback[0] == KIND_NACK and RETRANSMIT_ENABLED:
+                aggregator.add(addr[0], *feedback[1], now)
+            elif feedback[0] == KIND_KEYFRAME and now - last_keyframe >= KEYFRAME_REQUEST_INTERVAL:
+                last_keyframe = now
+                keyframe_request.set()
+            elif feedback[0] == KIND_REPORT:
+                receiver_table.update(addr[0], feedback[1], now)
+        except timeout:
+            pass  # 超时仅用于按聚合窗口触发重传
+        except Exception as e:
+            print("反馈接收错误:", e)
+        send_packets(sock, aggregator.flush(retransmit_cache, monotonic()), (IP, 22222))
+        now = monotonic()
+        if REPORT_RATE_CONTROL and quality_controller and now - last_rate_check >= REPORT_INTERVAL:
+            last_rate_check = now
+            quality_controller.max_bitrate = receiver_table.adjust_bitrate(
+                quality_controller.max_bitrate, MAX_BITRATE, now)
+
+    sock.close()
+
+
 # ============================== 音频处理模块 ==============================
 def send_audio():
     """音频发送线程函数
     实现音频采集、压缩和广播的完整流程，独立于视频传输
     实现逻辑：
-    1. 初始化音频设备（PyAudio）
+    1. 初始化音频设备（PyAudio回调模式）：声卡每AUDIO_FRAMES_PER_BUFFER帧回调一次，
+       回调中只把样本拷进预分配的环形缓冲区（见ringbuffer.py）并记录采集时间，不阻塞；
+       发送线程跟不上时环形缓冲区满，新样本被丢弃并计溢出（声卡自身溢出同样计入）
     2. 创建音频传输socket
-    3. 循环读取音频数据块：
-       - 使用zlib压缩音频数据
-       - 通过UDP广播发送到22223端口
+    3. 环形缓冲区每攒满AUDIO_CHUNK帧取出一块：
+       - 可选降采样到AUDIO_SEND_RATE，再用AUDIO_CODEC编码（见audio_codec.py）
+       - 加上音频包头（编码器ID、声道数、采样率、样本帧数、序号、时间戳、采集时间），通过UDP广播发送到22223端口
     4. 资源安全释放：
        - 停止音频流
        - 关闭PyAudio实例
        - 关闭socket连接
     """
-    global audio_stream, audio_socket
+    global audio_stream, audio_socket, audio_ring
     IP = '255.255.255.255'  # 使用独立端口(22223)避免数据混叠
+    ring = audio_ring = RingBuffer(int(AUDIO_RING_SECONDS * RATE) * CHANNELS)
+    ready = Event()  # 回调写入新样本后置位，唤醒发送线程
+    anchor = None  # (累计写入样本数, 此时最后一个样本的采集时间)：由回调更新，发送线程据此推算每块的采集时间
+
+    def callback(in_data, frame_count, time_info, status):
+        """声卡回调（PortAudio线程）：样本拷入环形缓冲区，记录采集时间"""
+        nonlocal anchor
+        if status & pyaudio.paInputOverflow:
+            ring.overruns += 1  # 声卡输入缓冲溢出（回调被耽误）
+        ring.write(np.frombuffer(in_data, dtype=np.int16))
+        anchor = (ring.write_pos, monotonic() - latency)
+        ready.set()
+        return None, pyaudio.paContinue
 
     with audio_lock:  # 确保音频设备初始化原子性
         try:
             p = pyaudio.PyAudio()  # 创建PyAudio实例（音频设备接口）
-            # 打开音频输入流（麦克风）
+            # 打开音频输入流（麦克风），回调模式
             stream = p.open(
                 format=FORMAT,
                 channels=CHANNELS,
                 rate=RATE,
                 input=True,  # 输入模式
-                frames_per_buffer=AUDIO_CHUNK  # 每次读取的块大小
+                frames_per_buffer=AUDIO_FRAMES_PER_BUFFER,  # 每次回调交付的样本帧数
+                stream_callback=callback,
+                start=False
             )
+            latency = stream.get_input_latency()  # 输入设备延迟（采集时间扣除此值）
+            stream.start_stream()
             # 创建专用音频传输socket（与视频分开端口）
             audio_socket = socket(AF_INET, SOCK_DGRAM)
             audio_socket.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
@@ -214,15 +620,30 @@ def send_audio():
             print("音频初始化失败:", e)
             return  # 初始化失败直接返回
 
+    codec = get_audio_codec(AUDIO_CODEC)
+    send_rate = AUDIO_SEND_RATE or RATE
+    resampler = Resampler(RATE, send_rate, CHANNELS) if send_rate != RATE else None
+    seq = timestamp = 0  # 数据报序号与时间戳（send_rate下的累计样本帧数），接收端抖动缓冲据此排序与估计抖动
     print("音频传输已启动")
-    # 主采集循环（同时检测广播状态和音频开关）
+    # 主发送循环（同时检测广播状态和音频开关）
     while sending.get() and audio_enabled.get():
         try:
-            # 读取音频数据块（阻塞式读取，长度=AUDIO_CHUNK）
-            data = stream.read(AUDIO_CHUNK)
-            compressed = compress(data)  # 压缩音频数据（减少带宽）
+            ready.clear()
+            first = ring.read_pos  # 本块第一个样本的累计序号
+            samples = ring.read(AUDIO_CHUNK * CHANNELS)
+            if samples is None:
+                ready.wait(0.1)  # 还不够一块：等待下一次回调
+                continue
+            # 本块第一个样本的采集时间：按回调记录的最近样本时间倒推（与视频帧共用采集时钟）
+            written, written_time = anchor
+            captured = media_clock(written_time - (written - first) / CHANNELS / RATE)
+            if resampler is not None:
+                samples = resampler.process(samples)  # 语音降采样（减少带宽与编码耗时）
             # 发送到独立端口22223（接收端需分开处理）
-            audio_socket.sendto(compressed, (IP, 22223))
+            audio_socket.sendto(pack_audio(codec, samples, send_rate, CHANNELS, seq, timestamp, captured),
+                                (IP, 22223))
+            seq += 1
+            timestamp += samples.size // CHANNELS
         except Exception as e:
             print("音频发送错误:", e)
             break  # 发生错误退出循环
@@ -277,7 +698,7 @@ def btnStartClick():
     实现流程：
     1. 检查摄像头模式是否可用
     2. 设置广播状态为True
-    3. 启动视频发送线程
+    3. 启动视频发送线程与反馈接收线程
     4. 如果开启音频则启动音频线程
     5. 更新GUI控件状态
     """
@@ -289,6 +710,7 @@ def btnStartClick():
     sending.set(True)  # 设置广播状态标志
     # 启动视频发送线程（无参数传递）
     Thread(target=send_image).start()
+    Thread(target=recv_feedback).start()
     # 如果开启音频则启动音频线程
     if audio_enabled.get():
         Thread(target=send_audio).start()
@@ -330,6 +752,56 @@ def btnStopClick():
     status_label.config(text="状态：已停止广播", fg='red')
 
 
+def refresh_stats():
+    """定时刷新流水线统计（各阶段平均耗时与输入队列深度）与接收端汇总"""
+    if sending.get() and video_stages:
+        idle = ' | 静止' if static_detectors and all(d.idle for d in static_detectors) else ''
+        skipped = f' | 细化跳过{refinements_skipped}' if refinements_skipped else ''
+        if audio_ring is not None and audio_ring.overruns:
+            skipped += f' | 音频溢出{audio_ring.overruns}'
+        nacks = nack_aggregator
+        if nacks.nacks_received:
+            skipped += (f' | NACK{nacks.nacks_received}(限速丢弃{nacks.nacks_limited}) '
+                        f'重传{nacks.chunks_retransmitted}块(未重传{nacks.chunks_skipped})')
+        stats_label.config(text=f"{format_stats(video_stages)} | 跳帧{frame_scheduler.skipped}{skipped}{idle}")
+        adapt_label.config(text=quality_controller.describe())
+        now = monotonic()
+        loss = receiver_table.percentile('loss', now)
+        if loss is None:
+            receivers_label.config(text="接收端：暂无报告")
+        else:
+            receivers_label.config(text=f"接收端{len(receiver_table.active(now))}台 "
+                                        f"最差{100 - WORST_PERCENTILE}%丢包≥{loss:.1%} "
+                                        f"码率上限{quality_controller.max_bitrate / 1e6:.0f}Mbps")
+    root.after(1000, refresh_stats)
+
+
+def show_receivers():
+    """接收端详情窗口（表格每秒刷新，按丢包率从高到低排列）"""
+    columns = [('receiver', '接收端', 110), ('received', '收齐', 60), ('decoded', '解码', 60),
+               ('dropped', '丢弃', 50), ('recovered', '纠错恢复', 60), ('loss', '丢包率', 60), ('jitter', '抖动ms', 60),
+               ('decode_ms', '解码ms', 60), ('render_fps', '显示FPS', 60)]
+    win = Toplevel(root)
+    win.title('接收端统计')
+    tree = Treeview(win, columns=[c[0] for c in columns], show='headings', height=15)
+    for key, title, width in columns:
+        tree.heading(key, text=title)
+        tree.column(key, width=width, anchor='center')
+    tree.pack(fill='both', expand=True)
+
+    def refresh():
+        if not win.winfo_exists():
+            return
+        tree.delete(*tree.get_children())
+        for row in receiver_table.snapshot(monotonic()):
+            tree.insert('', 'end', values=(row['receiver'], row['received'], row['decoded'], row['dropped'],
+                                           row['recovered'], f"{row['loss']:.1%}", f"{row['jitter']:.1f}",
+                                           f"{row['decode_ms']:.1f}", f"{row['render_fps']:.1f}"))
+        win.after(1000, refresh)
+
+    refresh()
+
+
 # ============================== GUI布局 ==============================
 # 音频控制组件
 Checkbutton(root, text="传输麦克风音频", variable=audio_enabled,
@@ -353,13 +825,21 @@ btnStop.place(x=185, y=60, width=125, height=25)
 # 状态显示标签
 status_label = Label(root, text="状态：就绪，未广播", fg='gray')
 status_label.place(x=5, y=95)
+stats_label = Label(root, text="", fg='gray')  # 流水线统计（采集/编码/发送耗时与队列深度）
+stats_label.place(x=5, y=120)
+adapt_label = Label(root, text="", fg='gray', justify='left')  # 自适应画质档位与最近一次调整原因
+adapt_label.place(x=5, y=142)
+receivers_label = Label(root, text="", fg='gray')  # 接收端汇总（在线数、最差分位丢包率、码率上限）
+receivers_label.place(x=5, y=180)
+Button(root, text='接收端详情', command=show_receivers).place(x=230, y=93, width=90, height=22)
 
 # 作者信息（带超链接）
 url = r'https://github.com/miyinx/py-udp-Broadcast'
 lb = Label(root, text="计算机学院-miyinx", fg="blue", cursor="hand2")
-lb.place(x=110, y=120)
+lb.place(x=110, y=208)
 # 绑定点击事件（使用默认浏览器打开链接）
 lb.bind("<Button-1>", lambda e: startfile(url))
 
 # 启动GUI主事件循环
+refresh_stats()
 root.mainloop()
@@ -0,0 +1,202 @@
+# @time     : 2026/10/17 下午9:15
+"""
+自适应画质控制模块（发送端）
+主要功能：
+1. 每帧记录采集/编码/发送耗时与输出字节数（指数滑动平均）
+2. 每隔ADAPT_INTERVAL评估一次，在配置范围内逐级调整：zlib压缩级别、有损编码画质、采集分辨率缩放、目标帧率
+   - CPU超预算（最慢阶段耗时超过帧间隔的一定比例）：降低压缩级别 -> 降分辨率 -> 降帧率
+   - 码率超上限：降画质 -> 提高压缩级别（CPU有余量时）-> 降分辨率 -> 降帧率
+   - 两者都有充足余量：按相反顺序逐级恢复
+3. 每次调整记录原因，供界面实时显示
+4. 压缩级别自动调优：周期性地用实时画面样本试压缩1-9级，按耗时与输出字节数的折算代价选出最优级别
+每次评估最多调整一档，避免振荡
+"""
+
+from collections import deque
+from threading import Thread
+from time import monotonic, perf_counter
+from zlib import compress
+import numpy as np
+from video_codec import CODEC_ZLIB, CODEC_YUV420, CODEC_JPEG, CODEC_WEBP, DEFAULT_QUALITY, DEFAULT_LEVEL
+
+# ============================== 控制参数 ==============================
+ADAPT_INTERVAL = 1.0  # 评估周期（秒）
+CPU_BUDGET = 0.8  # 最慢处理阶段允许占用帧间隔的比例
+BANDWIDTH_TARGET = 0.9  # 码率目标为上限的比例（留余量给关键帧突发）
+HEADROOM = 0.5  # 耗时与码率均低于预算的该比例时才恢复画质（迟滞，避免振荡）
+EWMA_ALPHA = 0.2  # 测量值滑动平均系数
+
+QUALITY_RANGE = (40, 90)  # 有损编码画质范围
+QUALITY_STEP = 5
+LEVEL_RANGE = (1, 9)  # zlib压缩级别范围
+SCALE_RANGE = (0.5, 1.0)  # 采集分辨率缩放范围
+SCALE_STEP = 0.125
+FPS_STEP = 2
+
+LEVEL_CODECS = {CODEC_ZLIB, CODEC_YUV420}  # 压缩级别对其生效的编码器（差分帧也使用zlib）
+QUALITY_CODECS = {CODEC_JPEG, CODEC_WEBP}  # 画质对其生效的编码器
+KNOB_NAMES = {'quality': '画质', 'level': '压缩级别', 'scale': '分辨率', 'fps': '帧率'}
+
+TUNE_INTERVAL = 10.0  # 压缩级别自动调优周期（秒）
+TUNE_SAMPLE = 256 * 1024  # 每次试压缩的样本大小（字节）
+TUNE_LINK_BITRATE = 100_000_000  # 未设码率上限时折算传输耗时所用的链路速率（bps）
+
+
+def format_knob(knob, value):
+    return f'{value:.0%}' if knob == 'scale' else f'{value:g}'
+
+
+class QualityController:
+    """自适应画质控制器
+    当前档位通过quality/level/scale/fps属性读取，发送端各阶段每帧读取一次
+    参数：
+        max_fps: 帧率上限（帧率只在[min_fps, max_fps]内下调/恢复）
+        max_bitrate: 码率上限（bps），0表示不控制码率
+    """
+
+    def __init__(self, max_fps, max_bitrate, min_fps=5, quality=DEFAULT_QUALITY, level=DEFAULT_LEVEL,
+                 quality_range=QUALITY_RANGE, level_range=LEVEL_RANGE, scale_range=SCALE_RANGE,
+                 cpu_budget=CPU_BUDGET):
+        self.quality_range = quality_range
+        self.level_range = level_range
+        self.scale_range = scale_range
+        self.fps_range = (min_fps, max_fps)
+        self.max_bitrate = max_bitrate
+        self.cpu_budget = cpu_budget
+        # 当前档位
+        self.quality = quality
+        self.level = level
+        self.scale = scale_range[1]
+        self.fps = max_fps
+        # 测量值（秒/字节，滑动平均）
+        self.capture_time = 0.0
+        self.encode_time = 0.0
+        self.send_time = 0.0
+        self.frame_bytes = 0.0
+        self.actual_fps = max_fps  # 实际目标帧率（受视频源帧率上限影响，可能低于fps档位）
+        self.codecs = set()  # 评估周期内出现过的编码器ID
+        self.last_eval = monotonic()
+        self.decisions = deque(maxlen=20)  # 最近的调整记录（原因：档位变化）
+
+    def record(self, capture_time, encode_time, send_time, nbytes, codec, fps):
+        """记录一帧的测量值（发送阶段每帧调用）
+        参数：
+            capture_time/encode_time/send_time: 各阶段耗时（秒，发送耗时不含限速等待）
+            nbytes: 编码输出字节数
+            codec: 编码器ID
+            fps: 当前实际目标帧率
+        """
+        a = EWMA_ALPHA
+        self.capture_time += (capture_time - self.capture_time) * a
+        self.encode_time += (encode_time - self.encode_time) * a
+        self.send_time += (send_time - self.send_time) * a
+        self.frame_bytes += (nbytes - self.frame_bytes) * a
+        self.codecs.add(codec)
+        self.actual_fps = fps
+        now = monotonic()
+        if now - self.last_eval >= ADAPT_INTERVAL:
+            self.last_eval = now
+            self.evaluate()
+            self.codecs.clear()
+
+    @property
+    def bitrate(self):
+        """估算码率（bps）"""
+        return self.frame_bytes * 8 * self.actual_fps
+
+    def evaluate(self):
+        """按测量值调整一档"""
+        budget = self.cpu_budget / self.actual_fps
+        busy = max(self.capture_time, self.encode_time, self.send_time)
+        target = self.max_bitrate * BANDWIDTH_TARGET
+        has_level = bool(self.codecs & LEVEL_CODECS)
+        has_quality = bool(self.codecs & QUALITY_CODECS)
+
+        if busy > budget:
+            reason = f'CPU超预算({busy * 1000:.0f}ms>{budget * 1000:.0f}ms)'
+            steps = [('level', -1)] if has_level else []
+            steps += [('scale', -SCALE_STEP), ('fps', -FPS_STEP)]
+        elif target and self.bitrate > target:
+            reason = f'码率超限({self.bitrate / 1e6:.1f}Mbps)'
+            steps = [('quality', -QUALITY_STEP)] if has_quality else []
+            if has_level and busy < budget * HEADROOM:
+                steps.append(('level', 1))
+            steps += [('scale', -SCALE_STEP), ('fps', -FPS_STEP)]
+        elif busy < budget * HEADROOM and (not target or self.bitrate < target * HEADROOM):
+            reason = '资源充足'
+            steps = [('fps', FPS_STEP), ('scale', SCALE_STEP)]
+            if has_quality:
+                steps.append(('quality', QUALITY_STEP))
+        else:
+            return
+
+        for knob, delta in steps:
+            if self.step(knob, delta, reason):
+                break
+
+    def step(self, knob, delta, reason):
+        """把某个档位调整delta（限制在范围内），发生变化时记录并返回True"""
+        low, high = {'quality': self.quality_range, 'level': self.level_range,
+                     'scale': self.scale_range, 'fps': self.fps_range}[knob]
+        old = getattr(self, knob)
+        new = min(high, max(low, old + delta))
+        if new == old:
+            return False
+        setattr(self, knob, new)
+        self.decisions.append(f'{reason}：{KNOB_NAMES[knob]} {format_knob(knob, old)}→{format_knob(knob, new)}')
+        return True
+
+    def describe(self):
+        """当前档位与最近一次调整原因（界面显示）"""
+        text = f'画质{self.quality} 级别{self.level} 分辨率{self.scale:.0%} {self.fps:g}FPS'
+        if self.decisions:
+            text += f'\n{self.decisions[-1]}'
+        return text
+
+
+class LevelTuner:
+    """zlib压缩级别自动调优
+    周期性地在后台线程用当前画面样本依次试压缩各级别（zlib压缩释放GIL，不阻塞编码阶段），
+    代价 = 压缩耗时(ms) + 输出字节数 / 每毫秒可发送字节数：多花1ms CPU换来的字节减少
+    是否值得，由当前码率上限决定（带宽紧张时偏向高级别，带宽充裕时偏向低级别）
+    选出的级别写入控制器，之后仍由控制器按CPU/码率预算逐档微调
+    """
+
+    def __init__(self, controller, interval=TUNE_INTERVAL, sample_size=TUNE_SAMPLE):
+        self.controller = controller
+        self.interval = interval
+        self.sample_size = sample_size
+        self.last_tune = monotonic()
+        self.running = False
+        self.results = []  # 最近一次调优结果：(级别, 输出字节数, 耗时ms)
+
+    def offer(self, data):
+        """编码阶段每帧调用（data为画面数组或待压缩的字节），到期时取样并在后台线程调优"""
+        now = monotonic()
+        if self.running or now - self.last_tune < self.interval:
+            return
+        if isinstance(data, np.ndarray):
+            rows = max(1, self.sample_size // (data[0].size or 1))
+            top = max(0, (len(data) - rows) // 2)
+            sample = data[top:top + rows].tobytes()  # 取画面中部若干行
+        else:
+            sample = bytes(data[:self.sample_size])
+        self.last_tune = now
+        self.running = True
+        Thread(target=self.tune, args=(sample,), daemon=True, name='level-tuner').start()
+
+    def tune(self, sample):
+        """试压缩各级别并选出代价最小的级别"""
+        try:
+            low, high = self.controller.level_range
+            results = []
+            for level in range(low, high + 1):
+                start = perf_counter()
+                size = len(compress(sample, level))
+                results.append((level, size, (perf_counter() - start) * 1000))
+            bytes_per_ms = (self.controller.max_bitrate or TUNE_LINK_BITRATE) / 8 / 1000
+            best = min(results, key=lambda r: r[2] + r[1] / bytes_per_ms)[0]
+            self.results = results
+            self.controller.step('level', best - self.controller.level, '自动调优')
+        finally:
+            self.running = False
@@ -0,0 +1,289 @@
+# @time     : 2026/10/18 上午1:05
+"""
+音频编解码模块（发送端与接收端共用）
+主要功能：
+1. 可插拔音频编解码器（16位PCM输入输出，NumPy向量化）：
+   - PCM：不压缩
+   - zlib：原始PCM + zlib（旧版方式，音频几乎压不动）
+   - G.711 μ律：每个样本查表压成8位（2:1）
+   - IMA-ADPCM：每个样本4位（含块头约3.2:1），按固定长度分块，各块独立预测，跨块向量化编解码；
+     逐样本循环的CPU开销为zlib的5~10倍（编解码每秒音频约25~45ms），发送端默认使用μ律，ADPCM按需开启
+2. 流式重采样：发送端可先降到16/22.05kHz（语音足够）再编码，接收端升回播放采样率
+3. 音频数据报包头：编码器ID、声道数、采样率与样本帧数，接收端据此选择解码器；
+   序号与时间戳（发送采样率下的累计样本帧数）供接收端抖动缓冲排序、丢包检测与抖动估计；
+   采集时间（与视频帧共用的公共采集时钟，见avsync.py）供接收端音画同步
+"""
+
+from collections import namedtuple
+from struct import Struct, error as StructError
+from zlib import compress, decompress
+import numpy as np
+
+# ============================== 编码参数 ==============================
+AUDIO_MAGIC = b'UA'  # 音频数据报魔数
+AUDIO_VERSION = 3  # 音频包头版本号（格式变化时递增）
+# 音频包头（网络字节序，共19字节）：魔数(2s) 版本(B) 编码器ID(B) 声道数(B) 采样率(H) 样本帧数(H) 序号(H) 时间戳(I)
+# 采集时间(I，毫秒)
+AUDIO_HEADER = Struct('!2sBBBHHHII')
+AUDIO_SEQ_MOD = 1 << 16  # 音频序号回绕模数
+AUDIO_TS_MOD = 1 << 32  # 时间戳回绕模数
+
+AudioPacket = namedtuple('AudioPacket', 'seq timestamp capture rate channels samples')
+
+# 编码器ID（写入音频包头，接收端据此选择解码器）
+AUDIO_PCM = 0  # 16位PCM，不压缩
+AUDIO_ZLIB = 1  # 16位PCM + zlib（v1.6原方式）
+AUDIO_ULAW = 2  # G.711 μ律（8位/样本）
+AUDIO_ADPCM = 3  # IMA-ADPCM（4位/样本 + 每块4字节头）
+
+ADPCM_BLOCK = 32  # ADPCM每块样本数（块越短可并行的块越多、编解码越快，块头开销越大：32为3.2:1，64为3.6:1且耗时翻倍）
+RESAMPLE_TAPS = 31  # 降采样抗混叠低通滤波器的抽头数
+
+# G.711 μ律常量
+ULAW_BIAS = 0x84
+ULAW_CLIP = 32635
+
+# IMA-ADPCM量化步长表与步长索引调整表
+ADPCM_STEPS = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88,
+    97, 107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658,
+    724, 796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660,
+    4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818,
+    18500, 20350, 22385, 24623, 27086, 29794, 32767], dtype=np.int32)
+ADPCM_INDEX_ADJUST = np.array([-1, -1, -1, -1, 2, 4, 6, 8], dtype=np.int32)  # 按3位幅度码调整步长索引
+ADPCM_BLOCK_HEADER = np.dtype([('predictor', '>i2'), ('index', 'u1'), ('reserved', 'u1')])  # 每块的初始状态
+
+
+# ============================== 编解码器 ==============================
+class PcmCodec:
+    """16位PCM，不压缩（编解码几乎无开销，带宽最大）"""
+    codec_id = AUDIO_PCM
+
+    def encode(self, samples, channels=1):
+        """编码交错排列的int16样本数组，返回字节"""
+        return samples.astype('<i2', copy=False).tobytes()
+
+    def decode(self, data, frames, channels=1):
+        """解码为int16样本数组（交错排列，frames x channels个样本）"""
+        samples = np.frombuffer(data, dtype='<i2')
+        if samples.size != frames * channels:
+            raise ValueError('数据长度与样本数不符')
+        return samples.astype(np.int16)
+
+
+class ZlibAudioCodec(PcmCodec):
+    """16位PCM + zlib（v1.6原方式，保留用于对比）"""
+    codec_id = AUDIO_ZLIB
+
+    def encode(self, samples, channels=1):
+        return compress(super().encode(samples, channels))
+
+    def decode(self, data, frames, channels=1):
+        return super().decode(decompress(data), frames, channels)
+
+
+def _build_ulaw_tables():
+    """生成μ律编码表（按int16的位模式索引，65536项）与解码表（256项）"""
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), ULAW_CLIP) + ULAW_BIAS
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    encode = (~(sign | exponent << 4 | mantissa) & 0xFF).astype(np.uint8)
+
+    code = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (code >> 4) & 0x07
+    value = (((code & 0x0F) << 3) + ULAW_BIAS << exponent) - ULAW_BIAS
+    decode = np.where(code & 0x80, -value, value).astype(np.int16)
+    return encode, decode
+
+
+class UlawCodec:
+    """G.711 μ律（对数量化，每个样本8位，编解码均为一次查表）"""
+    codec_id = AUDIO_ULAW
+    encode_table, decode_table = _build_ulaw_tables()
+
+    def encode(self, samples, channels=1):
+        return self.encode_table[samples.astype(np.int16, copy=False).view(np.uint16)].tobytes()
+
+    def decode(self, data, frames, channels=1):
+        codes = np.frombuffer(data, dtype=np.uint8)
+        if codes.size != frames * channels:
+            raise ValueError('数据长度与样本数不符')
+        return self.decode_table[codes]
+
+
+# ADPCM查找表，按[步长索引, 4位码]索引（4位码 = 符号位 << 3 | 3位幅度码）：
+# 预测值增量（标准IMA解码公式，带符号，编码端据此同步重建预测值）与下一个步长索引
+_steps = ADPCM_STEPS[:, None]
+_codes = np.arange(16)[None, :]
+_vpdiff = ((_steps >> 3) + (_codes >> 2 & 1) * _steps + (_codes >> 1 & 1) * (_steps >> 1)
+           + (_codes & 1) * (_steps >> 2))
+ADPCM_DELTA = np.where(_codes & 8, -_vpdiff, _vpdiff).astype(np.int32)
+ADPCM_NEXT_INDEX = np.clip(np.arange(89)[:, None] + ADPCM_INDEX_ADJUST[_codes & 7], 0, 88).astype(np.int32)
+del _steps, _codes, _vpdiff
+
+
+class AdpcmCodec:
+    """IMA-ADPCM（每个样本4位）
+    预测值依赖前一个样本，单个块内只能逐样本计算；因此把各声道切成ADPCM_BLOCK个样本一块，
+    每块带初始预测值与步长索引、互相独立，逐样本位置循环、每次用NumPy同时处理所有块
+    （每步只有几次查表与整数运算，步长计算、索引调整、增量正负号都预先做成查找表）
+    负载格式：各块的块头(预测值2字节 + 步长索引1字节 + 保留1字节)依次排列，之后为各块的4位码（两个一字节，低4位在前）
+    """
+    codec_id = AUDIO_ADPCM
+
+    def __init__(self, block=ADPCM_BLOCK):
+        self.block = block
+
+    def _blocks(self, frames):
+        """每个声道的块数"""
+        return -(-frames // self.block)
+
+    def encode(self, samples, channels=1):
+        frames = samples.size // channels
+        per_channel = self._blocks(frames)
+        planar = np.zeros((channels, per_channel * self.block), dtype=np.int32)
+        planar[:, :frames] = samples.reshape(frames, channels).T
+        if frames:
+            planar[:, frames:] = planar[:, frames - 1:frames]  # 末块用最后一个样本补齐（避免补零产生跳变）
+        blocks = planar.reshape(channels * per_channel, self.block)
+
+        predictor = blocks[:, 0].copy()  # 每块以首个样本为初始预测值，首个样本无需量化
+        # 初始步长索引按本块相邻样本差的平均幅度估计（编码端已知整块，省去每块开头的步长自适应过程）
+        spread = np.abs(np.diff(blocks, axis=1)).mean(axis=1)
+        index = np.minimum(np.searchsorted(ADPCM_STEPS, spread), 88).astype(np.int32)
+        header = np.empty(len(blocks), dtype=ADPCM_BLOCK_HEADER)
+        header['predictor'] = predictor
+        header['index'] = index
+        header['reserved'] = 0
+
+        columns = np.ascontiguousarray(blocks.T)  # 按样本位置取各块（行连续）
+        codes = np.zeros_like(columns, dtype=np.uint8)
+        for i in range(1, self.block):
+            diff = columns[i] - predictor
+            code = np.minimum((np.abs(diff) << 2) // ADPCM_STEPS[index], 7)
+            code |= (diff < 0) << 3
+            predictor += ADPCM_DELTA[index, code]
+            np.minimum(predictor, 32767, out=predictor)  # 小数组上minimum/maximum比clip快得多
+            np.maximum(predictor, -32768, out=predictor)
+            index = ADPCM_NEXT_INDEX[index, code]
+            codes[i] = code
+        codes = codes.T
+        packed = codes[:, 0::2] | codes[:, 1::2] << 4
+        return header.tobytes() + packed.tobytes()
+
+    def decode(self, data, frames, channels=1):
+        per_channel = self._blocks(frames)
+        count = channels * per_channel
+        header_size = count * ADPCM_BLOCK_HEADER.itemsize
+        if len(data) != header_size + count * self.block // 2:
+            raise ValueError('数据长度与样本数不符')
+        header = np.frombuffer(data, dtype=ADPCM_BLOCK_HEADER, count=count)
+        packed = np.frombuffer(data, dtype=np.uint8, offset=header_size).reshape(count, self.block // 2)
+        codes = np.empty((self.block, count), dtype=np.intp)  # 按样本位置取各块（行连续）
+        codes[0::2] = (packed & 0x0F).T
+        codes[1::2] = (packed >> 4).T
+
+        predictor = header['predictor'].astype(np.int32)
+        index = np.minimum(header['index'], 88).astype(np.intp)
+        out = np.empty((self.block, count), dtype=np.int32)
+        out[0] = predictor
+        for i in range(1, self.block):
+            predictor += ADPCM_DELTA[index, codes[i]]
+            np.minimum(predictor, 32767, out=predictor)
+            np.maximum(predictor, -32768, out=predictor)
+            index = ADPCM_NEXT_INDEX[index, codes[i]]
+            out[i] = predictor
+        planar = out.T.reshape(channels, per_channel * self.block)[:, :frames]
+        return np.ascontiguousarray(planar.T, dtype=np.int16).reshape(-1)
+
+
+# 编码器注册表：ID -> 编码器实例
+AUDIO_CODECS = {
+    AUDIO_PCM: PcmCodec(),
+    AUDIO_ZLIB: ZlibAudioCodec(),
+    AUDIO_ULAW: UlawCodec(),
+    AUDIO_ADPCM: AdpcmCodec(),
+}
+AUDIO_CODEC_NAMES = {'pcm': AUDIO_PCM, 'zlib': AUDIO_ZLIB, 'ulaw': AUDIO_ULAW, 'adpcm': AUDIO_ADPCM}
+
+
+def get_audio_codec(codec):
+    """按ID或名称（'pcm'/'zlib'/'ulaw'/'adpcm'）获取音频编码器"""
+    if isinstance(codec, str):
+        codec = AUDIO_CODEC_NAMES[codec]
+    return AUDIO_CODECS[codec]
+
+
+# ============================== 音频数据报 ==============================
+def pack_audio(codec, samples, rate, channels=1, seq=0, timestamp=0, capture=0):
+    """编码一块音频并加上包头
+    参数：
+        codec: 音频编码器（get_audio_codec的返回值）
+        samples: 交错排列的int16样本数组
+        rate: samples的采样率（Hz）
+        seq: 数据报序号（每块加1，自动回绕）
+        timestamp: 本块第一个样本的时间戳（rate采样率下的累计样本帧数，自动回绕）
+        capture: 本块第一个样本的采集时间（avsync.media_clock的值）
+    """
+    frames = samples.size // channels
+    return (AUDIO_HEADER.pack(AUDIO_MAGIC, AUDIO_VERSION, codec.codec_id, channels, rate, frames,
+                              seq % AUDIO_SEQ_MOD, timestamp % AUDIO_TS_MOD, capture)
+            + codec.encode(samples, channels))
+
+
+def unpack_audio(packet):
+    """解析并解码音频数据报
+    返回：AudioPacket(序号, 时间戳, 采集时间, 采样率, 声道数, int16样本数组)；包头不符或编码器未知时返回None，数据损坏时抛出异常
+    """
+    try:
+        magic, version, codec, channels, rate, frames, seq, timestamp, capture = AUDIO_HEADER.unpack_from(packet, 0)
+    except StructError:
+        return None
+    if magic != AUDIO_MAGIC or version != AUDIO_VERSION or codec not in AUDIO_CODECS:
+        return None
+    data = memoryview(packet)[AUDIO_HEADER.size:]
+    return AudioPacket(seq, timestamp, capture, rate, channels, AUDIO_CODECS[codec].decode(data, frames, channels))
+
+
+# ============================== 重采样 ==============================
+class Resampler:
+    """流式重采样器（逐块调用，块边界连续无跳变）
+    降采样时先用加窗sinc低通滤波（抗混叠），再按采样率之比线性插值；升采样只做线性插值
+    """
+
+    def __init__(self, src_rate, dst_rate, channels=1, taps=RESAMPLE_TAPS):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.channels = channels
+        self.ratio = src_rate / dst_rate  # 输出样本在输入中的间隔
+        self.kernel = None
+        if dst_rate < src_rate:
+            n = np.arange(taps) - (taps - 1) / 2
+            cutoff = 0.45 * dst_rate / src_rate  # 截止频率（相对输入采样率），略低于输出奈奎斯特频率
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+            self.kernel = (kernel / kernel.sum()).astype(np.float32)
+            self.history = np.zeros((taps - 1, channels), dtype=np.float32)  # 滤波器延迟线
+        self.position = 0.0  # 下一个输出样本在本块输入中的位置（-1表示上一块的最后一个样本）
+        self.last = np.zeros(channels, dtype=np.float32)  # 上一块的最后一个样本
+
+    def process(self, samples):
+        """重采样一块交错排列的int16样本，返回int16样本数组"""
+        x = samples.reshape(-1, self.channels).astype(np.float32)
+        n = len(x)
+        if n == 0:
+            return samples
+        if self.kernel is not None:
+            buf = np.concatenate([self.history, x])
+            self.history = buf[n:]
+            x = np.stack([np.convolve(buf[:, c], self.kernel, 'valid') for c in range(self.channels)], axis=1)
+        count = max(0, int((n - 1 - self.position) // self.ratio) + 1)
+        t = self.position + np.arange(count) * self.ratio
+        grid = np.arange(-1, n)
+        out = np.empty((count, self.channels), dtype=np.float32)
+        for c in range(self.channels):
+            out[:, c] = np.interp(t, grid, np.concatenate([self.last[c:c + 1], x[:, c]]))
+        self.position += count * self.ratio - n
+        self.last = x[-1].copy()
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16).reshape(-1)
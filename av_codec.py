@@ -0,0 +1,97 @@
+# @time     : 2026/10/17 下午4:05
+"""
+帧间视频编码模块（可选，依赖PyAV）
+主要功能：
+1. 发送端：H.264/VP8软件编码器，可配置GOP、码率与预设，支持按需插入关键帧
+2. 接收端：对应的解码器，必须按帧号顺序逐帧解码
+未安装PyAV时AV_AVAILABLE为False，发送端回退到帧内编码
+"""
+
+from fractions import Fraction
+from video_codec import CODEC_H264, CODEC_VP8
+
+try:
+    import av
+except ImportError:  # PyAV为可选依赖
+    av = None
+
+AV_AVAILABLE = av is not None
+
+if AV_AVAILABLE:
+    try:
+        from av.video.frame import PictureType
+        PICT_TYPE_I = PictureType.I  # PyAV 13+ 使用枚举
+    except ImportError:
+        PICT_TYPE_I = 'I'
+
+# ============================== 编码器配置 ==============================
+# 编码器ID -> (编码器名, 解码器名)
+STREAM_CODECS = {
+    CODEC_H264: ('libx264', 'h264'),
+    CODEC_VP8: ('libvpx', 'vp8'),
+}
+STREAM_CODEC_NAMES = {'h264': CODEC_H264, 'vp8': CODEC_VP8}
+
+DEFAULT_BITRATE = 4_000_000  # 默认码率（bps）
+DEFAULT_GOP = 50  # 默认关键帧间隔（帧），25FPS下约2秒
+DEFAULT_PRESET = 'ultrafast'  # x264预设（速度优先）
+
+
+# ============================== 发送端编码器 ==============================
+class StreamEncoder:
+    """帧间编码器（发送端）
+    实现特点：
+    - 零延迟配置（无B帧、无前瞻），每输入一帧立即输出对应数据，适配逐帧分包传输
+    - 周期关键帧由GOP控制，接收端请求时可强制插入关键帧
+    """
+
+    def __init__(self, codec, width, height, fps=25, bitrate=DEFAULT_BITRATE,
+                 gop=DEFAULT_GOP, preset=DEFAULT_PRESET):
+        if isinstance(codec, str):
+            codec = STREAM_CODEC_NAMES[codec]
+        self.codec = codec
+        self.width = width
+        self.height = height
+
+        ctx = av.CodecContext.create(STREAM_CODECS[codec][0], 'w')
+        ctx.width = width
+        ctx.height = height
+        ctx.pix_fmt = 'yuv420p'
+        ctx.time_base = Fraction(1, fps)
+        ctx.framerate = Fraction(fps, 1)
+        ctx.bit_rate = bitrate
+        ctx.gop_size = gop
+        if codec == CODEC_H264:
+            ctx.options = {'preset': preset, 'tune': 'zerolatency'}
+        else:
+            ctx.options = {'deadline': 'realtime', 'cpu-used': '8', 'lag-in-frames': '0'}
+        self.ctx = ctx
+        self.pts = 0
+
+    def encode(self, frame, force_key=False):
+        """编码一帧
+        参数：
+            frame: RGB图像数组（H x W x 3，uint8，宽高需为偶数）
+            force_key: 是否强制编码为关键帧
+        返回：(编码数据, 是否关键帧)；编码器暂未输出时数据为b''
+        """
+        video_frame = av.VideoFrame.from_ndarray(frame, format='rgb24').reformat(format='yuv420p')
+        video_frame.pts = self.pts
+        self.pts += 1
+        if force_key:
+            video_frame.pict_type = PICT_TYPE_I
+        packets = self.ctx.encode(video_frame)
+        return b''.join(bytes(p) for p in packets), any(p.is_keyframe for p in packets)
+
+
+# ============================== 接收端解码器 ==============================
+class StreamDecoder:
+    """帧间解码器（接收端），数据必须按发送顺序送入"""
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.ctx = av.CodecContext.create(STREAM_CODECS[codec][1], 'r')
+
+    def decode(self, data):
+        """解码一帧数据，返回RGB数组列表（可写，通常只有一帧）"""
+        return [f.to_ndarray(format='rgb24') for f in self.ctx.decode(av.Packet(data))]
@@ -0,0 +1,108 @@
+# @time     : 2026/10/18 上午2:10
+"""
+音画同步模块（发送端与接收端共用）
+主要功能：
+1. 公共采集时钟：发送端视频帧与音频块都用同一单调时钟记录采集时间（毫秒，32位回绕），随各自包头传输
+2. 音频播放时钟（接收端）：播放线程每写出一块音频，记录该块采集时间对应的本地播放时间，
+   得到“采集时间 -> 本地播放时间”的映射（平滑后作为主时钟）
+3. 视频对齐（接收端）：每帧显示前按其采集时间换算出应显示的本地时间，
+   早于音频超过容差时等待，晚于音频超过容差且已有更新的帧待处理时跳过显示；统计当前音画偏差
+没有音频（音频未开启或播放时钟过期）时视频不做同步，照常尽快显示
+"""
+
+from threading import Lock
+from time import monotonic
+
+# ============================== 同步参数 ==============================
+CLOCK_MOD = 1 << 32  # 采集时钟取值范围（毫秒，32位回绕，约49.7天）
+AV_SYNC_TOLERANCE = 0.04  # 音画偏差容差（秒），容差内直接显示（唇音同步一般要求在±45ms内）
+AV_MAX_HOLD = 0.5  # 视频单帧最长等待时间（秒），防止时钟异常时画面长时间冻结
+AUDIO_CLOCK_TIMEOUT = 1.0  # 超过此时间没有播放音频时播放时钟失效（秒）
+CLOCK_SMOOTHING = 0.1  # 播放时钟平滑系数（吸收声卡写入阻塞的抖动）
+CLOCK_RESYNC = 0.2  # 播放时间与预测相差超过此值（秒）时直接重新对齐（缓冲重建、丢块收缩等）
+SKEW_SMOOTHING = 0.1  # 音画偏差统计的平滑系数
+
+
+def media_clock(now=None):
+    """公共采集时钟：单调时钟的毫秒数（32位回绕），now为time.monotonic()的值，省略时取当前时间"""
+    return int((monotonic() if now is None else now) * 1000) % CLOCK_MOD
+
+
+def clock_diff(a, b):
+    """采集时间a - b（毫秒，处理32位回绕）"""
+    return (a - b + CLOCK_MOD // 2) % CLOCK_MOD - CLOCK_MOD // 2
+
+
+class AVSync:
+    """接收端音画同步器（播放线程更新音频时钟，解码线程查询视频帧的显示时间）"""
+
+    def __init__(self, tolerance=AV_SYNC_TOLERANCE, max_hold=AV_MAX_HOLD):
+        self.tolerance = tolerance
+        self.max_hold = max_hold
+        self.lock = Lock()
+        self.anchor = None  # (采集时间ms, 本地播放时间)：最近播放的音频块
+        self.updated = 0.0  # 音频时钟最近更新的时间
+        # 统计
+        self.skew = None  # 音画偏差（秒，平滑；正值表示视频落后于音频）
+        self.frames_held = 0  # 因早于音频而等待后显示的帧数
+        self.frames_dropped = 0  # 因晚于音频而跳过显示的帧数
+
+    # ============================== 音频时钟 ==============================
+    def audio_played(self, capture, play_time, now):
+        """记录一块音频的播放
+        参数：
+            capture: 该块第一个样本的采集时间（毫秒，发送端media_clock）
+            play_time: 该块第一个样本在本地实际发声的时间（time.monotonic()时间轴）
+            now: 当前时间
+        """
+        with self.lock:
+            if self.active(now):
+                predicted = self._play_time(capture)
+                error = play_time - predicted
+                if abs(error) < CLOCK_RESYNC:
+                    play_time = predicted + error * CLOCK_SMOOTHING
+            self.anchor = (capture, play_time)
+            self.updated = now
+
+    def _play_time(self, capture):
+        anchor_capture, anchor_time = self.anchor
+        return anchor_time + clock_diff(capture, anchor_capture) / 1000
+
+    def active(self, now):
+        """音频播放时钟是否有效（最近在播放音频）"""
+        return self.anchor is not None and now - self.updated <= AUDIO_CLOCK_TIMEOUT
+
+    def present_time(self, capture, now):
+        """采集时间为capture的视频帧应显示的本地时间（与同一时刻采集的音频一起）；音频时钟无效时返回None"""
+        with self.lock:
+            return self._play_time(capture) if self.active(now) else None
+
+    # ============================== 视频对齐 ==============================
+    def schedule(self, capture, now, newer_pending=False):
+        """决定一帧视频何时显示
+        参数：
+            capture: 帧的采集时间（毫秒）
+            newer_pending: 是否已有更新的帧等待处理（只有这时才跳过晚到的帧，否则画面会一直不更新）
+        返回：需要等待的秒数（0表示立即显示）；None表示跳过本帧的显示
+        """
+        due = self.present_time(capture, now)
+        if due is None:
+            return 0.0
+        wait = due - now
+        if wait > self.tolerance:
+            self.frames_held += 1
+            return min(wait, self.max_hold)
+        if wait < -self.tolerance and newer_pending:
+            self.frames_dropped += 1
+            self.record(-wait)
+            return None
+        return 0.0
+
+    def shown(self, capture, now):
+        """记录一帧实际显示的时间，更新音画偏差"""
+        due = self.present_time(capture, now)
+        if due is not None:
+            self.record(now - due)
+
+    def record(self, skew):
+        self.skew = skew if self.skew is None else self.skew + (skew - self.skew) * SKEW_SMOOTHING
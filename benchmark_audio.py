@@ -0,0 +1,72 @@
+# @time     : 2026/10/18 上午1:12
+"""
+音频编码基准测试（离线，不收发数据报）
+用合成的类语音信号（带谐波的基音 + 共振峰调制 + 少量噪声，音节间有停顿）逐块编码/解码，对比各编码器与采样率：
+- 编码、解码每秒音频的CPU耗时（含降采样）
+- 每秒数据量（含音频包头）
+- 解码后相对编码器输入的信噪比
+用法：python benchmark_audio.py [秒数]
+"""
+
+import sys
+from time import process_time
+import numpy as np
+from audio_codec import AUDIO_CODEC_NAMES, get_audio_codec, pack_audio, unpack_audio, Resampler
+
+RATE = 44100  # 采集采样率（与发送端一致）
+CHUNK = 1024  # 每块样本数（与发送端一致）
+SEND_RATES = (44100, 22050, 16000)  # 测试的发送采样率
+
+
+def synthesize(seconds, rate=RATE):
+    """合成类语音测试信号（int16）"""
+    rng = np.random.default_rng(1)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)  # 缓慢变化的基音
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))  # 谐波
+    voice *= 0.6 + 0.4 * np.sin(2 * np.pi * 3.1 * t)  # 共振峰/音节包络
+    voice *= (np.sin(2 * np.pi * 1.3 * t) > -0.5)  # 音节间停顿
+    signal = 0.35 * voice / np.abs(voice).max() + 0.005 * rng.standard_normal(t.size)
+    return np.clip(signal * 32767, -32768, 32767).astype(np.int16)
+
+
+def snr(reference, decoded):
+    """信噪比（dB），无损时返回inf"""
+    noise = np.sum((reference.astype(np.float64) - decoded) ** 2)
+    return 10 * np.log10(np.sum(reference.astype(np.float64) ** 2) / noise) if noise else float('inf')
+
+
+def run(name, send_rate, signal):
+    codec = get_audio_codec(name)
+    resampler = Resampler(RATE, send_rate) if send_rate != RATE else None
+    seconds = signal.size / RATE
+    packets, inputs = [], []
+    cpu = process_time()
+    for start in range(0, signal.size - CHUNK + 1, CHUNK):
+        samples = signal[start:start + CHUNK]
+        if resampler is not None:
+            samples = resampler.process(samples)
+        inputs.append(samples)
+        packets.append(pack_audio(codec, samples, send_rate))
+    encode = process_time() - cpu
+    cpu = process_time()
+    outputs = [unpack_audio(packet).samples for packet in packets]
+    decode = process_time() - cpu
+    size = sum(len(packet) for packet in packets)
+    print(f"{name:>5} @ {send_rate / 1000:4.1f}kHz: 编码 {encode / seconds * 1000:6.2f}ms/秒，"
+          f"解码 {decode / seconds * 1000:6.2f}ms/秒，{size / seconds * 8 / 1000:7.1f}kbps，"
+          f"信噪比 {snr(np.concatenate(inputs), np.concatenate(outputs)):5.1f}dB")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    signal = synthesize(seconds)
+    print(f"类语音信号 {seconds:g} 秒，采集 {RATE}Hz 单声道16位，每块 {CHUNK} 个样本")
+    for send_rate in SEND_RATES:
+        for name in AUDIO_CODEC_NAMES:
+            run(name, send_rate, signal)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# @time     : 2026/10/17 下午8:05
+"""
+分包大小基准测试（本机回环 + 模拟丢包）
+对比旧版60KB数据报与MTU大小（1400字节）数据报：
+- 发送速率（数据报/秒）与每帧CPU耗时（发送端分包发送 + 接收端重组，同一进程内统计）
+- 模拟丢包下的整帧送达率
+回环接口MTU为64KB，不会真的分片，因此按以太网分片规则模拟丢包：
+大数据报在IP层被拆成ceil(长度/1480)个分片，每个分片独立以LOSS_RATE丢失，丢任一分片整个数据报作废
+用法：python benchmark_packetize.py [丢包率] [帧数]
+"""
+
+import sys
+import random
+from socket import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+from threading import Thread, Event
+from time import perf_counter, process_time, sleep
+from fec import FEC_HEADER
+from protocol import HEADER, packetize, send_packets, parse_header, FrameReassembler
+
+FRAME_SIZE = 512 * 1024  # 测试帧大小（压缩后）
+FRAGMENT_PAYLOAD = 1480  # 以太网MTU 1500减去IP头
+FEC_GROUP_SIZE, FEC_PARITY = 8, 1  # 与发送端默认配置一致
+MODES = [('旧版60KB数据报', 60 * 1024), ('MTU数据报（1400字节）', 1400)]
+
+
+class Receiver(Thread):
+    """接收线程：recvfrom_into + FrameReassembler，统计收到的数据报与完整帧"""
+
+    def __init__(self, sock):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.reassembler = FrameReassembler()
+        self.packets = 0
+        self.frames = 0
+        self.stopped = Event()
+
+    def run(self):
+        buf = bytearray(65535)
+        view = memoryview(buf)
+        self.sock.settimeout(0.2)
+        while not self.stopped.is_set():
+            try:
+                n, _ = self.sock.recvfrom_into(buf)
+            except OSError:
+                continue
+            self.packets += 1
+            frame = self.reassembler.add(parse_header(view[:n]), view[HEADER.size:n])
+            if frame is not None:
+                self.frames += 1
+                frame.release()
+
+
+def run(name, packet_size, loss_rate, frames):
+    rx = socket(AF_INET, SOCK_DGRAM)
+    rx.setsockopt(SOL_SOCKET, SO_RCVBUF, 8 * 1024 * 1024)
+    rx.bind(('127.0.0.1', 0))
+    tx = socket(AF_INET, SOCK_DGRAM)
+    addr = rx.getsockname()
+    receiver = Receiver(rx)
+    receiver.start()
+
+    rng = random.Random(1)
+    data = rng.getrandbits(FRAME_SIZE * 8).to_bytes(FRAME_SIZE, 'big')  # 不可压缩的随机帧数据
+    chunk = packet_size - HEADER.size - FEC_HEADER.size
+    sent = dropped = 0
+    send_time = 0.0
+    cpu = process_time()
+    for frame_no in range(frames):
+        start = perf_counter()
+        packets = []
+        for header, payload in packetize(data, frame_no, 1920, 1080, chunk, 0,
+                                         fec_group=FEC_GROUP_SIZE, fec_parity=FEC_PARITY):
+            fragments = -(-(len(header) + len(payload)) // FRAGMENT_PAYLOAD)
+            if rng.random() < 1 - (1 - loss_rate) ** fragments:
+                dropped += 1  # 模拟：任一IP分片丢失，整个数据报作废
+            else:
+                packets.append((header, payload))
+        send_packets(tx, packets, addr)
+        send_time += perf_counter() - start
+        sent += len(packets)
+        # 等接收端处理完本帧，避免回环接收缓冲区溢出混入统计
+        for _ in range(100):
+            if receiver.packets >= sent:
+                break
+            sleep(0.001)
+    cpu = process_time() - cpu
+    receiver.stopped.set()
+    receiver.join()
+    rx.close()
+    tx.close()
+
+    total = sent + dropped
+    print(f"{name}: {total / frames:.0f}个数据报/帧，发送 {total / send_time:,.0f} 个/秒，"
+          f"CPU {cpu / frames * 1000:.2f}ms/帧，数据报丢失 {dropped / total:.1%}，"
+          f"内核丢弃 {sent - receiver.packets}，整帧送达 {receiver.frames}/{frames}，"
+          f"纠错恢复 {receiver.reassembler.chunks_recovered} 块")
+
+
+def main():
+    loss_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 0.001
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"帧大小 {FRAME_SIZE // 1024}KB，每个以太网分片丢失率 {loss_rate:.2%}，"
+          f"FEC {FEC_GROUP_SIZE}+{FEC_PARITY}，共 {frames} 帧")
+    for name, size in MODES:
+        run(name, size, loss_rate, frames)
+
+
+if __name__ == '__main__':
+    main()
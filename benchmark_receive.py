@@ -0,0 +1,101 @@
+# @time     : 2026/10/17 下午7:20
+"""
+接收路径基准测试（本机回环）
+对比两种接收实现每帧的内存分配情况：
+1. 旧路径：recvfrom每次返回新的bytes，负载切片存入列表，收齐后b''.join再解压
+2. 新路径：recvfrom_into写入预分配缓冲区，FrameReassembler把负载拷贝进可复用的帧缓冲区，
+   直接对memoryview解压
+统计方法：tracemalloc记录每帧从收包到得到完整帧数据期间的内存峰值增量（解压输出两种路径相同，不计入），
+耗时包含解压
+用法：python benchmark_receive.py [帧数]
+"""
+
+import sys
+import tracemalloc
+from socket import socket, AF_INET, SOCK_DGRAM
+from time import perf_counter
+from zlib import compress, decompress
+import numpy as np
+from protocol import HEADER, packetize, parse_header, FrameReassembler
+
+FRAME_WIDTH, FRAME_HEIGHT = 1920, 1080  # 测试画面分辨率
+CHUNK_SIZE = 60 * 1024 - HEADER.size  # 旧版发送端的60KB分块（数据报少，对比的是每帧拼接与分配开销）
+
+
+def make_frame():
+    """生成一帧可压缩的测试数据（色块 + 噪声，压缩后约数百KB）"""
+    rng = np.random.default_rng(0)
+    img = np.repeat(rng.integers(0, 255, (FRAME_HEIGHT // 8, FRAME_WIDTH, 3), dtype=np.uint8), 8, axis=0)
+    img[::7] = rng.integers(0, 255, img[::7].shape, dtype=np.uint8)
+    return compress(img.tobytes(), 1)
+
+
+def legacy_receive(sock, packets, send):
+    """旧接收路径：每个数据报分配bytes，分块存列表，收齐后拼接（返回整帧数据）"""
+    chunks = []
+    for packet in packets:
+        send(packet)
+        packet, _ = sock.recvfrom(65535)
+        chunks.append(packet[HEADER.size:])
+    return b''.join(chunks), None
+
+
+def zero_copy_receive(sock, packets, send, reassembler, buf, view):
+    """新接收路径：recvfrom_into + 帧缓冲区池（返回帧数据视图和归还函数）"""
+    frame = None
+    for packet in packets:
+        send(packet)
+        n, _ = sock.recvfrom_into(buf)
+        frame = reassembler.add(parse_header(view[:n]), view[HEADER.size:n]) or frame
+    return frame.data, frame.release
+
+
+def run(name, receive, frames, data):
+    """逐帧发送并接收（回环上每发一个数据报立即接收，避免接收缓冲区溢出）"""
+    rx = socket(AF_INET, SOCK_DGRAM)
+    rx.bind(('127.0.0.1', 0))
+    tx = socket(AF_INET, SOCK_DGRAM)
+    addr = rx.getsockname()
+    send = lambda packet: tx.sendto(b''.join(packet), addr)
+
+    peaks = []
+    elapsed = 0.0
+    for frame_no in range(frames):
+        packets = list(packetize(data, frame_no, FRAME_WIDTH, FRAME_HEIGHT, CHUNK_SIZE))
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        assembled, release = receive(rx, packets, send)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        decompress(assembled)
+        elapsed += perf_counter() - start
+        del assembled
+        if release is not None:
+            release()  # 归还帧缓冲区
+    rx.close()
+    tx.close()
+
+    steady = peaks[1:] or peaks  # 首帧包含缓冲区预分配
+    print(f"{name}: 每帧内存峰值增量 {sum(steady) / len(steady) / 1024:.0f}KB（首帧 {peaks[0] / 1024:.0f}KB），"
+          f"每帧耗时 {elapsed / frames * 1000:.2f}ms")
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    data = make_frame()
+    count = -(-len(data) // CHUNK_SIZE)
+    print(f"测试帧：{FRAME_WIDTH}x{FRAME_HEIGHT}，压缩后 {len(data) / 1024:.0f}KB，{count} 个数据报，共 {frames} 帧")
+
+    tracemalloc.start()
+    run('旧路径（recvfrom + join）', legacy_receive, frames, data)
+    reassembler = FrameReassembler()
+    buf = bytearray(65535)
+    run('新路径（recvfrom_into + 帧缓冲区池）',
+        lambda sock, packets, send: zero_copy_receive(sock, packets, send, reassembler, buf, memoryview(buf)),
+        frames, data)
+    tracemalloc.stop()
+    print(f"新路径帧缓冲区累计分配 {reassembler.buffers.allocated} 块")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# @time     : 2026/10/17 下午1:20
+"""
+前向纠错模块（发送端与接收端共用）
+主要功能：
+1. 交织异或校验：每组k个数据分块生成m个校验包，第j个校验包覆盖组内序号 i % m == j 的分块
+2. 接收端无需回传即可恢复：每个覆盖类内丢失1个分块即可还原，
+   因此每组最多可恢复m个丢失分块（连续突发丢包同样适用）
+冗余开销 = m / k，由发送端配置
+"""
+
+from struct import Struct
+
+# ============================== 默认参数 ==============================
+FEC_GROUP_SIZE = 8  # 每组数据分块数k
+FEC_PARITY = 1  # 每组校验包数m（冗余开销 m/k）
+
+# 校验负载前缀：组大小k、校验包数m、被覆盖分块长度的异或值（用于还原末尾短分块的长度）
+FEC_HEADER = Struct('!BBH')
+
+
+# ============================== 异或运算 ==============================
+def xor_bytes(chunks):
+    """对若干字节串按位异或（短的在末尾补零）
+    使用大整数异或，运算在C层完成，60KB分块也很快
+    返回：(异或结果整数, 最大长度)
+    """
+    acc = 0
+    size = 0
+    for chunk in chunks:
+        acc ^= int.from_bytes(chunk, 'little')
+        size = max(size, len(chunk))
+    return acc, size
+
+
+def group_members(index, group_size, parity_count, chunk_count):
+    """返回与数据分块index同属一个覆盖类的所有数据分块序号"""
+    start = index // group_size * group_size
+    end = min(start + group_size, chunk_count)
+    first = start + (index - start) % parity_count
+    return range(first, end, parity_count)
+
+
+# ============================== 发送端编码 ==============================
+def encode_group(chunks, group_size, parity_count):
+    """为一组数据分块生成校验负载
+    参数：
+        chunks: 组内数据分块列表（末组可不足group_size个）
+        group_size: 组大小k（写入校验前缀，接收端据此划分分组）
+        parity_count: 校验包数m
+    返回：校验负载列表（FEC_HEADER + 异或数据）
+    """
+    parity = []
+    for j in range(min(parity_count, len(chunks))):
+        covered = chunks[j::parity_count]
+        acc, size = xor_bytes(covered)
+        len_xor = 0
+        for chunk in covered:
+            len_xor ^= len(chunk)
+        parity.append(FEC_HEADER.pack(group_size, parity_count, len_xor) + acc.to_bytes(size, 'little'))
+    return parity
+
+
+# ============================== 接收端恢复 ==============================
+def recover_chunk(present, parity_payload):
+    """用同一覆盖类中已收到的分块和校验负载还原唯一丢失的分块
+    参数：
+        present: 覆盖类中已收到的数据分块列表
+        parity_payload: 该覆盖类的校验负载（含FEC_HEADER）
+    返回：还原出的分块数据
+    """
+    _, _, len_xor = FEC_HEADER.unpack_from(parity_payload, 0)
+    acc, _ = xor_bytes(present)
+    acc ^= int.from_bytes(parity_payload[FEC_HEADER.size:], 'little')
+    for chunk in present:
+        len_xor ^= len(chunk)
+    return acc.to_bytes(len_xor, 'little')
@@ -0,0 +1,172 @@
+# @time     : 2026/10/18 上午1:40
+"""
+音频抖动缓冲模块（接收端使用）
+主要功能：
+1. 按序号重排到达的音频块，播放线程按固定节奏逐块取出，网络抖动不再直接变成爆音，突发到达也不会越积越多
+2. 按RFC 3550同款方法（到达间隔与时间戳间隔之差，1/16平滑）估计抖动，播放延迟目标随抖动自适应：
+   缓冲耗尽时重新缓冲到目标深度（延迟增大），缓冲持续超出目标时丢弃最旧的一块（延迟减小）
+3. 迟到丢弃：序号早于当前播放位置的块直接丢弃
+4. 丢包补偿：缺失的块先重复上一块并逐次衰减，连续缺失过多后插入静音
+收包线程调用push、播放线程调用pop，两者之间用锁保护
+"""
+
+from threading import Lock
+import numpy as np
+from audio_codec import AUDIO_SEQ_MOD, AUDIO_TS_MOD
+from avsync import CLOCK_MOD
+
+# ============================== 缓冲参数 ==============================
+JITTER_MIN_DELAY = 0.04  # 最小播放延迟（秒）
+JITTER_MAX_DELAY = 0.4  # 最大播放延迟（秒），缓冲超出时丢弃最旧的块
+JITTER_FACTOR = 3  # 目标延迟 = 一块时长 + 抖动 * JITTER_FACTOR
+SHRINK_MARGIN = 2  # 缓冲深度超出目标这么多块时开始收缩
+SHRINK_INTERVAL = 1.0  # 两次收缩的最小间隔（秒），避免连续丢块
+CONCEAL_FADE = 0.5  # 每多补偿一块，重复内容的音量衰减系数
+MAX_CONCEAL = 3  # 连续补偿超过此块数后插入静音；缺口超过此块数时直接跳到后面已到达的块
+RESET_GAP = 100  # 序号跳变超过此值时视为发送端重启，清空缓冲重新开始
+RESET_IDLE = 1.0  # 超过此时间（秒）没有收到音频时清空缓冲（发送端停止/重新开启音频）
+
+
+class JitterBuffer:
+    """自适应音频抖动缓冲"""
+
+    def __init__(self, rate, channels=1):
+        """
+        参数：
+            rate/channels: 播放采样率与声道数（缓冲中的样本已转换为此格式，用于计算缓冲时长）
+        """
+        self.rate = rate
+        self.channels = channels
+        self.lock = Lock()
+        self.chunks = {}  # 展开后的序号 -> (int16样本数组, 采集时间ms)
+        self.highest = None  # 已收到的最大序号（展开为不回绕的整数）
+        self.next_seq = None  # 下一个要播放的序号
+        self.buffering = True  # 正在（重新）缓冲到目标深度，期间不出声
+        self.last = None  # 上一块播放的样本（丢包补偿用）
+        self.clock = None  # pop最近返回的一块对应的采集时间（毫秒，补偿的块按时长顺延），音画同步用
+        self.concealing = 0  # 连续补偿的块数
+        self.chunk_time = 0.0  # 最近一块的时长（秒）
+        self.jitter = 0.0  # 到达抖动估计（秒）
+        self.transit = None  # 上一块的(到达时间 - 时间戳时间)，抖动估计用
+        self.last_arrival = 0.0  # 上一块的到达时间
+        self.last_shrink = 0.0  # 上次收缩的时间
+        # 统计
+        self.packets_late = 0  # 迟到丢弃的块数
+        self.packets_concealed = 0  # 补偿（重复衰减或静音）的块数
+        self.packets_dropped = 0  # 缓冲超限或收缩丢弃的块数
+        self.underruns = 0  # 缓冲耗尽、重新缓冲的次数
+
+    # ============================== 收包线程 ==============================
+    def push(self, seq, timestamp, rate, samples, now, capture=0):
+        """放入一块音频
+        参数：
+            seq/timestamp/rate/capture: 音频包头中的序号、时间戳、发送采样率与采集时间
+            samples: 已转换为播放格式的int16样本数组
+            now: 到达时间（time.monotonic()）
+        """
+        with self.lock:
+            if self.highest is not None:
+                seq = self.highest + (seq - self.highest + AUDIO_SEQ_MOD // 2) % AUDIO_SEQ_MOD - AUDIO_SEQ_MOD // 2
+                if abs(seq - self.highest) > RESET_GAP or now - self.last_arrival > RESET_IDLE:
+                    self._reset()
+            self.highest = seq if self.highest is None else max(self.highest, seq)
+            self.last_arrival = now
+
+            transit = now - timestamp / rate
+            if self.transit is not None:
+                delta = abs(transit - self.transit)
+                if delta < AUDIO_TS_MOD / rate / 2:  # 时间戳回绕的那一块不计入
+                    self.jitter += (delta - self.jitter) / 16
+            self.transit = transit
+
+            if self.next_seq is not None and seq < self.next_seq or seq in self.chunks:
+                self.packets_late += 1  # 该位置已播放或已补偿过（或重复包）
+                return
+            self.chunks[seq] = (samples, capture)
+            self.chunk_time = samples.size / self.channels / self.rate
+            while len(self.chunks) > 1 and self._depth() > JITTER_MAX_DELAY + self.chunk_time:
+                del self.chunks[min(self.chunks)]  # 突发到达超出最大延迟：丢弃最旧的块
+                self.packets_dropped += 1
+            if self.next_seq is not None:
+                self.next_seq = max(self.next_seq, min(self.chunks))
+
+    def _reset(self):
+        self.chunks.clear()
+        self.highest = None
+        self.next_seq = None
+        self.buffering = True
+        self.transit = None
+
+    def _depth(self):
+        """缓冲中音频的总时长（秒）"""
+        return sum(chunk.size for chunk, _ in self.chunks.values()) / self.channels / self.rate
+
+    def target_delay(self):
+        """当前目标播放延迟（秒）"""
+        return min(JITTER_MAX_DELAY, max(JITTER_MIN_DELAY, self.chunk_time + self.jitter * JITTER_FACTOR))
+
+    # ============================== 播放线程 ==============================
+    def pop(self, now):
+        """取出下一块要播放的样本
+        返回：int16样本数组（可能是补偿生成的）；正在缓冲时返回None（调用方稍后再取）
+        """
+        with self.lock:
+            target = self.target_delay()
+            if self.buffering:
+                if not self.chunks or self._depth() < target:
+                    return None
+                self.buffering = False
+                if self.next_seq not in self.chunks:
+                    self.next_seq = min(self.chunks)  # 缺失的块在重新缓冲期间仍未到达：跳过
+            elif (self._depth() > target + SHRINK_MARGIN * self.chunk_time
+                  and now - self.last_shrink >= SHRINK_INTERVAL and self.next_seq + 1 in self.chunks):
+                del self.chunks[self.next_seq]  # 延迟超出目标：跳过一块，逐步收缩
+                self.next_seq += 1
+                self.packets_dropped += 1
+                self.last_shrink = now
+
+            chunk = self.chunks.pop(self.next_seq, None)
+            if chunk is not None:
+                samples, self.clock = chunk
+                self.next_seq += 1
+                self.last = samples
+                self.concealing = 0
+                return samples
+            if not self.chunks:
+                self.buffering = True  # 缓冲耗尽：补偿一块后重新缓冲，缺失的块随后到达仍可播放
+                self.underruns += 1
+            elif min(self.chunks) - self.next_seq > MAX_CONCEAL:
+                self.next_seq = min(self.chunks)  # 长时间缺口（发送端暂停等）：不逐块补偿，直接跳过
+            else:
+                self.next_seq += 1  # 后面的块已到，当前块视为丢失
+            return self._conceal()
+
+    def _conceal(self):
+        """丢包补偿：重复上一块并逐次衰减，连续缺失过多时输出静音"""
+        self.packets_concealed += 1
+        self.concealing += 1
+        if self.clock is not None and self.last is not None:
+            self.clock = (self.clock + round(self.last.size / self.channels / self.rate * 1000)) % CLOCK_MOD
+        if self.last is None:
+            return np.zeros(int(self.chunk_time * self.rate) * self.channels, dtype=np.int16)
+        if self.concealing > MAX_CONCEAL:
+            return np.zeros_like(self.last)
+        # 首块从上一块的音量淡出，之后整块逐次衰减
+        start, end = CONCEAL_FADE ** (self.concealing - 1), CONCEAL_FADE ** self.concealing
+        frames = self.last.size // self.channels
+        gain = np.repeat(np.linspace(start, end, frames, dtype=np.float32), self.channels)
+        return (self.last * gain).astype(np.int16)
+
+    # ============================== 统计 ==============================
+    def snapshot(self):
+        """当前缓冲统计（字典）：缓冲深度与目标延迟（毫秒）、抖动（毫秒）、迟到/补偿/丢弃块数、重新缓冲次数"""
+        with self.lock:
+            return {
+                'depth_ms': self._depth() * 1000,
+                'target_ms': self.target_delay() * 1000,
+                'jitter_ms': self.jitter * 1000,
+                'late': self.packets_late,
+                'concealed': self.packets_concealed,
+                'dropped': self.packets_dropped,
+                'underruns': self.underruns,
+            }
@@ -0,0 +1,143 @@
+# @time     : 2026/10/17 下午8:40
+"""
+发送节奏控制模块（发送端）
+主要功能：
+1. 帧调度：按单调时钟的截止时间采集，处理耗时从帧间隔中扣除；落后超过一帧时跳过错过的帧，不追赶
+2. 数据报限速：令牌桶把每帧的数据报均匀分散到帧间隔内发送，并限制最大码率，
+   避免整帧以线速突发打满交换机与接收端的socket缓冲区
+3. 静止检测：抽样比较采集画面与上一次发出的画面，静止时不编码不发送，持续静止后降低采集帧率
+"""
+
+from time import monotonic, sleep
+import numpy as np
+
+PACING_SPREAD = 0.8  # 每帧数据报在帧间隔的前80%内发完（留余量给下一帧的编码抖动）
+STATIC_ROW_STEP = 4  # 静止检测每次只比较每4行中的1行（起始行轮换，连续4次覆盖全部行）
+IDLE_AFTER = 1.0  # 画面持续静止超过该时间（秒）后视为空闲，降低采集帧率
+
+
+# ============================== 令牌桶 ==============================
+class TokenBucket:
+    """令牌桶限速器（rate: 每秒补充的令牌数，burst: 桶容量）"""
+
+    def __init__(self, rate, burst, now=0.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def consume(self, now, amount=1):
+        """尝试取出amount个令牌，成功返回True"""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+
+# ============================== 帧调度 ==============================
+class FrameScheduler:
+    """截止时间帧调度器
+    每帧的截止时间 = 上一帧截止时间 + 帧间隔（不受处理耗时影响，平均帧率精确等于目标值）
+    """
+
+    def __init__(self, fps):
+        self.interval = 1 / fps
+        self.deadline = None  # 下一帧的截止时间
+        self.skipped = 0  # 因处理跟不上而跳过的帧数
+
+    def set_fps(self, fps):
+        self.interval = 1 / fps
+
+    def wait(self):
+        """等待到下一帧的截止时间；已落后超过一个帧间隔时跳过错过的帧，立即返回"""
+        now = monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        delay = self.deadline - now
+        if delay > 0:
+            sleep(delay)
+        elif delay <= -self.interval:
+            missed = int(-delay // self.interval)
+            self.skipped += missed
+            self.deadline += missed * self.interval
+        self.deadline += self.interval
+
+
+# ============================== 数据报限速 ==============================
+class PacketPacer:
+    """数据报限速器（令牌桶以字节计）
+    每帧按“帧大小 / (帧间隔 x PACING_SPREAD)”设定发送速率，且不超过max_bitrate；
+    桶容量burst决定每次醒来最多连发的字节数（小突发减少sleep次数）
+    """
+
+    def __init__(self, max_bitrate, burst):
+        self.max_rate = max_bitrate / 8  # 字节/秒，0表示不限
+        self.bucket = TokenBucket(self.max_rate, burst, monotonic())
+        self.waits = 0  # 因限速而等待的次数
+        self.slept = 0.0  # 累计等待时长（秒），用于从发送耗时中扣除
+
+    def pace(self, packets, interval):
+        """按节奏逐个产出数据报（在产出前等待令牌），配合protocol.send_packets使用
+        参数：
+            packets: packetize输出的(包头, 负载)列表
+            interval: 当前帧间隔（秒）
+        """
+        size = sum(len(header) + len(payload) for header, payload in packets)
+        rate = size / (interval * PACING_SPREAD)
+        if self.max_rate:
+            rate = min(rate, self.max_rate)
+        if rate <= 0:
+            yield from packets
+            return
+        bucket = self.bucket
+        bucket.rate = rate
+        for packet in packets:
+            n = len(packet[0]) + len(packet[1])
+            while not bucket.consume(monotonic(), min(n, bucket.burst)):
+                delay = (min(n, bucket.burst) - bucket.tokens) / bucket.rate
+                self.waits += 1
+                self.slept += delay
+                sleep(delay)
+            yield packet
+
+
+# ============================== 静止检测 ==============================
+class StaticDetector:
+    """画面静止检测（屏幕源）
+    与上一次判定为变化（即已发出）的画面比较，而不是与上一次采集比较：
+    抽样行未覆盖到的变化会一直保留在差异中，起始行轮换后必然被检出
+    """
+
+    def __init__(self, row_step=STATIC_ROW_STEP, idle_after=IDLE_AFTER):
+        self.row_step = row_step
+        self.idle_after = idle_after
+        self.reference = None  # 上一次发出的画面（H x W x 3）
+        self.phase = 0  # 本次比较的起始行
+        self.last_change = monotonic()
+
+    def changed(self, frame):
+        """判断画面相对上一次发出的画面是否变化，变化时以本帧为新的比较基准"""
+        ref = self.reference
+        if ref is not None and ref.shape == frame.shape:
+            self.phase = (self.phase + 1) % self.row_step
+            rows = slice(self.phase, None, self.row_step)
+            if np.array_equal(frame[rows], ref[rows]):
+                return False
+        self.reference = frame
+        self.last_change = monotonic()
+        return True
+
+    def refresh(self, frame):
+        """画面未变化但仍要发出（定期刷新）时更新比较基准"""
+        self.reference = frame
+
+    def invalidate(self):
+        """作为比较基准的画面最终没有发出（如在队列中被挤掉）：清除基准，下一次采集必然判定为变化"""
+        self.reference = None
+
+    @property
+    def idle(self):
+        """画面持续静止超过idle_after"""
+        return monotonic() - self.last_change >= self.idle_after
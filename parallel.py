@@ -0,0 +1,115 @@
+# @time     : 2026/10/17 下午6:03
+"""
+条带并行编解码模块（发送端与接收端共用）
+主要功能：
+1. 发送端：把完整帧按行切成若干水平条带，在线程池中并发编码（zlib与Pillow编码时释放GIL）
+   发送端默认启用切片编码（slicing.py），条带编码只在关闭切片或某个切片超过MAX_SLICE_CHUNKS个分块时作为后备
+2. 接收端：各条带是可独立解码的段，在线程池中并发解码后直接写入同一帧数组
+条带帧在包头中置FLAG_STRIPED标志，负载格式：
+    条带数(2字节) + 每个条带的(行数2字节, 数据长度4字节) + 各条带编码数据依次拼接
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from struct import Struct
+import numpy as np
+from video_codec import DEFAULT_LEVEL
+
+# ============================== 条带参数 ==============================
+STRIPE_MIN_ROWS = 64  # 每个条带的最小行数（条带过小时压缩率下降，调度开销占比上升）
+STRIPE_ALIGN = 16  # 条带行数按16对齐（与JPEG宏块对齐，避免条带边界出现额外块效应）
+
+STRIPE_HEADER = Struct('!H')  # 条带数
+STRIPE_ENTRY = Struct('!HI')  # 条带行数、编码数据长度
+
+
+# ============================== 工作池 ==============================
+def make_pool(workers):
+    """创建编码线程池（zlib/Pillow编码释放GIL，多线程即可并行压缩）
+    参数：
+        workers: 工作线程数，小于2时返回None（不启用并行编码）
+    不提供进程池：Windows只支持spawn启动方式，子进程会重新导入发送端脚本（导入即创建界面）
+    """
+    if workers < 2:
+        return None
+    return ThreadPoolExecutor(workers, thread_name_prefix='stripe')
+
+
+def split_rows(height, count):
+    """把height行切成最多count个条带，返回各条带行数列表（除最后一条外按STRIPE_ALIGN对齐）"""
+    count = max(1, min(count, height // STRIPE_MIN_ROWS))
+    step = -(-height // count)  # ceil除法
+    step = -(-step // STRIPE_ALIGN) * STRIPE_ALIGN
+    rows = []
+    y = 0
+    while y < height:
+        rows.append(min(step, height - y))
+        y += step
+    return rows
+
+
+# ============================== 发送端编码 ==============================
+def _encode_stripe(codec, stripe, quality, level):
+    """编码单个条带（编码器实例随任务传递，保留其输入格式等设置）"""
+    return codec.encode(stripe, quality, level)
+
+
+def encode_stripes(pool, codec, frame, quality, count, level=DEFAULT_LEVEL):
+    """并发编码一帧
+    参数：
+        pool: make_pool创建的工作池
+        codec: 帧内编码器（video_codec.get_codec的返回值）
+        frame: RGB图像数组（H x W x 3，uint8，行连续）
+        quality: 有损编码画质
+        count: 期望的条带数（通常等于工作数）
+        level: zlib压缩级别
+    返回：条带帧负载；帧太矮无法切分时返回None（由调用方按普通完整帧编码）
+    """
+    rows = split_rows(frame.shape[0], count)
+    if len(rows) < 2:
+        return None
+    futures = []
+    y = 0
+    for n in rows:
+        futures.append(pool.submit(_encode_stripe, codec, frame[y:y + n], quality, level))
+        y += n
+    segments = [f.result() for f in futures]
+    parts = [STRIPE_HEADER.pack(len(rows))]
+    parts.extend(STRIPE_ENTRY.pack(n, len(data)) for n, data in zip(rows, segments))
+    parts.extend(segments)
+    return b''.join(parts)
+
+
+# ============================== 接收端解码 ==============================
+def decode_stripes(pool, codec, payload, width, height):
+    """并发解码条带帧
+    参数：
+        pool: 线程池（各条带解码结果直接写入共享数组，只能使用线程池）
+        codec: 帧内编码器
+        payload: encode_stripes输出的条带帧负载
+        width/height: 帧分辨率
+    返回：可写RGB数组（H x W x 3，uint8）
+    """
+    view = memoryview(payload)
+    count, = STRIPE_HEADER.unpack_from(view, 0)
+    offset = STRIPE_HEADER.size
+    entries = []
+    for _ in range(count):
+        entries.append(STRIPE_ENTRY.unpack_from(view, offset))
+        offset += STRIPE_ENTRY.size
+    if sum(n for n, _ in entries) != height:
+        raise ValueError('条带行数与分辨率不符')
+
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+
+    def decode_one(y, n, data):
+        pixels[y:y + n] = codec.decode(data, width, n)
+
+    futures = []
+    y = 0
+    for n, size in entries:
+        futures.append(pool.submit(decode_one, y, n, view[offset:offset + size]))
+        y += n
+        offset += size
+    for f in futures:
+        f.result()  # 任一条带解码失败时抛出异常，整帧丢弃
+    return pixels
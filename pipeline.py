@@ -0,0 +1,168 @@
+# @time     : 2026/10/17 下午5:12
+"""
+流水线模块（发送端采集 -> 编码 -> 发送，接收端解码 -> 显示）
+主要功能：
+1. 有界队列：队满时丢弃最旧的数据（实时性优先，不阻塞上游）
+2. 流水线阶段：每个阶段一个线程，统计处理耗时与输入队列深度
+3. 最新帧邮箱：消费者跟不上时新帧取代尚未处理的旧帧（接收端解码线程使用）
+各阶段并行执行：采集第N+1帧的同时编码第N帧、发送第N-1帧
+"""
+
+from collections import deque
+from threading import Thread, Condition
+from time import perf_counter
+
+STAGE_QUEUE_SIZE = 2  # 阶段间队列长度（越小延迟越低）
+EWMA_ALPHA = 0.1  # 耗时指数滑动平均系数
+
+
+# ============================== 有界队列 ==============================
+class DropOldestQueue:
+    """有界队列（丢弃最旧策略）
+    put永不阻塞：队满时挤掉最旧的元素并返回它，调用方可据此做补救（如请求关键帧）
+    """
+
+    def __init__(self, maxsize=STAGE_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.items = deque()
+        self.cond = Condition()
+        self.dropped = 0  # 累计丢弃数
+
+    def put(self, item):
+        """放入元素，返回被挤掉的最旧元素（未挤掉时返回None）"""
+        evicted = None
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                evicted = self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+        return evicted
+
+    def get(self, timeout=None):
+        """取出最旧元素，超时返回None"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
+
+    def clear(self):
+        with self.cond:
+            self.items.clear()
+
+    def peek(self):
+        """返回队列中全部元素的快照（按放入顺序，不取出）"""
+        with self.cond:
+            return list(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class LatestMailbox:
+    """最新帧邮箱（单槽，新帧优先）
+    put时新帧默认取代所有尚未取走的旧帧；依赖前一帧的帧（如差分帧）以supersede=False追加在后，
+    消费者每次take取走全部待处理帧并按顺序处理，因此慢速消费者只会降低帧率而不会越积越多
+    参数：
+        on_drop: 旧帧被取代时的回调，参数为被取代的帧（如归还帧缓冲区）
+    """
+
+    def __init__(self, on_drop=None):
+        self.items = []
+        self.cond = Condition()
+        self.on_drop = on_drop
+        self.dropped = 0  # 被新帧取代而未处理的帧数
+
+    def put(self, item, supersede=True):
+        evicted = []
+        with self.cond:
+            if supersede:
+                self.dropped += len(self.items)
+                evicted, self.items = self.items, []
+            self.items.append(item)
+            self.cond.notify()
+        if self.on_drop is not None:
+            for old in evicted:
+                self.on_drop(old)
+
+    def take(self, timeout=None):
+        """取走全部待处理帧（按放入顺序），超时返回空列表"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items, timeout):
+                return []
+            items, self.items = self.items, []
+            return items
+
+    def __len__(self):
+        return len(self.items)
+
+
+# ============================== 流水线阶段 ==============================
+class Stage(Thread):
+    """流水线阶段线程
+    参数：
+        name: 阶段名称（用于统计显示）
+        work: 处理函数；有输入队列时为 work(item)，否则为 work()（源阶段）；返回None表示不向下游输出
+        running: 返回是否继续运行的函数
+        inbox/outbox: 输入/输出队列
+        after: 每次处理后调用的函数（源阶段用于帧率控制，不计入处理耗时）
+        on_drop: 输出队列挤掉旧元素时的回调，参数为被挤掉的元素
+    """
+
+    def __init__(self, name, work, running, inbox=None, outbox=None, after=None, on_drop=None):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.running = running
+        self.inbox = inbox
+        self.outbox = outbox
+        self.after = after
+        self.on_drop = on_drop
+        # 统计
+        self.processed = 0  # 已处理数
+        self.avg_time = 0.0  # 平均处理耗时（秒，指数滑动平均）
+
+    def run(self):
+        while self.running():
+            if self.inbox is None:
+                args = ()
+            else:
+                item = self.inbox.get(timeout=0.1)
+                if item is None:
+                    continue
+                args = (item,)
+
+            start = perf_counter()
+            try:
+                result = self.work(*args)
+            except Exception as e:
+                print(f"{self.name}阶段异常:", e)
+                result = None
+            elapsed = perf_counter() - start
+            if self.processed:
+                self.avg_time += (elapsed - self.avg_time) * EWMA_ALPHA
+            else:
+                self.avg_time = elapsed
+            self.processed += 1
+
+            if result is not None and self.outbox is not None:
+                evicted = self.outbox.put(result)
+                if evicted is not None and self.on_drop is not None:
+                    self.on_drop(evicted)
+            if self.after is not None:
+                self.after()
+
+    @property
+    def queue_depth(self):
+        """输入队列当前深度"""
+        return 0 if self.inbox is None else len(self.inbox)
+
+
+def format_stats(stages):
+    """格式化各阶段耗时与队列深度，例如：采集 12ms | 编码 30ms(队列1) | 发送 5ms(队列0)"""
+    parts = []
+    for stage in stages:
+        text = f"{stage.name} {stage.avg_time * 1000:.0f}ms"
+        if stage.inbox is not None:
+            text += f"(队列{stage.queue_depth})"
+        parts.append(text)
+    return " | ".join(parts)
@@ -0,0 +1,163 @@
+# @time     : 2026/10/18 上午12:31
+"""
+渐进细化模块（发送端与接收端共用）
+主要功能：
+1. 发送端：大分辨率完整帧按隔行隔列的交错顺序（类似PNG Adam7）拆成5遍像素，分3层先后发送：
+   基础层为每4x4取1点的缩略画面（1/16像素），细化层1补全每2x2取1点（合计1/4），细化层2补全其余像素
+   每层作为独立的一帧（连续帧号）发送，基础层先发，下一帧已就绪时未发出的细化层整层跳过
+2. 接收端：收到基础层立即放大显示粗略画面，细化层按序到达后补全像素、逐步变清晰；
+   细化层缺失时停在当前清晰度，不影响下一帧
+3. 切片容错：每遍像素按切片编码（见slicing.py），未收齐的层只隐藏丢失的切片（沿用当前清晰度的画面）；
+   各遍的所有切片一起提交工作池并行编码，占一半像素的最后一遍也能多核并行
+各遍像素互不重叠，3层全部到达后与原画面一致（无损编码器逐字节一致）
+渐进帧在包头中置FLAG_PROGRESSIVE与FLAG_SLICED标志，细化层另置FLAG_REFINEMENT，负载为切片帧格式：
+    5遍像素网格按遍序上下拼接成一个虚拟画面，切片起始行为其在虚拟画面中的行号，据此可知所属的遍与层；
+    层序号由切片所属的遍确定，基础层帧号 = 本层帧号 - 层序号（各层占用连续帧号）
+"""
+
+import numpy as np
+from video_codec import DEFAULT_LEVEL
+from protocol import SEQ_MOD
+from slicing import SLICE_ROWS, SLICE_PREFIX, encode_segments, pack_slices, complete_slices
+
+# ============================== 交错参数 ==============================
+# 各遍像素在原画面中的位置：(起始行, 行步长, 起始列, 列步长)
+PASSES = (
+    (0, 4, 0, 4),  # 每4x4的左上角
+    (0, 4, 2, 4),  # 与上一遍合成每4行的偶数列
+    (2, 4, 0, 2),  # 与前两遍合成全部偶数行偶数列
+    (0, 2, 1, 2),  # 偶数行奇数列
+    (1, 2, 0, 1),  # 全部奇数行
+)
+LAYER_PASSES = ((0,), (1, 2), (3, 4))  # 每层包含的遍
+LAYER_SCALES = (4, 2, 1)  # 每层到达后已知像素的网格间距（用于放大显示）
+
+
+def pass_offsets(height):
+    """各遍像素网格在虚拟画面中的起始行（最后一项为虚拟画面总行数）"""
+    offsets = [0]
+    for r, rs, _, _ in PASSES:
+        offsets.append(offsets[-1] + len(range(r, height, rs)))
+    return offsets
+
+
+def pass_of_row(offsets, row):
+    """虚拟画面中的行属于哪一遍（不属于任何一遍时返回None）"""
+    for p in range(len(PASSES)):
+        if offsets[p] <= row < offsets[p + 1]:
+            return p
+    return None
+
+
+def layer_of_pass(p):
+    """某一遍所属的层序号"""
+    return next(index for index, passes in enumerate(LAYER_PASSES) if p in passes)
+
+
+# ============================== 发送端编码 ==============================
+def encode_progressive(pool, codec, frame, quality, level=DEFAULT_LEVEL, chunk_size=1400, rows=SLICE_ROWS):
+    """把一帧编码为基础层与各细化层
+    参数：
+        pool: parallel.make_pool创建的工作池（None表示在当前线程依次编码）
+        codec: 帧内编码器（video_codec.get_codec的返回值）
+        frame: 图像数组（H x W x 3，uint8）
+        chunk_size: 分包时每个数据报的负载大小（必须与packetize的chunk_size一致）
+        rows: 每个切片的行数（各遍网格中的行）
+    返回：各层负载列表（依次为基础层、细化层1、细化层2）；
+          某个切片超过MAX_SLICE_CHUNKS个分块时返回None（由调用方按普通完整帧编码）
+    """
+    offsets = pass_offsets(frame.shape[0])
+    slices = []  # (遍序号, 虚拟画面起始行, 行数, 像素)
+    for p, (r, rs, c, cs) in enumerate(PASSES):
+        grid = np.ascontiguousarray(frame[r::rs, c::cs])
+        slices += [(p, offsets[p] + y, min(rows, len(grid) - y), grid[y:y + rows])
+                   for y in range(0, len(grid), rows)]
+    segments = encode_segments(pool, codec, [pixels for _, _, _, pixels in slices], quality, level)
+    payloads = []
+    for passes in LAYER_PASSES:
+        parts = pack_slices([(y, n, data) for (p, y, n, _), data in zip(slices, segments) if p in passes],
+                            chunk_size)
+        if parts is None:
+            return None
+        parts.pop()  # 每层是独立的一帧，最后一个分块不需要补齐
+        payloads.append(b''.join(parts))
+    return payloads
+
+
+# ============================== 接收端重建 ==============================
+class ProgressiveCanvas:
+    """接收端正在细化的一帧画面（仅解码线程访问）"""
+
+    def __init__(self, base_no, width, height):
+        self.base_no = base_no  # 基础层帧号
+        self.width = width
+        self.height = height
+        self.pixels = np.empty((height, width, 3), dtype=np.uint8)  # 已到达的各遍像素落位
+        self.offsets = pass_offsets(height)
+        self.layers = 0  # 已应用的层数
+        self.concealed = 0  # 各层累计被隐藏的网格行数（非0时画面与发送端不一致）
+
+    @property
+    def complete(self):
+        return self.layers == len(LAYER_PASSES)
+
+    def apply(self, pool, codec, frame_no, chunks, previous=None):
+        """应用一层（必须按层序号依次应用，可以未收齐）
+        参数：
+            pool: 线程池（各切片在线程池中并行解码）
+            frame_no: 本层的帧号
+            chunks: 本层已收到的(分块序号, 负载)列表（PendingFrame.received_chunks的返回值）
+            previous: 上一帧画面，基础层丢失切片的位置从中复制（分辨率不同或为None时填黑）；
+                      细化层丢失切片的位置沿用当前清晰度的画面
+        返回：本层被隐藏的网格行数
+        异常：层与当前画面不连续（中间的层丢失或被跳过）、没有任何完整的切片时抛出ValueError，数据损坏时抛出其他异常
+        """
+        first = pass_of_row(self.offsets, SLICE_PREFIX.unpack_from(chunks[0][1], 0)[0])
+        if first is None:
+            raise ValueError('切片位置超出画面')
+        index = layer_of_pass(first)
+        if index != self.layers or (frame_no - index) % SEQ_MOD != self.base_no:
+            raise ValueError('细化层与当前画面不连续')
+        covered = {p: np.zeros(self.offsets[p + 1] - self.offsets[p], dtype=bool) for p in LAYER_PASSES[index]}
+
+        def decode_one(p, y, rows, data):
+            r, rs, c, cs = PASSES[p]
+            target = self.pixels[r::rs, c::cs][y:y + rows]
+            target[...] = codec.decode(data, target.shape[1], rows)
+            covered[p][y:y + rows] = True
+
+        futures = []
+        for y, rows, data in complete_slices(chunks):
+            p = pass_of_row(self.offsets, y)
+            if p in covered and y + rows <= self.offsets[p + 1]:
+                futures.append(pool.submit(decode_one, p, y - self.offsets[p], rows, data))
+        for f in futures:
+            try:
+                f.result()
+            except Exception:
+                pass  # 切片数据损坏：与丢失的切片一样隐藏
+
+        concealed = sum(int(np.count_nonzero(~mask)) for mask in covered.values())
+        if concealed == sum(len(mask) for mask in covered.values()):
+            raise ValueError('没有任何完整的切片')
+        if concealed:
+            if self.layers:
+                prior = self.render()  # 当前清晰度的画面
+            elif previous is not None and previous.shape == self.pixels.shape:
+                prior = previous
+            else:
+                prior = np.zeros_like(self.pixels)
+            for p, mask in covered.items():
+                r, rs, c, cs = PASSES[p]
+                self.pixels[r::rs, c::cs][~mask] = prior[r::rs, c::cs][~mask]
+        self.layers += 1
+        self.concealed += concealed
+        return concealed
+
+    def render(self):
+        """当前清晰度的完整分辨率画面：全部到达时即为pixels，否则把已知像素网格按最近邻放大"""
+        if self.complete:
+            return self.pixels
+        step = LAYER_SCALES[self.layers - 1]
+        grid = self.pixels[::step, ::step]
+        return np.repeat(np.repeat(grid, step, axis=0), step, axis=1)[:self.height, :self.width]
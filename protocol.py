@@ -0,0 +1,431 @@
+# @time     : 2026/10/17 上午11:03
+"""
+视频传输协议模块（发送端与接收端共用）
+主要功能：
+1. 定长二进制包头：每个数据报都携带流ID、帧号、分块序号/总数、负载长度、标志位、分辨率与采集时间
+2. 发送端分包：把一帧压缩数据切成不超过MTU的数据报（memoryview切片，分散/聚集发送）
+3. 接收端重组：容忍乱序，同时缓存多帧，按帧号丢弃过期帧
+4. 可选前向纠错：分组附带异或校验包，接收端就地恢复丢失分块（见fec.py）
+5. 零拷贝接收：分块直接落位到可复用的帧缓冲区，整帧数据以memoryview交给解码器
+6. 切片帧（见slicing.py）容忍丢包：未收齐即被作废或静默超时的切片帧不丢弃，交给调用方按已收切片解码
+"""
+
+from collections import namedtuple
+from struct import Struct, error as StructError
+from threading import Lock
+from time import monotonic
+from fec import FEC_HEADER, encode_group, group_members, recover_chunk
+
+# ============================== 协议常量 ==============================
+PROTOCOL_MAGIC = b'UB'  # 协议魔数（过滤非本协议数据包）
+PROTOCOL_VERSION = 4  # 协议版本号（包头格式变化时递增）
+
+# 包头格式（网络字节序，共26字节）：
+# 魔数(2s) 版本(B) 标志位(H) 编码器ID(B) 流ID(H) 帧号(I) 分块序号(H) 分块总数(H) 负载长度(H) 宽(H) 高(H)
+# 采集时间(I，毫秒，发送端公共采集时钟，见avsync.py)
+HEADER = Struct('!2sBHBHIHHHHHI')
+PacketHeader = namedtuple('PacketHeader', 'magic version flags codec stream_id frame_no '
+                                          'chunk_index chunk_count payload_len width height capture')
+
+# 标志位
+FLAG_DELTA = 0x01  # 脏块差分帧（否则为完整帧）
+FLAG_PARITY = 0x02  # 前向纠错校验包（分块序号为校验包序号，见fec.py）
+FLAG_KEYFRAME = 0x04  # 帧间编码的关键帧（解码器可从此帧开始解码）
+FLAG_STRIPED = 0x08  # 条带帧（完整帧按水平条带分段编码，可并行解码，见parallel.py）
+FLAG_ZDICT = 0x10  # 预置字典差分帧（各图块以参考关键帧中的旧内容为zlib预置字典压缩，见video_codec.py）
+FLAG_HEARTBEAT = 0x20  # 心跳（画面静止时代替视频帧发送，只有包头，帧号为最近发出的帧）
+FLAG_SLICED = 0x40  # 切片帧（完整帧按切片独立编码并按分块对齐，丢失分块只影响所在切片，见slicing.py）
+FLAG_CLOSE = 0x80  # 关闭指令（通知接收端结束）
+FLAG_PROGRESSIVE = 0x100  # 渐进帧（大分辨率完整帧按交错顺序分层发送，先显示粗略画面；各层同时置FLAG_SLICED，见progressive.py）
+FLAG_REFINEMENT = 0x200  # 渐进帧的细化层（依赖同一画面的基础层与之前的细化层）
+
+SEQ_MOD = 1 << 32  # 帧号取值范围（32位回绕）
+MAX_FRAMES_IN_FLIGHT = 4  # 接收端同时缓存的未完成帧数
+RESTART_WINDOW = 256  # 帧号倒退超过该值视为发送端重启
+PARTIAL_TIMEOUT = 0.15  # 切片帧数据静默多久仍未收齐即按已收切片交付（应长于NACK重传的全过程）
+PROGRESSIVE_REFINEMENTS = 2  # 渐进帧的细化层数（与progressive.LAYER_PASSES一致），发送端可能整层跳过，不计入丢包
+
+
+# ============================== 包头编解码 ==============================
+def pack_header(flags, stream_id, frame_no, chunk_index, chunk_count, payload_len, width, height, codec=0,
+                capture=0):
+    """打包数据报包头"""
+    return HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, flags, codec, stream_id, frame_no % SEQ_MOD,
+                       chunk_index, chunk_count, payload_len, width, height, capture)
+
+
+def parse_header(packet):
+    """解析数据报包头
+    返回：PacketHeader；数据包残缺、魔数或版本不符时返回None
+    """
+    try:
+        header = PacketHeader._make(HEADER.unpack_from(packet, 0))
+    except StructError:
+        return None
+    if header.magic != PROTOCOL_MAGIC or header.version != PROTOCOL_VERSION:
+        return None
+    return header
+
+
+def seq_newer(a, b):
+    """判断帧号a是否比b新（处理32位回绕）"""
+    return 0 < (a - b) % SEQ_MOD < SEQ_MOD // 2
+
+
+# ============================== 发送端分包 ==============================
+def packetize(data, frame_no, width, height, chunk_size, flags=0, stream_id=0,
+              fec_group=0, fec_parity=0, codec=0, capture=0):
+    """把一帧数据切成带包头的数据报
+    参数：
+        data: 压缩后的帧数据
+        codec: 编码器ID（见video_codec.py）
+        capture: 帧的采集时间（avsync.media_clock的值，接收端据此与音频对齐）
+        chunk_size: 每个数据报的负载上限（不含包头及校验前缀），应使整个数据报不超过路径MTU
+        fec_group/fec_parity: 前向纠错分组大小k与每组校验包数m（任一为0表示不启用）
+    返回：数据报生成器（每组数据分块之后紧跟该组的校验包）
+        每个数据报为(包头, 负载)二元组，负载是data上的memoryview切片（不复制），由send_packets发送
+    """
+    view = memoryview(data)
+    count = max(1, -(-len(data) // chunk_size))  # ceil除法，空帧也发送一个分块
+    group = []
+    for index in range(count):
+        chunk = view[index * chunk_size:(index + 1) * chunk_size]
+        yield pack_header(flags, stream_id, frame_no, index, count, len(chunk), width, height, codec, capture), chunk
+        if not (fec_group and fec_parity):
+            continue
+        group.append(chunk)
+        if len(group) == fec_group or index == count - 1:
+            first = index // fec_group * fec_parity  # 本组第一个校验包的序号
+            for j, parity in enumerate(encode_group(group, fec_group, fec_parity)):
+                yield pack_header(flags | FLAG_PARITY, stream_id, frame_no, first + j, count,
+                                  len(parity), width, height, codec, capture), parity
+            group = []
+
+
+def send_packets(sock, packets, addr):
+    """发送packetize输出的数据报
+    支持sendmsg的平台（Linux/macOS）用分散/聚集IO把包头和负载视图直接交给内核，不拼接不复制；
+    Windows没有sendmsg：每次调用预分配一块数据报缓冲区（UDP数据报上限65535字节），
+    逐个把包头和负载拷贝进去后以memoryview切片sendto，不再为每个数据报拼接新的bytes对象
+    （发送线程与重传线程可能同时调用，缓冲区不跨调用共享）
+    """
+    if hasattr(sock, 'sendmsg'):
+        sendmsg = sock.sendmsg
+        for packet in packets:
+            sendmsg(packet, (), 0, addr)
+    else:
+        sendto = sock.sendto
+        buf = bytearray(65535)
+        view = memoryview(buf)
+        for header, payload in packets:
+            h = len(header)
+            n = h + len(payload)
+            view[:h] = header
+            view[h:n] = payload
+            sendto(view[:n], addr)
+
+
+def heartbeat_packet(stream_id, frame_no, width, height):
+    """构造心跳数据报（接收端据此确认发送端在线、没有漏收最后一帧）"""
+    return pack_header(FLAG_HEARTBEAT, stream_id, frame_no, 0, 0, 0, width, height)
+
+
+def close_packet(stream_id=0):
+    """构造关闭指令数据报"""
+    return pack_header(FLAG_CLOSE, stream_id, 0, 0, 0, 0, 0, 0)
+
+
+# ============================== 接收端重组 ==============================
+class BufferPool:
+    """帧缓冲区池（接收端）
+    每帧的分块直接拷贝进一块预分配的bytearray（按分块序号 x 分块大小定位），
+    帧用完后归还复用，避免每个数据报、每帧都分配新的bytes对象
+    缓冲区可能仍被memoryview引用，因此只复用不扩容：池中没有足够大的缓冲区时新分配一块
+    """
+
+    def __init__(self, max_buffers=MAX_FRAMES_IN_FLIGHT * 2):
+        self.max_buffers = max_buffers
+        self.free = []
+        self.lock = Lock()  # 网络线程取用，解码线程归还
+        self.allocated = 0  # 累计新分配的缓冲区数（用于评估复用效果）
+
+    def acquire(self, size):
+        with self.lock:
+            for i, buf in enumerate(self.free):
+                if len(buf) >= size:
+                    return self.free.pop(i)
+        self.allocated += 1
+        return bytearray(size)
+
+    def release(self, buf):
+        with self.lock:
+            if len(self.free) < self.max_buffers:
+                self.free.append(buf)
+
+
+class PendingFrame:
+    """正在重组的帧
+    数据分块拷贝进帧缓冲区的对应位置（除最后一块外各分块大小相同），chunks保存各分块的memoryview；
+    分块大小未知前到达的末尾分块和纠错还原的分块暂存为bytes，取data时再拷贝落位
+    """
+    __slots__ = ('frame_no', 'flags', 'codec', 'width', 'height', 'capture', 'chunks', 'received', 'parity', 'fec',
+                 'last_packet', 'nacks_sent', 'last_nack', 'chunk_size', 'buffer', 'pool', 'recovered')
+
+    def __init__(self, header, pool=None):
+        self.frame_no = header.frame_no
+        self.flags = header.flags & ~FLAG_PARITY
+        self.codec = header.codec
+        self.width = header.width
+        self.height = header.height
+        self.capture = header.capture  # 采集时间（毫秒）
+        self.chunks = [None] * header.chunk_count
+        self.received = 0
+        self.recovered = 0  # 其中由前向纠错还原的分块数
+        self.parity = {}  # 校验包序号 -> 校验负载
+        self.fec = None  # (组大小k, 校验包数m)，收到第一个校验包后确定
+        self.chunk_size = None  # 分块大小（收到第一个非末尾分块后确定）
+        self.buffer = None  # 帧缓冲区（bytearray，来自pool）
+        self.pool = pool
+        # 重传状态（见retransmit.py）
+        self.last_packet = monotonic()  # 最近一次收到本帧分块的时间
+        self.nacks_sent = 0
+        self.last_nack = 0.0
+
+    @property
+    def complete(self):
+        return self.received == len(self.chunks)
+
+    def store(self, index, payload):
+        """存放一个数据分块（payload可以是接收缓冲区的临时视图，本方法负责拷贝）
+        返回：False表示分块大小与同帧其他分块不一致（异常数据）
+        """
+        count = len(self.chunks)
+        last = index == count - 1
+        if self.chunk_size is None and (not last or count == 1):
+            self.chunk_size = len(payload)
+            size = self.chunk_size * count
+            self.buffer = self.pool.acquire(size) if self.pool is not None else bytearray(size)
+        if self.chunk_size is None:
+            self.chunks[index] = bytes(payload)  # 末尾分块先到：暂存
+        elif len(payload) > self.chunk_size or (not last and len(payload) != self.chunk_size):
+            return False
+        else:
+            offset = index * self.chunk_size
+            view = memoryview(self.buffer)[offset:offset + len(payload)]
+            view[:] = payload
+            self.chunks[index] = view
+        self.received += 1
+        return True
+
+    def received_chunks(self):
+        """已收到的(分块序号, 负载)列表（未收齐的切片帧按切片解码时使用，release之前有效）"""
+        return [(i, chunk) for i, chunk in enumerate(self.chunks) if chunk is not None]
+
+    @property
+    def data(self):
+        """完整帧数据（帧缓冲区上的memoryview，release之前有效）"""
+        view = memoryview(self.buffer)
+        for i, chunk in enumerate(self.chunks):
+            if not isinstance(chunk, memoryview):  # 暂存或还原的分块
+                offset = i * self.chunk_size
+                view[offset:offset + len(chunk)] = chunk
+        return view[:(len(self.chunks) - 1) * self.chunk_size + len(self.chunks[-1])]
+
+    def release(self):
+        """归还帧缓冲区（解码完成或帧作废后调用，之后data失效）"""
+        if self.buffer is not None and self.pool is not None:
+            self.pool.release(self.buffer)
+        self.buffer = None
+        self.chunks = [None] * len(self.chunks)
+
+
+class FrameReassembler:
+    """帧重组器（单个流）
+    实现特点：
+    - 分块按序号落位，乱序到达不影响重组
+    - 同时缓存最多max_frames个未完成帧，超出时淘汰最旧的帧
+    - 某帧完成后，比它旧的未完成帧全部作废；比已完成帧旧的分块直接丢弃
+    - 分块直接拷贝进缓冲区池中的帧缓冲区，完成的帧交给调用方，调用方用完后调用release归还
+    - 切片帧未收齐即被作废或静默超时时放入partial，由调用方取走按已收切片解码（同样需要release）
+    - 丢包统计包含整帧丢失的帧：帧号出现空缺时每个空缺帧号按丢失一个分块计（整帧丢失的多为单个数据报的小差分帧），
+      之后迟到的空缺帧撤销计数；渐进帧基础层之后的细化层帧号可能被发送端整层跳过，不计入
+    """
+
+    def __init__(self, max_frames=MAX_FRAMES_IN_FLIGHT):
+        self.max_frames = max_frames
+        self.pending = {}  # 帧号 -> PendingFrame
+        self.buffers = BufferPool(max_frames * 2)  # 帧缓冲区池
+        self.last_completed = None  # 最近一次完成（或按切片交付）的帧号
+        self.partial = []  # 待交付的未收齐切片帧（按帧号从旧到新）
+        # 统计计数
+        self.frames_completed = 0
+        self.frames_dropped = 0  # 未收齐即被淘汰的帧（纠错后仍无法恢复）
+        self.frames_partial = 0  # 未收齐但按已收切片交付的帧
+        self.packets_stale = 0  # 属于过期帧的分块
+        self.chunks_recovered = 0  # 通过前向纠错还原的分块
+        self.chunks_expected = 0  # 已结束（完成或作废）的帧应有的数据分块总数
+        self.chunks_lost = 0  # 其中未从网络收到的数据分块（含纠错还原的），用于计算丢包率
+        self.frames_missing = 0  # 一个分块都没有收到的帧（按帧号空缺统计）
+        self.highest = None  # 收到过分块的最大帧号
+        self.missing = set()  # 计为整帧丢失的帧号（迟到时撤销计数）
+        self.progressive_base = None  # 最近收到的渐进帧基础层帧号
+
+    def reset(self):
+        """清空状态（发送端重启时调用）"""
+        for frame in self.pending.values():
+            self.retire(frame)
+            frame.release()
+        for frame in self.partial:
+            frame.release()
+        self.pending.clear()
+        self.partial.clear()
+        self.last_completed = None
+        self.highest = None
+        self.missing.clear()
+        self.progressive_base = None
+
+    def add(self, header, payload):
+        """加入一个分块
+        参数：
+            header: PacketHeader
+            payload: 包头之后的负载数据（可以是接收缓冲区的memoryview，数据会被拷贝）
+        返回：帧已收齐时返回PendingFrame，否则返回None
+        """
+        is_parity = header.flags & FLAG_PARITY
+        if len(payload) != header.payload_len:
+            return None  # 残缺分块
+        if not is_parity and header.chunk_index >= header.chunk_count:
+            return None  # 非法分块序号
+        if is_parity:
+            if len(payload) < FEC_HEADER.size:
+                return None  # 校验包缺少纠错头（残缺或非本程序发出的数据报）
+            group_size, parity_count, _ = FEC_HEADER.unpack_from(payload, 0)
+            if not group_size or not parity_count:
+                return None  # 非法分组参数
+
+        frame_no = header.frame_no
+        self.track_gaps(frame_no, header.flags)
+        if self.last_completed is not None and not seq_newer(frame_no, self.last_completed):
+            if (self.last_completed - frame_no) % SEQ_MOD < RESTART_WINDOW:
+                self.packets_stale += 1
+                return None
+            self.reset()  # 帧号大幅倒退：发送端已重启，重新同步
+
+        frame = self.pending.get(frame_no)
+        if frame is None:
+            if len(self.pending) >= self.max_frames:
+                # 以当前帧号为中心比较新旧（兼容回绕），淘汰最旧的帧
+                oldest = min(self.pending, key=lambda n: (n - frame_no + SEQ_MOD // 2) % SEQ_MOD)
+                self.abandon(self.pending.pop(oldest))
+            frame = self.pending[frame_no] = PendingFrame(header, self.buffers)
+        elif len(frame.chunks) != header.chunk_count:
+            return None  # 与已收分块不一致（异常数据），忽略
+        else:
+            frame.last_packet = monotonic()
+
+        if is_parity:
+            if frame.fec is None:
+                frame.fec = (group_size, parity_count)
+            frame.parity[header.chunk_index] = bytes(payload)
+            group_size, parity_count = frame.fec
+            group, j = divmod(header.chunk_index, parity_count)
+            self.try_recover(frame, group * group_size + j)
+        elif frame.chunks[header.chunk_index] is None:
+            if not frame.store(header.chunk_index, payload):
+                return None
+            if frame.fec is not None:
+                self.try_recover(frame, header.chunk_index)
+        if not frame.complete:
+            return None
+
+        self.conclude(frame_no)
+        self.frames_completed += 1
+        return frame
+
+    def track_gaps(self, frame_no, flags):
+        """按帧号空缺统计整帧丢失的帧"""
+        if frame_no in self.missing:
+            self.missing.discard(frame_no)  # 乱序迟到：撤销计数
+            self.frames_missing -= 1
+            self.chunks_expected -= 1
+            self.chunks_lost -= 1
+        if flags & FLAG_PROGRESSIVE and not flags & FLAG_REFINEMENT:
+            self.progressive_base = frame_no
+        if self.highest is None or not seq_newer(frame_no, self.highest):
+            if self.highest is None:
+                self.highest = frame_no
+            return
+        gap = (frame_no - self.highest) % SEQ_MOD
+        if gap < RESTART_WINDOW:  # 跳变过大视为重新同步（发送端重启等），不计入
+            base = self.progressive_base
+            for n in range(self.highest + 1, self.highest + gap):
+                n %= SEQ_MOD
+                if base is not None and 0 < (n - base) % SEQ_MOD <= PROGRESSIVE_REFINEMENTS:
+                    continue  # 被发送端跳过的细化层
+                self.missing.add(n)
+                self.frames_missing += 1
+                self.chunks_expected += 1
+                self.chunks_lost += 1
+            if len(self.missing) > RESTART_WINDOW:
+                self.missing = {n for n in self.missing if (frame_no - n) % SEQ_MOD < RESTART_WINDOW}
+        self.highest = frame_no
+
+    def conclude(self, frame_no):
+        """帧frame_no已完成（或按切片交付）：移出重组器，作废所有更旧的未完成帧"""
+        older = [n for n in self.pending if seq_newer(frame_no, n)]
+        older.sort(key=lambda n: (frame_no - n) % SEQ_MOD, reverse=True)  # 从旧到新
+        for n in older:
+            self.abandon(self.pending.pop(n))
+        self.retire(self.pending.pop(frame_no))
+        self.last_completed = frame_no
+
+    def abandon(self, frame):
+        """未收齐的帧离开重组器：切片帧放入partial待交付，其他帧丢弃"""
+        self.retire(frame)
+        if frame.flags & FLAG_SLICED and frame.received:
+            self.partial.append(frame)
+            self.frames_partial += 1
+        else:
+            frame.release()
+            self.frames_dropped += 1
+
+    def expire(self, now, timeout=PARTIAL_TIMEOUT):
+        """交付静默超时的未收齐切片帧（不等下一帧到达，画面静止时也能及时显示）"""
+        for frame in list(self.pending.values()):
+            if frame.flags & FLAG_SLICED and frame.frame_no in self.pending and now - frame.last_packet > timeout:
+                self.conclude(frame.frame_no)
+                self.partial.append(frame)
+                self.frames_partial += 1
+
+    def take_partial(self):
+        """取走待交付的未收齐切片帧"""
+        frames, self.partial = self.partial, []
+        return frames
+
+    def try_recover(self, frame, index):
+        """尝试恢复数据分块index所在覆盖类中唯一丢失的分块"""
+        group_size, parity_count = frame.fec
+        count = len(frame.chunks)
+        if index >= count:
+            return
+        members = group_members(index, group_size, parity_count, count)
+        missing = [i for i in members if frame.chunks[i] is None]
+        if len(missing) != 1:
+            return  # 无丢失，或丢失过多无法恢复
+        group = index // group_size
+        parity = frame.parity.get(group * parity_count + (index - group * group_size) % parity_count)
+        if parity is None:
+            return
+        present = [frame.chunks[i] for i in members if i != missing[0]]
+        try:
+            chunk = recover_chunk(present, parity)
+        except OverflowError:
+            return  # 校验数据与已收分块不一致（异常数据）
+        if frame.store(missing[0], chunk):
+            frame.recovered += 1
+            self.chunks_recovered += 1
+
+    def retire(self, frame):
+        """帧离开重组器（完成或作废）时累计丢包统计"""
+        self.chunks_expected += len(frame.chunks)
+        self.chunks_lost += len(frame.chunks) - frame.received + frame.recovered
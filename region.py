@@ -0,0 +1,177 @@
+# @time     : 2026/10/17 下午11:20
+"""
+屏幕区域采集模块（发送端）
+主要功能：
+1. 采集区域：整个屏幕、固定矩形、单个显示器或跟踪某个窗口（按标题关键字查找，每次采集重新定位）
+2. 区域截图：安装了mss时只截取区域内的像素（BitBlt区域，采集耗时与区域面积成正比）；
+   未安装时使用PIL.ImageGrab的bbox参数（Windows上为整屏截取后裁剪，编码与传输量仍按区域缩小）
+显示器枚举与窗口定位使用Windows API（ctypes），其他平台显示器枚举依赖mss，不支持窗口跟踪
+"""
+
+import sys
+import threading
+from PIL import Image
+from PIL.ImageGrab import grab
+
+try:
+    import mss  # 可选依赖：区域截图
+    MSS_AVAILABLE = True
+except ImportError:
+    mss = None
+    MSS_AVAILABLE = False
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+    user32 = ctypes.windll.user32
+    dwmapi = ctypes.windll.dwmapi
+else:
+    user32 = None
+
+DWMWA_EXTENDED_FRAME_BOUNDS = 9  # 窗口可见边框（不含Win10的透明缩放边框）
+MONITORINFOF_PRIMARY = 1
+DPI_AWARENESS_PER_MONITOR = -4  # DPI_AWARENESS_CONTEXT_PER_MONITOR_AWARE_V2（坐标为物理像素，与截图一致）
+_local = threading.local()  # mss实例按线程创建（Windows上的设备上下文不能跨线程使用）
+
+
+# ============================== Windows API ==============================
+if user32 is not None:
+    class _MonitorInfo(ctypes.Structure):
+        _fields_ = [('cbSize', wintypes.DWORD), ('rcMonitor', wintypes.RECT),
+                    ('rcWork', wintypes.RECT), ('dwFlags', wintypes.DWORD)]
+
+
+class _DpiAware:
+    """在本线程内临时切换为按显示器DPI感知（查询到的坐标为物理像素）"""
+
+    def __enter__(self):
+        setter = getattr(user32, 'SetThreadDpiAwarenessContext', None)
+        self.previous = setter(DPI_AWARENESS_PER_MONITOR) if setter else None
+
+    def __exit__(self, *exc):
+        if self.previous:
+            user32.SetThreadDpiAwarenessContext(self.previous)
+
+
+def _rect(r):
+    return r.left, r.top, r.right, r.bottom
+
+
+def _win32_monitors():
+    """各显示器的(左, 上, 右, 下)，主显示器在前"""
+    monitors = []
+
+    def callback(handle, hdc, rect, data):
+        info = _MonitorInfo()
+        info.cbSize = ctypes.sizeof(_MonitorInfo)
+        user32.GetMonitorInfoW(handle, ctypes.byref(info))
+        monitors.append((not info.dwFlags & MONITORINFOF_PRIMARY, _rect(info.rcMonitor)))
+        return True
+
+    proc = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC,
+                              ctypes.POINTER(wintypes.RECT), wintypes.LPARAM)(callback)
+    with _DpiAware():
+        user32.EnumDisplayMonitors(None, None, proc, 0)
+    return [bbox for _, bbox in sorted(monitors, key=lambda m: m[0])]
+
+
+def _win32_find_window(keyword):
+    """查找标题包含keyword的第一个可见顶层窗口，返回窗口句柄或None"""
+    found = []
+
+    def callback(hwnd, data):
+        if user32.IsWindowVisible(hwnd):
+            length = user32.GetWindowTextLengthW(hwnd)
+            if length:
+                title = ctypes.create_unicode_buffer(length + 1)
+                user32.GetWindowTextW(hwnd, title, length + 1)
+                if keyword in title.value:
+                    found.append(hwnd)
+                    return False  # 停止枚举
+        return True
+
+    proc = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)(callback)
+    user32.EnumWindows(proc, 0)
+    return found[0] if found else None
+
+
+def _win32_window_bbox(hwnd):
+    """窗口在屏幕上的(左, 上, 右, 下)；窗口已关闭或最小化时返回None"""
+    if not user32.IsWindow(hwnd) or user32.IsIconic(hwnd):
+        return None
+    rect = wintypes.RECT()
+    with _DpiAware():
+        if dwmapi.DwmGetWindowAttribute(hwnd, DWMWA_EXTENDED_FRAME_BOUNDS, ctypes.byref(rect),
+                                        ctypes.sizeof(rect)) != 0:
+            user32.GetWindowRect(hwnd, ctypes.byref(rect))
+    return _rect(rect)
+
+
+# ============================== 采集区域 ==============================
+def list_monitors():
+    """各显示器的(左, 上, 右, 下)，主显示器在前；无法枚举时返回空列表"""
+    if user32 is not None:
+        return _win32_monitors()
+    if MSS_AVAILABLE:
+        with mss.mss() as sct:
+            return [(m['left'], m['top'], m['left'] + m['width'], m['top'] + m['height'])
+                    for m in sct.monitors[1:]]
+    return []
+
+
+class CaptureRegion:
+    """屏幕采集区域
+    参数spec：
+        None: 整个屏幕（与原先的grab()一致）
+        ('rect', (左, 上, 宽, 高)): 固定矩形（虚拟屏幕坐标）
+        ('monitor', 序号): 单个显示器（0为主显示器）
+        ('window', '标题关键字'): 跟踪窗口（窗口移动、缩放后自动跟随，最小化或关闭时暂停采集该区域）
+    """
+
+    def __init__(self, spec=None):
+        self.kind, self.arg = spec if spec is not None else ('screen', None)
+        self.hwnd = None  # 跟踪窗口的句柄（缓存，失效后重新查找）
+        if self.kind == 'monitor':
+            monitors = list_monitors()
+            if self.arg >= len(monitors):
+                print(f"显示器{self.arg}不存在，改为采集整个屏幕")
+                self.kind = 'screen'
+            else:
+                self.fixed = monitors[self.arg]
+        elif self.kind == 'rect':
+            left, top, width, height = self.arg
+            self.fixed = (left, top, left + width, top + height)
+        elif self.kind == 'window' and user32 is None:
+            print("当前平台不支持窗口跟踪，改为采集整个屏幕")
+            self.kind = 'screen'
+
+    def bbox(self):
+        """当前区域的(左, 上, 右, 下)；整个屏幕返回None；跟踪的窗口不可见时返回False"""
+        if self.kind == 'screen':
+            return None
+        if self.kind != 'window':
+            return self.fixed
+        if self.hwnd is not None:
+            bbox = _win32_window_bbox(self.hwnd)
+            if bbox is not None:
+                return bbox
+            if user32.IsWindow(self.hwnd):
+                return False  # 最小化
+        self.hwnd = _win32_find_window(self.arg)
+        return False if self.hwnd is None else (_win32_window_bbox(self.hwnd) or False)
+
+    def grab(self):
+        """截取区域画面，返回RGB模式的PIL图像；区域当前不可见时返回None"""
+        bbox = self.bbox()
+        if bbox is None:
+            return grab().convert('RGB')
+        if bbox is False or bbox[2] - bbox[0] < 2 or bbox[3] - bbox[1] < 2:
+            return None
+        if MSS_AVAILABLE:
+            sct = getattr(_local, 'sct', None)
+            if sct is None:
+                sct = _local.sct = mss.mss()
+            left, top, right, bottom = bbox
+            shot = sct.grab({'left': left, 'top': top, 'width': right - left, 'height': bottom - top})
+            return Image.frombuffer('RGB', shot.size, shot.bgra, 'raw', 'BGRX')
+        return grab(bbox=bbox, all_screens=True).convert('RGB')
@@ -0,0 +1,79 @@
+# @time     : 2026/10/17 下午10:02
+"""
+接收质量报告模块（发送端）
+主要功能：
+1. 接收端表：按接收端地址保存最近一次报告（有界，超时未报告的接收端自动移除）
+2. 统计接口：snapshot()返回可JSON序列化的字典列表，percentile()计算某指标的最差N%分位数
+3. 码率调整：按丢包率的最差分位数（照顾最差的一批接收端而不是平均值）下调或逐步恢复码率上限
+报告格式与发送见retransmit.py（KIND_REPORT），接收端每REPORT_INTERVAL秒单播一次
+"""
+
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+# ============================== 报告参数 ==============================
+REPORT_INTERVAL = 1.0  # 接收端报告周期（秒）
+REPORT_TIMEOUT = 5.0  # 超过该时间未报告的接收端视为离线
+MAX_RECEIVERS = 256  # 表中最多保存的接收端数（超出时淘汰最久未报告的）
+WORST_PERCENTILE = 90  # 码率调整依据的分位数（90表示只有10%的接收端比它更差）
+LOSS_HIGH = 0.05  # 分位丢包率高于该值时下调码率
+LOSS_LOW = 0.01  # 分位丢包率低于该值时逐步恢复码率
+RATE_DECREASE = 0.8  # 每次下调到当前上限的比例
+RATE_INCREASE = 1.1  # 每次恢复到当前上限的比例
+MIN_BITRATE = 2_000_000  # 自动下调的码率下限（bps）
+
+ReceiverReport = namedtuple('ReceiverReport', 'stream_id received decoded dropped recovered loss jitter decode_ms '
+                                               'render_fps')
+
+
+class ReceiverTable:
+    """接收端统计表（反馈线程写入，界面线程读取）"""
+
+    def __init__(self, max_receivers=MAX_RECEIVERS, timeout=REPORT_TIMEOUT):
+        self.max_receivers = max_receivers
+        self.timeout = timeout
+        self.rows = OrderedDict()  # 接收端IP -> (报告时间, ReceiverReport)，按报告时间排序
+        self.lock = Lock()
+
+    def update(self, receiver, body, now):
+        """登记一份报告（body为REPORT_BODY解包结果）"""
+        with self.lock:
+            self.rows[receiver] = (now, ReceiverReport._make(body))
+            self.rows.move_to_end(receiver)
+            while len(self.rows) > self.max_receivers:
+                self.rows.popitem(last=False)
+
+    def active(self, now):
+        """清理超时的接收端，返回在线接收端的(IP, 报告)列表"""
+        with self.lock:
+            while self.rows and now - next(iter(self.rows.values()))[0] > self.timeout:
+                self.rows.popitem(last=False)
+            return [(ip, report) for ip, (_, report) in self.rows.items()]
+
+    def snapshot(self, now):
+        """在线接收端统计（字典列表，按丢包率从高到低排序）"""
+        rows = [dict(report._asdict(), receiver=ip) for ip, report in self.active(now)]
+        return sorted(rows, key=lambda row: row['loss'], reverse=True)
+
+    def percentile(self, field, now, pct=WORST_PERCENTILE):
+        """某指标在在线接收端中的pct分位数（值越大越差，如丢包率、抖动），无接收端时返回None"""
+        values = sorted(getattr(report, field) for _, report in self.active(now))
+        if not values:
+            return None
+        return values[-(-len(values) * pct // 100) - 1]  # 最近秩法
+
+    def adjust_bitrate(self, current, max_bitrate, now):
+        """按最差分位丢包率调整码率上限
+        参数：
+            current: 当前码率上限（bps）
+            max_bitrate: 配置的码率上限（恢复不会超过它），0表示不限速（不调整）
+        返回：新的码率上限
+        """
+        loss = self.percentile('loss', now)
+        if loss is None or not max_bitrate:
+            return current
+        if loss > LOSS_HIGH:
+            return max(MIN_BITRATE, int(current * RATE_DECREASE))
+        if loss < LOSS_LOW:
+            return min(max_bitrate, int(current * RATE_INCREASE))
+        return current
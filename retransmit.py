@@ -0,0 +1,192 @@
+# @time     : 2026/10/17 下午2:41
+"""
+选择性重传模块（NACK，发送端与接收端共用）
+主要功能：
+1. 反馈包编解码：接收端单播NACK给发送端，列出某帧缺失的分块序号；
+   以及关键帧请求（中途加入或解码失步时请求发送端尽快插入关键帧）、周期性接收质量报告
+2. 接收端：帧数据静默一段时间仍未收齐时生成NACK，有限次数重试
+3. 发送端：有界重传缓存，只在延迟截止时间内重发被请求的分块
+4. 发送端：多接收端NACK聚合去重，按接收端和全局双重限速，防止单个客户端放大发送负载
+"""
+
+from collections import OrderedDict
+from struct import Struct, error as StructError
+from threading import Lock
+from protocol import PROTOCOL_MAGIC, PROTOCOL_VERSION, FLAG_PARITY, parse_header
+from pacing import TokenBucket
+
+# ============================== 协议常量 ==============================
+FEEDBACK_PORT = 22224  # 反馈端口（接收端 -> 发送端，单播）
+
+FEEDBACK_HEADER = Struct('!2sBB')  # 魔数、版本、反馈类型
+KIND_NACK = 1  # 反馈类型：丢失分块重传请求
+NACK_BODY = Struct('!HIH')  # 流ID、帧号、分块序号个数（之后为序号列表，每个2字节）
+MAX_NACK_INDICES = 256  # 单个NACK最多携带的分块序号数
+KIND_KEYFRAME = 2  # 反馈类型：关键帧请求
+KEYFRAME_BODY = Struct('!H')  # 流ID
+KEYFRAME_REQUEST_INTERVAL = 0.5  # 关键帧请求最小间隔（秒），接收端发送与发送端受理均按此限速
+KIND_REPORT = 3  # 反馈类型：接收质量报告（见report.py）
+# 流ID、累计收齐帧数、累计解码帧数、累计丢弃帧数、累计纠错恢复分块数、丢包率(0-1)、帧到达抖动(ms)、解码耗时(ms)、显示帧率
+REPORT_BODY = Struct('!HIIIIffff')
+
+# ============================== 接收端参数 ==============================
+NACK_DELAY = 0.01  # 帧数据静默多久（秒）仍未收齐即判定丢包（同帧分块是连续突发发送的）
+NACK_RETRY_INTERVAL = 0.03  # 重发NACK的间隔（秒）
+NACK_MAX_RETRIES = 3  # 每帧最多发送NACK次数
+
+# ============================== 发送端参数 ==============================
+RETRANSMIT_CACHE_FRAMES = 8  # 重传缓存保留的最近帧数
+RETRANSMIT_DEADLINE = 0.2  # 延迟截止时间（秒），超过后的帧不再重传
+NACK_AGGREGATE_INTERVAL = 0.005  # NACK聚合窗口（秒），窗口内相同请求合并为一次重传
+NACK_RATE_PER_RECEIVER = 50  # 单个接收端每秒最多受理的NACK数
+RETRANSMIT_MAX_PPS = 400  # 全局每秒最多重传的分块数
+
+
+# ============================== 反馈包编解码 ==============================
+def pack_nack(stream_id, frame_no, indices):
+    """打包NACK反馈包"""
+    indices = indices[:MAX_NACK_INDICES]
+    return (FEEDBACK_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, KIND_NACK)
+            + NACK_BODY.pack(stream_id, frame_no, len(indices))
+            + Struct(f'!{len(indices)}H').pack(*indices))
+
+
+def pack_keyframe_request(stream_id):
+    """打包关键帧请求反馈包"""
+    return FEEDBACK_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, KIND_KEYFRAME) + KEYFRAME_BODY.pack(stream_id)
+
+
+def pack_report(stream_id, received, decoded, dropped, recovered, loss, jitter, decode_ms, render_fps):
+    """打包接收质量报告反馈包"""
+    return (FEEDBACK_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, KIND_REPORT)
+            + REPORT_BODY.pack(stream_id, received % (1 << 32), decoded % (1 << 32), dropped % (1 << 32),
+                               recovered % (1 << 32), loss, jitter, decode_ms, render_fps))
+
+
+def parse_feedback(packet):
+    """解析反馈包
+    返回：(反馈类型, 内容)；数据残缺或类型未知时返回None
+        KIND_NACK: 内容为(流ID, 帧号, 分块序号列表)
+        KIND_KEYFRAME: 内容为(流ID,)
+        KIND_REPORT: 内容为REPORT_BODY各字段
+    """
+    try:
+        magic, version, kind = FEEDBACK_HEADER.unpack_from(packet, 0)
+        if magic != PROTOCOL_MAGIC or version != PROTOCOL_VERSION:
+            return None
+        offset = FEEDBACK_HEADER.size
+        if kind == KIND_NACK:
+            stream_id, frame_no, count = NACK_BODY.unpack_from(packet, offset)
+            indices = Struct(f'!{count}H').unpack_from(packet, offset + NACK_BODY.size)
+            return kind, (stream_id, frame_no, list(indices))
+        if kind == KIND_KEYFRAME:
+            return kind, KEYFRAME_BODY.unpack_from(packet, offset)
+        if kind == KIND_REPORT:
+            return kind, REPORT_BODY.unpack_from(packet, offset)
+    except StructError:
+        pass
+    return None
+
+
+# ============================== 接收端丢包检测 ==============================
+def due_nacks(reassembler, now):
+    """找出需要发送NACK的未完成帧
+    判定条件：帧数据已静默NACK_DELAY（或距上次NACK已过NACK_RETRY_INTERVAL），且未超过重试次数
+    返回：(帧号, 缺失分块序号列表) 生成器
+    """
+    for frame in reassembler.pending.values():
+        if frame.complete or frame.nacks_sent >= NACK_MAX_RETRIES:
+            continue
+        if frame.nacks_sent == 0:
+            due = frame.last_packet + NACK_DELAY
+        else:
+            due = max(frame.last_packet, frame.last_nack) + NACK_RETRY_INTERVAL
+        if now < due:
+            continue
+        frame.nacks_sent += 1
+        frame.last_nack = now
+        yield frame.frame_no, [i for i, chunk in enumerate(frame.chunks) if chunk is None]
+
+
+# ============================== 发送端重传缓存 ==============================
+class RetransmitCache:
+    """重传缓存（发送线程写入，反馈线程读取）
+    只保留最近max_frames帧的数据分块（(包头, 负载)二元组，原样重发），超过截止时间的帧不再提供
+    """
+
+    def __init__(self, max_frames=RETRANSMIT_CACHE_FRAMES, deadline=RETRANSMIT_DEADLINE):
+        self.max_frames = max_frames
+        self.deadline = deadline
+        self.frames = OrderedDict()  # (流ID, 帧号) -> (发送时间, 数据分块列表)
+        self.lock = Lock()
+
+    def store(self, stream_id, frame_no, packets, now):
+        """缓存一帧已发送的数据报（校验包不缓存）"""
+        data = [p for p in packets if not parse_header(p[0]).flags & FLAG_PARITY]
+        with self.lock:
+            self.frames[(stream_id, frame_no)] = (now, data)
+            while len(self.frames) > self.max_frames:
+                self.frames.popitem(last=False)
+
+    def lookup(self, stream_id, frame_no, indices, now):
+        """取出被请求的分块；帧已淘汰或超过截止时间时返回空列表"""
+        with self.lock:
+            entry = self.frames.get((stream_id, frame_no))
+        if entry is None or now - entry[0] > self.deadline:
+            return []
+        sent, data = entry
+        return [data[i] for i in indices if i < len(data)]
+
+
+class NackAggregator:
+    """NACK聚合器（发送端反馈线程使用）
+    实现特点：
+    - 聚合窗口内来自所有接收端的请求按帧合并去重（广播一次即可惠及所有接收端）
+    - 每个接收端独立令牌桶，超速的NACK直接丢弃
+    - 全局令牌桶限制每秒重传分块数
+    """
+
+    def __init__(self, receiver_rate=NACK_RATE_PER_RECEIVER, max_pps=RETRANSMIT_MAX_PPS,
+                 interval=NACK_AGGREGATE_INTERVAL):
+        self.receiver_rate = receiver_rate
+        self.interval = interval
+        self.requests = {}  # (流ID, 帧号) -> 待重传分块序号集合
+        self.buckets = {}  # 接收端IP -> TokenBucket
+        self.budget = TokenBucket(max_pps, max_pps)
+        self.last_flush = 0.0
+        # 统计计数
+        self.nacks_received = 0
+        self.nacks_limited = 0  # 因接收端超速被丢弃的NACK
+        self.chunks_retransmitted = 0
+        self.chunks_skipped = 0  # 超过截止时间、已淘汰或超出全局预算而未重传的分块
+
+    def add(self, receiver, stream_id, frame_no, indices, now):
+        """登记一个NACK请求"""
+        self.nacks_received += 1
+        bucket = self.buckets.get(receiver)
+        if bucket is None:
+            if len(self.buckets) > 1024:
+                self.buckets.clear()  # 防止伪造源地址撑爆表
+            bucket = self.buckets[receiver] = TokenBucket(self.receiver_rate, self.receiver_rate, now)
+        if not bucket.consume(now):
+            self.nacks_limited += 1
+            return
+        self.requests.setdefault((stream_id, frame_no), set()).update(indices)
+
+    def flush(self, cache, now):
+        """聚合窗口结束时取出需要重传的数据报
+        返回：数据报列表（窗口未结束时为空）
+        """
+        if now - self.last_flush < self.interval or not self.requests:
+            return []
+        self.last_flush = now
+        packets = []
+        for (stream_id, frame_no), indices in self.requests.items():
+            wanted = sorted(indices)
+            found = cache.lookup(stream_id, frame_no, wanted, now)
+            allowed = [p for p in found if self.budget.consume(now)]
+            packets.extend(allowed)
+            self.chunks_skipped += len(wanted) - len(allowed)
+        self.chunks_retransmitted += len(packets)
+        self.requests.clear()
+        return packets
@@ -0,0 +1,75 @@
+# @time     : 2026/10/18 上午2:45
+"""
+音频环形缓冲区模块（发送端与接收端共用）
+主要功能：
+1. 预分配的定长样本环（NumPy数组），运行中不再分配内存
+2. 单生产者/单消费者无锁：写位置只由生产者修改、读位置只由消费者修改（均为累计样本数，不回绕），
+   先拷贝数据再推进位置，另一方读到新位置时数据已就绪
+3. 溢出/欠载计数：写入空间不足时丢弃多出的样本并计一次溢出，读取样本不足时计一次欠载
+用于把PyAudio回调线程（声卡节奏）与采集发送/网络播放线程解耦：回调中只做一次数组拷贝，不阻塞、不等锁
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+    """单生产者/单消费者无锁环形缓冲区"""
+
+    def __init__(self, capacity, dtype=np.int16):
+        """
+        参数：
+            capacity: 容量（样本数；多声道为交错样本总数）
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.write_pos = 0  # 累计写入样本数（仅生产者修改）
+        self.read_pos = 0  # 累计读出样本数（仅消费者修改）
+        # 统计（各自只由一方修改）
+        self.overruns = 0  # 写入时空间不足的次数（生产者计数）
+        self.underruns = 0  # 读取时样本不足的次数（消费者计数）
+
+    @property
+    def available(self):
+        """可读样本数"""
+        return self.write_pos - self.read_pos
+
+    @property
+    def free(self):
+        """可写样本数"""
+        return self.capacity - self.available
+
+    def write(self, samples):
+        """写入样本（生产者调用），空间不足时丢弃多出的部分
+        返回：实际写入的样本数
+        """
+        count = min(len(samples), self.free)
+        if count < len(samples):
+            self.overruns += 1
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:count - first] = samples[first:count]  # 环尾放不下的部分从头写起
+        self.write_pos += count  # 数据就绪后再推进写位置
+        return count
+
+    def read_into(self, out):
+        """读出样本填满out（消费者调用），样本不足时只填前面一部分并计一次欠载
+        返回：实际读出的样本数
+        """
+        count = min(len(out), self.available)
+        if count < len(out):
+            self.underruns += 1
+        start = self.read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:count] = self.buffer[:count - first]
+        self.read_pos += count  # 数据取走后再推进读位置
+        return count
+
+    def read(self, count):
+        """读出count个样本（消费者调用），不足时不读取、返回None（不计欠载，调用方稍后再读）"""
+        if self.available < count:
+            return None
+        out = np.empty(count, dtype=self.buffer.dtype)
+        self.read_into(out)
+        return out
@@ -0,0 +1,97 @@
+# @time     : 2026/10/17 下午10:40
+"""
+多分辨率同播模块（发送端与接收端共用）
+主要功能：
+1. 发送端：同一帧按若干缩放比例编码成多个分辨率层（如完整、1/2、缩略图），各层使用不同的流ID，
+   每层有独立的差分参考帧、帧间编码器与帧号
+2. 接收端：记录广播中出现过的各层分辨率，订阅能覆盖窗口尺寸的最小一层，窗口缩放或层变化时切换
+接收端只重组与解码订阅的一层，其他层的数据报解析包头后即丢弃
+多个采集区域（见region.py）各自编码为一组层：流ID高8位为区域序号，低8位为层序号
+"""
+
+from time import monotonic
+from video_codec import TileDeltaEncoder
+
+# ============================== 同播参数 ==============================
+LAYER_TIMEOUT = 3.0  # 某层超过该时间没有数据报时视为已停发（发送端改配置或重启）
+MIN_LAYER_SIZE = 16  # 缩放后宽高的下限（像素）
+LAYER_BITS = 8  # 流ID中层序号占用的低位数
+
+
+def make_stream_id(region, layer):
+    """由区域序号与层序号组成流ID"""
+    return region << LAYER_BITS | layer
+
+
+def region_of(stream_id):
+    """流ID所属的采集区域序号"""
+    return stream_id >> LAYER_BITS
+
+
+def layer_of(stream_id):
+    """流ID中的层序号"""
+    return stream_id & ((1 << LAYER_BITS) - 1)
+
+
+def layer_size(width, height, scale):
+    """按比例缩放后的分辨率（宽高取偶数，兼容yuv420p）"""
+    if scale >= 1:
+        return width, height
+    w = max(MIN_LAYER_SIZE, int(width * scale)) & ~1
+    h = max(MIN_LAYER_SIZE, int(height * scale)) & ~1
+    return w, h
+
+
+# ============================== 发送端 ==============================
+class SimulcastLayer:
+    """发送端的一个分辨率层（编码状态按层独立保存）"""
+
+    def __init__(self, stream_id, scale):
+        self.stream_id = stream_id  # 流ID（区域序号与层序号，层0为最高分辨率）
+        self.scale = scale  # 相对采集分辨率的缩放比例
+        self.tile_encoder = TileDeltaEncoder()  # 本层的脏块差分编码器
+        self.stream_encoder = None  # 本层的帧间编码器（分辨率变化时重建）
+        self.reference = None  # 预置字典差分的参考关键帧(帧号, 画面)，仅无损编码的关键帧可作参考
+        self.frame_no = 0  # 本层帧号
+        self.size = (0, 0)  # 最近一帧的分辨率（心跳包携带）
+        self.key_pending = False  # 渐进帧的细化层被跳过（接收端画面不完整、帧号不连续），下一帧须为完整帧
+
+    def next_frame_no(self):
+        self.frame_no += 1
+        return self.frame_no - 1
+
+
+def make_layers(scales, region=0):
+    """按缩放比例列表为一个采集区域创建各层（比例依次递减，第一层通常为1.0）"""
+    return [SimulcastLayer(make_stream_id(region, i), scale) for i, scale in enumerate(scales)]
+
+
+# ============================== 接收端 ==============================
+class LayerDirectory:
+    """接收端的层目录（网络线程写入，界面线程只读）"""
+
+    def __init__(self, timeout=LAYER_TIMEOUT):
+        self.timeout = timeout
+        self.layers = {}  # 流ID -> (宽, 高, 最近一次收到数据报的时间)
+
+    def update(self, stream_id, width, height, now):
+        """登记一个数据报的层信息，返回True表示出现了新的层（或停发后恢复的层）"""
+        old = self.layers.get(stream_id)
+        new = old is None or now - old[2] > self.timeout
+        self.layers[stream_id] = (width, height, now)
+        return new
+
+    def active(self, now=None):
+        """仍在发送的层，返回{流ID: (宽, 高)}"""
+        now = monotonic() if now is None else now
+        return {sid: (w, h) for sid, (w, h, seen) in list(self.layers.items()) if now - seen <= self.timeout}
+
+    def choose(self, width, height, now=None):
+        """选择能覆盖width x height的最小层；没有层能覆盖时选最大的一层；没有任何层时返回None"""
+        layers = self.active(now)
+        if not layers:
+            return None
+        covering = [sid for sid, (w, h) in layers.items() if w >= width and h >= height]
+        if covering:
+            return min(covering, key=lambda sid: layers[sid][0] * layers[sid][1])
+        return max(layers, key=lambda sid: layers[sid][0] * layers[sid][1])
@@ -0,0 +1,133 @@
+# @time     : 2026/10/17 下午11:58
+"""
+切片容错模块（发送端与接收端共用）
+主要功能：
+1. 发送端：完整帧按固定行数切成若干切片，每个切片独立编码，并按分块大小对齐
+   （切片从新的分块开始，每个分块自带切片位置，丢失任意分块只影响它所在的切片）
+2. 接收端：未收齐的帧也能解码，只解码分块齐全的切片，丢失切片的位置沿用上一帧同位置的像素（错误隐藏）
+渐进帧（见progressive.py）的各层同样按切片编码，切片的打包与收齐判断在此共用
+切片帧在包头中置FLAG_SLICED标志，负载按分块大小划分，每个分块的格式：
+    切片起始行(2字节) + 切片行数(2字节) + 分块在切片中的序号(1字节) + 切片分块数(1字节)
+    + 有效数据长度(2字节) + 切片编码数据的一段（不足分块大小时补零，帧的最后一个分块不补）
+"""
+
+from struct import Struct
+import numpy as np
+from video_codec import DEFAULT_LEVEL
+
+# ============================== 切片参数 ==============================
+SLICE_ROWS = 32  # 每个切片的行数（16的倍数，与JPEG宏块对齐；越小丢包影响范围越小，补零开销越大）
+MAX_SLICE_CHUNKS = 255  # 单个切片最多占用的分块数（分块序号为1字节）
+
+SLICE_PREFIX = Struct('!HHBBH')  # 切片起始行、行数、分块序号、切片分块数、有效数据长度
+
+
+# ============================== 发送端编码 ==============================
+def _encode_slice(codec, rows, quality, level):
+    """编码单个切片（在工作池中执行）"""
+    return codec.encode(rows, quality, level)
+
+
+def encode_segments(pool, codec, segments, quality, level=DEFAULT_LEVEL):
+    """编码若干图像段（有工作池时全部提交后并行编码），返回各段编码数据列表"""
+    if pool is not None:
+        futures = [pool.submit(_encode_slice, codec, rows, quality, level) for rows in segments]
+        return [f.result() for f in futures]
+    return [codec.encode(rows, quality, level) for rows in segments]
+
+
+def pack_slices(slices, chunk_size):
+    """把编码后的切片按分块对齐打包
+    参数：
+        slices: [(切片起始行, 行数, 编码数据), ...]
+        chunk_size: 分包时每个数据报的负载大小（必须与packetize的chunk_size一致）
+    返回：负载片段列表（每个切片都补齐到分块大小，最后一个分块是否补齐由调用方决定）；
+          某个切片超过MAX_SLICE_CHUNKS个分块时返回None
+    """
+    body = chunk_size - SLICE_PREFIX.size  # 每个分块可容纳的切片数据
+    parts = []
+    for y, rows, data in slices:
+        count = max(1, -(-len(data) // body))
+        if count > MAX_SLICE_CHUNKS:
+            return None
+        view = memoryview(data)
+        for index in range(count):
+            chunk = view[index * body:(index + 1) * body]
+            parts.append(SLICE_PREFIX.pack(y, rows, index, count, len(chunk)))
+            parts.append(chunk)
+            parts.append(bytes(body - len(chunk)))  # 补齐到分块大小，下一个切片从新的分块开始
+    return parts
+
+
+def encode_slices(pool, codec, frame, quality, level=DEFAULT_LEVEL, chunk_size=1400, rows=SLICE_ROWS):
+    """按切片编码一帧
+    参数：
+        pool: parallel.make_pool创建的工作池（None表示在当前线程依次编码）
+        codec: 帧内编码器（video_codec.get_codec的返回值）
+        frame: 图像数组（H x W x 3，uint8）
+        chunk_size: 分包时每个数据报的负载大小（必须与packetize的chunk_size一致）
+        rows: 每个切片的行数
+    返回：切片帧负载；某个切片超过MAX_SLICE_CHUNKS个分块时返回None（由调用方按普通完整帧编码）
+    """
+    height = frame.shape[0]
+    starts = range(0, height, rows)
+    segments = encode_segments(pool, codec, [frame[y:y + rows] for y in starts], quality, level)
+    parts = pack_slices([(y, min(rows, height - y), data) for y, data in zip(starts, segments)], chunk_size)
+    if parts is None:
+        return None
+    parts.pop()  # 帧的最后一个分块不需要补齐
+    return b''.join(parts)
+
+
+# ============================== 接收端解码 ==============================
+def decode_slices(pool, codec, chunks, width, height, previous=None):
+    """解码切片帧（可以未收齐）
+    参数：
+        pool: 线程池（各切片解码结果直接写入共享数组，只能使用线程池）
+        codec: 帧内编码器
+        chunks: 已收到的(分块序号, 负载)列表（PendingFrame.received_chunks的返回值）
+        width/height: 帧分辨率
+        previous: 上一帧画面（H x W x 3），丢失切片的位置从中复制；分辨率不同或为None时填黑
+    返回：(可写RGB数组, 被隐藏的行数)
+    """
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    covered = np.zeros(height, dtype=bool)
+
+    def decode_one(y, rows, data):
+        pixels[y:y + rows] = codec.decode(data, width, rows)
+        covered[y:y + rows] = True
+
+    futures = [pool.submit(decode_one, y, rows, data)
+               for y, rows, data in complete_slices(chunks) if y + rows <= height]
+    for f in futures:
+        try:
+            f.result()
+        except Exception:
+            pass  # 切片数据损坏：与丢失的切片一样隐藏
+
+    missing = ~covered
+    concealed = int(np.count_nonzero(missing))
+    if concealed:
+        if previous is not None and previous.shape == pixels.shape:
+            pixels[missing] = previous[missing]  # 沿用上一帧同位置的像素
+        else:
+            pixels[missing] = 0
+    return pixels, concealed
+
+
+def complete_slices(chunks):
+    """从已收到的分块中取出分块齐全的切片
+    参数：
+        chunks: 已收到的(分块序号, 负载)列表
+    返回：[(切片起始行, 行数, 编码数据), ...]
+    """
+    slices = {}  # 切片起始行 -> (行数, 分块数, {分块序号: 切片数据段})
+    for _, chunk in chunks:
+        y, rows, index, count, size = SLICE_PREFIX.unpack_from(chunk, 0)
+        slices.setdefault(y, (rows, count, {}))[2][index] = chunk[SLICE_PREFIX.size:SLICE_PREFIX.size + size]
+    complete = []
+    for y, (rows, count, segments) in slices.items():
+        if len(segments) == count and max(segments) < count:
+            data = segments[0] if count == 1 else b''.join(segments[i] for i in range(count))
+            complete.append((y, rows, data))
+    return complete
@@ -0,0 +1,299 @@
+# @time     : 2026/10/17 上午10:12
+"""
+视频编解码模块（发送端与接收端共用）
+主要功能：
+1. 脏块（tile）差分编码：把帧切成固定大小的图块，只传输与上一帧不同的图块
+2. 接收端持久帧缓冲区：把收到的图块按坐标修补进上一帧画面
+   预置字典模式：每个脏块以参考关键帧中同位置的旧内容为zlib预置字典（zdict）单独压缩，
+   画面局部变化（打字、光标）时只需编码与旧内容不同的部分
+3. 可插拔帧内编解码器：zlib无损原始RGB、zlib原始YUV 4:2:0、JPEG/WebP有损、PNG无损，编码器ID随数据包传输
+"""
+
+from io import BytesIO
+from struct import Struct
+from zlib import compress, decompress, compressobj, decompressobj
+import numpy as np
+from PIL import Image
+
+# ============================== 编码参数 ==============================
+TILE_SIZE = 64  # 图块边长（像素），64兼顾变化检测粒度与坐标元数据开销
+KEYFRAME_INTERVAL = 50  # 每隔多少帧强制发送一次完整帧（25FPS下约2秒，保证中途加入的接收端能出图）
+DIRTY_RATIO_LIMIT = 0.5  # 脏块占比超过该值时直接发送完整帧（差分已无收益）
+
+TILE_HEADER = Struct('!HHHI')  # 帧宽、帧高、图块边长、脏块数量
+TILE_INDEX = Struct('!HH')  # 图块列号、行号
+ZDICT_HEADER = Struct('!I')  # 预置字典差分帧：参考关键帧的帧号
+ZDICT_TILE = Struct('!HHI')  # 预置字典差分帧：图块列号、行号、压缩数据长度
+
+# 编码器ID（写入包头codec字段，接收端据此选择解码器）
+CODEC_ZLIB = 0  # 原始RGB + zlib（无损，v1.6默认方式）
+CODEC_JPEG = 1  # JPEG（有损，适合摄像头画面）
+CODEC_WEBP = 2  # WebP（有损，同画质下体积小于JPEG，编码稍慢）
+CODEC_PNG = 3  # PNG（无损，适合文字为主的屏幕内容）
+CODEC_H264 = 4  # H.264帧间编码（有状态，见av_codec.py）
+CODEC_VP8 = 5  # VP8帧间编码（有状态，见av_codec.py）
+CODEC_YUV420 = 6  # 原始YUV 4:2:0平面 + zlib（每像素1.5字节，仅色度下采样有损）
+DEFAULT_QUALITY = 75  # 有损编码默认画质（1-100）
+DEFAULT_LEVEL = 6  # zlib默认压缩级别（1-9，越高越慢、数据量越小）
+
+
+# ============================== 帧内编解码器 ==============================
+class ZlibCodec:
+    """原始RGB字节 + zlib压缩（无损，画质参数无效）"""
+    codec_id = CODEC_ZLIB
+
+    def encode(self, frame, quality=DEFAULT_QUALITY, level=DEFAULT_LEVEL):
+        """编码RGB数组（H x W x 3，uint8），返回压缩字节"""
+        return compress(frame.tobytes(), level)
+
+    def decode(self, data, width, height):
+        """解码为可写RGB数组（H x W x 3，uint8）"""
+        pixels = np.frombuffer(decompress(data), dtype=np.uint8)
+        if pixels.size != width * height * 3:
+            raise ValueError('数据长度与分辨率不符')
+        return pixels.reshape(height, width, 3).copy()
+
+
+class Yuv420Codec:
+    """原始YUV 4:2:0平面 + zlib（JFIF全范围BT.601系数，NumPy整数向量化转换）
+    亮度全分辨率，色度按2x2块平均下采样，数据量为原始RGB的一半；压缩前按Y、U、V平面依次排列
+    参数：
+        bgr: 输入为OpenCV的BGR数组（摄像头帧可省去BGR转RGB的整帧转换），解码输出始终为RGB
+    """
+    codec_id = CODEC_YUV420
+
+    def __init__(self, bgr=False):
+        self.bgr = bgr
+
+    def encode(self, frame, quality=DEFAULT_QUALITY, level=DEFAULT_LEVEL):
+        """编码RGB（或BGR）数组（H x W x 3，uint8），返回压缩字节（宽高可为奇数）"""
+        h, w = frame.shape[:2]
+        order = (2, 1, 0) if self.bgr else (0, 1, 2)
+        r, g, b = (frame[..., i].astype(np.uint16) for i in order)
+        y = (r * 77 + g * 150 + b * 29 + 128) >> 8  # 亮度：系数和为256，uint16不会溢出
+        # 色度：先在2x2块内求和（奇数边复制边缘），再在1/4分辨率上计算
+        if h % 2 or w % 2:
+            frame = np.pad(frame, ((0, h % 2), (0, w % 2), (0, 0)), mode='edge')
+        blocks = frame[0::2, 0::2].astype(np.int32) + frame[1::2, 0::2] + frame[0::2, 1::2] + frame[1::2, 1::2]
+        r, g, b = (blocks[..., i] for i in order)
+        u = ((-43 * r - 85 * g + 128 * b + 512) >> 10) + 128  # 块内4像素求和，再右移2位取平均
+        v = ((128 * r - 107 * g - 21 * b + 512) >> 10) + 128
+        planes = (y.astype(np.uint8).tobytes(), np.clip(u, 0, 255).astype(np.uint8).tobytes(),
+                  np.clip(v, 0, 255).astype(np.uint8).tobytes())
+        return compress(b''.join(planes), level)
+
+    def decode(self, data, width, height):
+        """解码为可写RGB数组（H x W x 3，uint8）"""
+        cw, ch = -(-width // 2), -(-height // 2)
+        planes = np.frombuffer(decompress(data), dtype=np.uint8)
+        if planes.size != width * height + cw * ch * 2:
+            raise ValueError('数据长度与分辨率不符')
+        y = planes[:width * height].reshape(height, width).astype(np.int16)
+        u = planes[width * height:width * height + cw * ch].reshape(ch, cw).astype(np.int32) - 128
+        v = planes[width * height + cw * ch:].reshape(ch, cw).astype(np.int32) - 128
+        pixels = np.empty((height, width, 3), dtype=np.uint8)
+        # 色度项在1/4分辨率上计算，再按2x2复制到全分辨率与亮度相加
+        for i, term in enumerate(((359 * v + 128) >> 8,
+                                  (-88 * u - 183 * v + 128) >> 8,
+                                  (454 * u + 128) >> 8)):
+            full = term.astype(np.int16).repeat(2, axis=0).repeat(2, axis=1)[:height, :width]
+            np.clip(y + full, 0, 255, out=pixels[..., i], casting='unsafe')
+        return pixels
+
+
+class PillowCodec:
+    """基于Pillow的图像格式编解码器（JPEG/WebP/PNG）"""
+
+    def __init__(self, codec_id, fmt, **options):
+        self.codec_id = codec_id
+        self.fmt = fmt  # Pillow格式名
+        self.options = options  # 额外的保存参数（速度优先）
+
+    def encode(self, frame, quality=DEFAULT_QUALITY, level=DEFAULT_LEVEL):
+        """压缩级别参数无效（PNG使用注册时的compress_level）"""
+        buf = BytesIO()
+        Image.fromarray(frame).save(buf, self.fmt, quality=quality, **self.options)
+        return buf.getvalue()
+
+    def decode(self, data, width, height):
+        img = Image.open(BytesIO(data)).convert('RGB')
+        if img.size != (width, height):
+            raise ValueError('图像尺寸与包头不符')
+        return np.array(img)  # np.array复制为可写数组
+
+
+# 编码器注册表：ID -> 编码器实例
+CODECS = {
+    CODEC_ZLIB: ZlibCodec(),
+    CODEC_JPEG: PillowCodec(CODEC_JPEG, 'JPEG'),
+    CODEC_WEBP: PillowCodec(CODEC_WEBP, 'WEBP', method=0),  # method=0为最快编码档
+    CODEC_PNG: PillowCodec(CODEC_PNG, 'PNG', compress_level=1),
+    CODEC_YUV420: Yuv420Codec(),
+}
+CODEC_NAMES = {'zlib': CODEC_ZLIB, 'jpeg': CODEC_JPEG, 'webp': CODEC_WEBP, 'png': CODEC_PNG,
+               'yuv420': CODEC_YUV420}
+BGR_CODECS = {CODEC_YUV420: Yuv420Codec(bgr=True)}  # 可直接编码BGR输入的编码器（发送端摄像头用）
+LOSSLESS_CODECS = {CODEC_ZLIB, CODEC_PNG}  # 无损编码器（接收端画面与发送端逐字节一致，可作为预置字典的参考帧）
+
+
+def get_codec(codec, bgr=False):
+    """按ID或名称（'zlib'/'jpeg'/'webp'/'png'/'yuv420'）获取编码器
+    bgr为True时返回直接接受BGR输入的版本，编码器不支持时返回None
+    """
+    if isinstance(codec, str):
+        codec = CODEC_NAMES[codec]
+    return BGR_CODECS.get(codec) if bgr else CODECS[codec]
+
+
+# ============================== 脏块差分编码 ==============================
+class TileDeltaEncoder:
+    """脏块差分编码器（发送端）
+    实现逻辑：
+    1. 与上一帧逐像素比较（NumPy向量化），得到变化掩码
+    2. 按图块归约掩码，得到脏块列表
+    3. 关键帧/脏块过多时判定为完整帧（交给帧内编码器），否则输出脏块数据
+    """
+
+    def __init__(self, tile_size=TILE_SIZE, keyframe_interval=KEYFRAME_INTERVAL):
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.prev = None  # 上一帧画面（H x W x 3，uint8）
+        self.frame_count = 0  # 距上一个关键帧的帧数
+
+    def reset(self):
+        """丢弃参考帧，下一帧强制作为关键帧发送（切换视频源时调用）"""
+        self.prev = None
+
+    def dirty_tiles(self, frame):
+        """计算脏块坐标
+        返回：(行号数组, 列号数组)
+        """
+        t = self.tile_size
+        h, w = frame.shape[:2]
+        changed = np.any(frame != self.prev, axis=2)  # 逐像素变化掩码（H x W）
+        rows, cols = -(-h // t), -(-w // t)  # ceil除法，边缘不足一块的也算一块
+        if rows * t != h or cols * t != w:
+            padded = np.zeros((rows * t, cols * t), dtype=bool)
+            padded[:h, :w] = changed
+            changed = padded
+        # 变形为(行, 块高, 列, 块宽)后按块归约
+        dirty = changed.reshape(rows, t, cols, t).any(axis=(1, 3))
+        return np.nonzero(dirty)
+
+    def encode(self, frame):
+        """编码一帧
+        参数：
+            frame: RGB图像数组（H x W x 3，uint8）
+        返回：(is_key, payload)
+            is_key为True时payload为None（由调用方用帧内编码器编码完整帧），
+            否则为脏块数据（未压缩）
+        """
+        is_key = (self.prev is None
+                  or self.prev.shape != frame.shape
+                  or self.frame_count >= self.keyframe_interval)
+
+        if not is_key:
+            ys, xs = self.dirty_tiles(frame)
+            t = self.tile_size
+            h, w = frame.shape[:2]
+            total = -(-h // t) * -(-w // t)
+            is_key = len(ys) > total * DIRTY_RATIO_LIMIT
+
+        self.prev = frame
+        if is_key:
+            self.frame_count = 0
+            return True, None
+
+        self.frame_count += 1
+        parts = [TILE_HEADER.pack(w, h, t, len(ys))]
+        for row, col in zip(ys.tolist(), xs.tolist()):
+            y0, x0 = row * t, col * t
+            parts.append(TILE_INDEX.pack(col, row))
+            parts.append(frame[y0:y0 + t, x0:x0 + t].tobytes())
+        return False, b''.join(parts)
+
+
+def apply_tiles(framebuffer, payload):
+    """把脏块数据修补进持久帧缓冲区（接收端）
+    参数：
+        framebuffer: 上一帧画面数组（H x W x 3，uint8，可写）
+        payload: TileDeltaEncoder输出的脏块数据（已解压）
+    """
+    w, h, t, count = TILE_HEADER.unpack_from(payload, 0)
+    if framebuffer.shape[:2] != (h, w):
+        raise ValueError('帧缓冲区尺寸与差分帧不一致')
+
+    offset = TILE_HEADER.size
+    for _ in range(count):
+        col, row = TILE_INDEX.unpack_from(payload, offset)
+        offset += TILE_INDEX.size
+        y0, x0 = row * t, col * t
+        th, tw = min(t, h - y0), min(t, w - x0)  # 边缘图块可能不足一整块
+        n = th * tw * 3
+        tile = np.frombuffer(payload, dtype=np.uint8, count=n, offset=offset)
+        framebuffer[y0:y0 + th, x0:x0 + tw] = tile.reshape(th, tw, 3)
+        offset += n
+
+
+# ============================== 预置字典差分 ==============================
+def tile_bounds(row, col, t, width, height):
+    """图块的像素范围(y0, x0, 块高, 块宽)（边缘图块可能不足一整块）"""
+    y0, x0 = row * t, col * t
+    return y0, x0, min(t, height - y0), min(t, width - x0)
+
+
+def compress_tiles_zdict(payload, reference, reference_no, level=DEFAULT_LEVEL):
+    """把脏块数据逐块压缩为预置字典差分帧（发送端）
+    参数：
+        payload: TileDeltaEncoder输出的脏块数据（未压缩）
+        reference: 参考关键帧画面（H x W x 3，uint8，须以无损编码发送过）
+        reference_no: 参考关键帧的帧号（接收端据此确认持有同一参考帧）
+    每个图块一个独立的zlib流，字典为参考帧中同位置图块（64x64x3=12KB，在32KB窗口之内），
+    因此每个图块都能匹配到自己的旧内容，而不只是整帧开头的一小段
+    """
+    w, h, t, count = TILE_HEADER.unpack_from(payload, 0)
+    view = memoryview(payload)
+    parts = [ZDICT_HEADER.pack(reference_no % (1 << 32)), view[:TILE_HEADER.size]]
+    offset = TILE_HEADER.size
+    for _ in range(count):
+        col, row = TILE_INDEX.unpack_from(payload, offset)
+        offset += TILE_INDEX.size
+        y0, x0, th, tw = tile_bounds(row, col, t, w, h)
+        n = th * tw * 3
+        c = compressobj(level, zdict=reference[y0:y0 + th, x0:x0 + tw].tobytes())
+        data = c.compress(view[offset:offset + n]) + c.flush()
+        offset += n
+        parts.append(ZDICT_TILE.pack(col, row, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def zdict_reference(payload):
+    """预置字典差分帧引用的参考关键帧帧号"""
+    return ZDICT_HEADER.unpack_from(payload, 0)[0]
+
+
+def apply_zdict_tiles(framebuffer, reference, payload):
+    """解压预置字典差分帧并修补进持久帧缓冲区（接收端）
+    参数：
+        framebuffer: 上一帧画面数组（可写，不能与reference共用内存）
+        reference: 参考关键帧画面（zdict_reference对应的那一帧）
+        payload: compress_tiles_zdict的输出
+    参考帧不一致时zlib按字典校验和报错，抛出异常
+    """
+    w, h, t, count = TILE_HEADER.unpack_from(payload, ZDICT_HEADER.size)
+    if framebuffer.shape[:2] != (h, w) or reference.shape[:2] != (h, w):
+        raise ValueError('帧缓冲区尺寸与差分帧不一致')
+
+    view = memoryview(payload)
+    offset = ZDICT_HEADER.size + TILE_HEADER.size
+    for _ in range(count):
+        col, row, size = ZDICT_TILE.unpack_from(payload, offset)
+        offset += ZDICT_TILE.size
+        y0, x0, th, tw = tile_bounds(row, col, t, w, h)
+        d = decompressobj(zdict=reference[y0:y0 + th, x0:x0 + tw].tobytes())
+        tile = d.decompress(view[offset:offset + size])
+        if not d.eof or len(tile) != th * tw * 3:
+            raise ValueError('图块数据不完整')
+        framebuffer[y0:y0 + th, x0:x0 + tw] = np.frombuffer(tile, dtype=np.uint8).reshape(th, tw, 3)
+        offset += size